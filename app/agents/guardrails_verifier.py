@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import json
+import os
 import re
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from .llm_client import ChatClient, try_llm_json
-from ..schemas import DashboardCard, GuardrailResult, TEAM_LIST
+from .llm_client import ChatClient, try_llm_json, try_llm_json_many
+from ..schemas import DashboardCard, GuardrailResult, GuardrailVerdict, TEAM_LIST
 
 
 FORBIDDEN_PHRASES = [
@@ -17,21 +19,26 @@ FORBIDDEN_PHRASES = [
 ]
 
 EMAIL_PATTERN = re.compile(r"[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}", re.IGNORECASE)
-PHONE_PATTERN = re.compile(r"\b\+?\d[\d\s\-().]{8,}\d\b")
+# Grouped numbers such as "+1 555 123 4567" or "(020) 7946-0958". The groups
+# must be separated, so bare ticket ids ("1234567890"), dates and times do not match.
+PHONE_PATTERN = re.compile(
+    r"(?<![\w.-])(?:\+\d{1,3}[\s.-]?)?(?:\(\d{2,4}\)[\s.-]?|\d{2,4}[\s.-])\d{3,4}[\s.-]?\d{3,4}(?![\w-]|\.\d)"
+)
+
+POLICY_EXCERPT_CHARS = 300
 
 
 def _deterministic_checks(card: DashboardCard) -> List[str]:
     issues: List[str] = []
     prompt = card.reverse_prompt.employee_prompt
 
+    # Only the generated narrative is held to the phrase and PII rules; evidence and
+    # the customer context legitimately repeat the customer's own words, and are left
+    # to the LLM check.
     check_text = " ".join(
         [
-            prompt.summary,
-            prompt.goal,
-            prompt.suggested_reply,
-            " ".join(prompt.questions_to_ask),
-            " ".join(prompt.checks_to_perform),
-            " ".join(prompt.escalate_if),
+            prompt.situation_background,
+            " ".join(prompt.key_considerations),
         ]
     ).lower()
 
@@ -39,20 +46,14 @@ def _deterministic_checks(card: DashboardCard) -> List[str]:
         if phrase in check_text:
             issues.append(f"Forbidden phrase detected: {phrase}")
 
-    pii_text = " ".join(
-        [
-            check_text,
-            " ".join(prompt.do_not_do).lower(),
-        ]
-    )
-    if EMAIL_PATTERN.search(pii_text) or PHONE_PATTERN.search(pii_text):
+    if EMAIL_PATTERN.search(check_text) or PHONE_PATTERN.search(check_text):
         issues.append("Potential PII detected in output.")
 
-    if not card.reverse_prompt.citations.get("evidence_quotes_used"):
+    if not card.reverse_prompt.citations.get("evidence_sources"):
         issues.append("Missing evidence citations.")
 
-    if not prompt.do_not_do:
-        issues.append("Missing do_not_do guidance.")
+    if not prompt.evidence_analysis:
+        issues.append("Missing evidence analysis.")
 
     if card.routing.primary_team not in TEAM_LIST:
         issues.append("Routing team not in allowed list.")
@@ -60,48 +61,110 @@ def _deterministic_checks(card: DashboardCard) -> List[str]:
     return issues
 
 
-def verify_guardrails(
-    card: DashboardCard,
-    client: Optional[ChatClient] = None,
-) -> GuardrailResult:
-    issues = []
+def verify_deterministic(card: DashboardCard) -> GuardrailResult:
+    """Rule-based guardrails only, for cards produced without any LLM."""
+    issues = _deterministic_checks(card)
+    return GuardrailResult(passed=len(issues) == 0, issues=issues)
+
+
+def merge_guardrails(previous: GuardrailResult, current: GuardrailResult) -> GuardrailResult:
+    """Rule-based checks of the updated card; issues the earlier (LLM) review raised still stand."""
+    issues = list(current.issues)
+    if not previous.passed:
+        issues = list(previous.issues) + [issue for issue in issues if issue not in previous.issues]
+    return GuardrailResult(passed=len(issues) == 0, issues=issues)
+
+
+def _skip_llm(card: DashboardCard) -> bool:
+    """``GUARDRAILS_SKIP_LLM_PRIORITIES`` (e.g. ``P3``) lists priorities whose cards may skip LLM validation."""
+    priorities = {item.strip().upper() for item in os.getenv("GUARDRAILS_SKIP_LLM_PRIORITIES", "").split(",") if item.strip()}
+    return card.routing.priority in priorities
+
+
+def _compact_payload(card: DashboardCard) -> str:
+    """Only the fields the semantic checks look at, instead of the whole card."""
+    prompt = card.reverse_prompt.employee_prompt
+    payload = {
+        "routing": {"team": card.routing.primary_team, "priority": card.routing.priority},
+        "risk": card.scores.model_dump(),
+        "topic": card.signals.topic,
+        "intent": card.signals.intent,
+        "evidence": [f"[{ev.source}] {ev.quote}" for ev in card.signals.evidence],
+        "situation_background": prompt.situation_background,
+        "customer_context": prompt.customer_context,
+        "evidence_analysis": prompt.evidence_analysis,
+        "policy_excerpts": [excerpt[:POLICY_EXCERPT_CHARS] for excerpt in prompt.relevant_policy_excerpts],
+        "key_considerations": prompt.key_considerations,
+        "citations": card.reverse_prompt.citations,
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _precheck(card: DashboardCard, client: Optional[ChatClient]) -> Optional[GuardrailResult]:
+    """The verdict when no LLM call is needed, else None."""
+    # Any rule-based failure blocks the card whatever the LLM says, so don't ask it.
+    issues = _deterministic_checks(card)
+    if issues:
+        return GuardrailResult(passed=False, issues=issues)
+
+    if _skip_llm(card):
+        return GuardrailResult(passed=True, issues=[])
 
     if not client:
         return GuardrailResult(passed=False, issues=["LLM client not available for guardrails validation"])
+    return None
 
+
+def _messages(card: DashboardCard) -> List[Dict[str, str]]:
     system_prompt = (
         "You are a safety and compliance validator for AI-generated content. "
+        "PII and forbidden phrases in the background and considerations, citations and routing have already been checked. "
         "Validate this dashboard card for:\n"
-        "1. Evidence grounding - all claims must have supporting evidence with sources\n"
-        "2. Policy alignment - recommendations must align with provided playbooks\n"
-        "3. Privacy and safety - no PII exposure, no harmful content\n"
+        "1. Evidence grounding - claims in the background and considerations must be supported by the evidence\n"
+        "2. Policy alignment - considerations must align with the policy excerpts\n"
+        "3. Safety - no harmful content\n"
         "4. Ethical boundaries - no promises, guarantees, or fault admissions\n"
-        "5. Explainability - citations and references must be present\n"
         "\n"
         "Return JSON only: {\"pass\": true/false, \"issues\": [\"issue1\", \"issue2\", ...]}. "
         "Set pass=false if ANY validation fails. "
-        "Be strict about evidence citations and policy alignment."
-    )
-    
-    parsed = try_llm_json(
-        client,
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": card.model_dump_json()},
-        ],
+        "Be strict about evidence grounding and policy alignment."
     )
-    
-    if not parsed:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _compact_payload(card)},
+    ]
+
+
+def _from_reply(parsed: Optional[Dict]) -> GuardrailResult:
+    try:
+        verdict = GuardrailVerdict(**parsed) if parsed else None
+    except Exception:
+        verdict = None
+    if verdict is None:
         return GuardrailResult(passed=False, issues=["Guardrails LLM failed to return valid response"])
-    
-    passed = parsed.get("pass", False)
-    llm_issues = parsed.get("issues", [])
-    
-    if not passed:
-        issues.extend(llm_issues)
-    
-    # Require citations check (minimal deterministic fallback)
-    if not card.reverse_prompt.citations:
-        issues.append("Missing citations in reverse prompt output")
-    
+
+    issues = [] if verdict.passed else list(verdict.issues)
     return GuardrailResult(passed=len(issues) == 0, issues=issues)
+
+
+def verify_guardrails(
+    card: DashboardCard,
+    client: Optional[ChatClient] = None,
+) -> GuardrailResult:
+    result = _precheck(card, client)
+    if result is not None:
+        return result
+    return _from_reply(try_llm_json(client, _messages(card), schema=GuardrailVerdict))
+
+
+def verify_guardrails_batch(
+    cards: List[DashboardCard],
+    client: Optional[ChatClient] = None,
+) -> List[GuardrailResult]:
+    """``verify_guardrails`` for many cards; the ones that need the LLM are validated together."""
+    results = [_precheck(card, client) for card in cards]
+    pending = [position for position, result in enumerate(results) if result is None]
+    replies = try_llm_json_many(client, [_messages(cards[position]) for position in pending], schema=GuardrailVerdict)
+    for position, parsed in zip(pending, replies):
+        results[position] = _from_reply(parsed)
+    return results
@@ -1,22 +1,138 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import os
+import random
 import threading
-from typing import Any, Dict, List, Optional, Protocol
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Protocol, Tuple, Type
 
 import httpx
+from pydantic import BaseModel
+
+from ..metrics import (
+    LLM_BATCH_SIZE,
+    LLM_COMPLETION_TOKENS,
+    LLM_GENERATION_SECONDS,
+    LLM_JSON_ATTEMPTS,
+    LLM_JSON_FAILURES,
+    LLM_JSON_RETRIES,
+    LLM_PROMPT_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+)
 
 try:  # Optional; required for local model execution.
     import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteria, StoppingCriteriaList
 except Exception:  # pragma: no cover - handled at runtime
     torch = None
     AutoModelForCausalLM = None
     AutoTokenizer = None
+    DynamicCache = None
+    StoppingCriteria = object
+    StoppingCriteriaList = None
+
+try:  # Optional; enables HTTP/2 for the API backend.
+    import h2  # type: ignore  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover - optional at runtime
+    _HTTP2_AVAILABLE = False
+
+try:  # Optional; masks local decoding to tokens that keep the output valid for a JSON schema.
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import (
+        build_token_enforcer_tokenizer_data,
+        build_transformers_prefix_allowed_tokens_fn,
+    )
+except Exception:  # pragma: no cover - optional at runtime
+    JsonSchemaParser = None
+    build_token_enforcer_tokenizer_data = None
+    build_transformers_prefix_allowed_tokens_fn = None
+
+
+def _constrained_decoding() -> bool:
+    return os.getenv("LLM_CONSTRAINED_DECODING", "true").lower() in {"1", "true", "yes"}
+
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Servers known to honour ``response_format: json_schema``; TGI and others accept the
+# request but ignore or reject the schema, so they get prompt-only JSON plus validation.
+_SCHEMA_SERVERS = {"vllm", "sglang", "llama.cpp"}
+
+
+class _HTTPPool:
+    """Long-lived sync and async httpx clients for one API base, shared by every LLMClient using it.
+
+    Connections are kept alive between agent calls, and ``LLM_HTTP_MAX_CONCURRENCY``
+    bounds the requests in flight to the inference server from this process.
+    """
+
+    def __init__(self, api_base: str):
+        self.api_base = api_base
+        self.concurrency = max(1, int(os.getenv("LLM_HTTP_MAX_CONCURRENCY", "16")))
+        self.http2 = os.getenv("LLM_HTTP2", "false").lower() in {"1", "true", "yes"} and _HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60")),
+        )
+        self.semaphore = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        # Async clients and semaphores belong to the loop that created them, so each
+        # running loop gets its own; entries go away with their loop.
+        self._async: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self.api_base, limits=self.limits, http2=self.http2)
+            return self._client
+
+    def async_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """The async client and semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async:
+                client = httpx.AsyncClient(base_url=self.api_base, limits=self.limits, http2=self.http2)
+                self._async[loop] = (client, asyncio.Semaphore(self.concurrency))
+            return self._async[loop]
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Threads that run submitted blocking calls; one per allowed in-flight request."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="llm-http")
+            return self._executor
+
+
+_HTTP_POOLS: Dict[str, _HTTPPool] = {}
+_HTTP_POOLS_LOCK = threading.Lock()
+
+
+def _http_pool(api_base: str) -> _HTTPPool:
+    with _HTTP_POOLS_LOCK:
+        if api_base not in _HTTP_POOLS:
+            _HTTP_POOLS[api_base] = _HTTPPool(api_base)
+        return _HTTP_POOLS[api_base]
 
 
 class LLMClient:
+    """Client for an OpenAI-compatible ``/v1/chat/completions`` server (vLLM, TGI, llama.cpp, ...).
+
+    Transport errors, timeouts and 408/409/429/5xx responses are retried up to
+    ``LLM_HTTP_RETRIES`` times with jittered exponential backoff, honouring
+    ``Retry-After`` (up to ``LLM_HTTP_MAX_RETRY_AFTER_SECONDS``) when the server sends it.
+    """
+
     def __init__(
         self,
         api_base: str,
@@ -30,25 +146,327 @@ class LLMClient:
         self.temperature = temperature
         self.timeout = timeout
         self.max_tokens = max_tokens
-
-    def chat(self, messages: List[Dict[str, str]]) -> str:
-        url = f"{self.api_base}/v1/chat/completions"
+        self.retries = int(os.getenv("LLM_HTTP_RETRIES", "2"))
+        self.backoff = float(os.getenv("LLM_HTTP_BACKOFF_SECONDS", "0.5"))
+        self.max_retry_after = float(os.getenv("LLM_HTTP_MAX_RETRY_AFTER_SECONDS", "10"))
+        self.server = os.getenv("LLM_SERVER", "").lower()
+        self._pool = _http_pool(self.api_base)
+
+    @property
+    def enforces_schema(self) -> bool:
+        # Opt-in: only servers named in LLM_SERVER that are known to enforce json_schema.
+        return _constrained_decoding() and self.server in _SCHEMA_SERVERS
+
+    def _request(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]]) -> Dict[str, Any]:
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
         }
-        headers = {"Authorization": f"Bearer {os.getenv('LLM_API_KEY', 'local')}"}
-        with httpx.Client(timeout=self.timeout) as client:
-            response = client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-        return data["choices"][0]["message"]["content"]
+        if response_schema is not None and self.enforces_schema:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": response_schema.__name__, "schema": response_schema.model_json_schema()},
+            }
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {os.getenv('LLM_API_KEY', 'local')}"}
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+        """Seconds to wait before retrying, or None when the failure is final."""
+        if attempt >= self.retries:
+            return None
+        if response is not None:
+            if response.status_code not in _RETRYABLE_STATUS:
+                return None
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.replace(".", "", 1).isdigit():
+                # A server asking for minutes would stall the pipeline thread; cap it.
+                return min(float(retry_after), self.max_retry_after)
+        return self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+
+    def _content(self, response: httpx.Response, elapsed: float) -> str:
+        body = response.json()
+        usage = body.get("usage") or {}
+        LLM_GENERATION_SECONDS.observe(elapsed, model=self.model)
+        LLM_PROMPT_TOKENS.inc(usage.get("prompt_tokens", 0), model=self.model)
+        LLM_COMPLETION_TOKENS.inc(usage.get("completion_tokens", 0), model=self.model)
+        if usage.get("completion_tokens") and elapsed > 0:
+            LLM_TOKENS_PER_SECOND.observe(usage["completion_tokens"] / elapsed, model=self.model)
+        return body["choices"][0]["message"]["content"]
+
+    def chat(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> str:
+        payload = self._request(messages, response_schema)
+        client = self._pool.client()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                with self._pool.semaphore:
+                    started = time.perf_counter()
+                    response = client.post("/v1/chat/completions", json=payload, headers=self._headers(), timeout=self.timeout)
+                response.raise_for_status()
+                return self._content(response, time.perf_counter() - started)
+            except (httpx.TransportError, httpx.HTTPStatusError):
+                delay = self._delay(attempt, response)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def cache_identity(self) -> Dict[str, Any]:
+        """Everything besides the messages that shapes a reply, for response caching."""
+        return {
+            "backend": "openai",
+            "api_base": self.api_base,
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "constrained": self.enforces_schema,
+        }
+
+    def submit(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> Future:
+        """Start ``chat`` in the background so many requests can be in flight at once."""
+        return self._pool.executor().submit(self.chat, messages, response_schema)
+
+    async def achat(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> str:
+        payload = self._request(messages, response_schema)
+        client, semaphore = self._pool.async_client()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        "/v1/chat/completions", json=payload, headers=self._headers(), timeout=self.timeout
+                    )
+                response.raise_for_status()
+                return self._content(response, time.perf_counter() - started)
+            except (httpx.TransportError, httpx.HTTPStatusError):
+                delay = self._delay(attempt, response)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class _JsonObjectEnd:
+    """Incrementally scans generated text and reports when the first top-level JSON object closes."""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return True
+        return False
+
+
+class _GenerationRequest:
+    def __init__(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        prefix: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None,
+    ):
+        self.prompt = prompt
+        self.prefix = prefix
+        self.do_sample = temperature is not None and temperature > 0
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.response_schema = response_schema
+        self.json_end = _JsonObjectEnd() if response_schema is not None else None
+        self.completion_tokens = 0
+        self.future: Future = Future()
+
+    @property
+    def sampling(self) -> Tuple[bool, Optional[float], Optional[str]]:
+        # Constrained rows need their own token mask, so schemas are batched separately.
+        schema = self.response_schema.__name__ if self.response_schema is not None else None
+        return self.do_sample, self.temperature if self.do_sample else None, schema
+
+    @property
+    def batch_key(self) -> Tuple[bool, Optional[float], Optional[str], Optional[str]]:
+        # Rows with the same system prompt can share its cached KV prefix.
+        return (*self.sampling, self.prefix)
+
+
+class _ReleaseFinished(StoppingCriteria):
+    """Resolves each request as soon as its own row emits EOS or reaches its ``max_tokens``.
+
+    Rows that expect JSON also finish when their top-level object closes, so no
+    tokens are spent after it. Finished rows are reported back as done so ``generate`` stops the whole batch
+    once the last one ends.
+    """
+
+    def __init__(self, model: "_LocalModel", requests: List[_GenerationRequest], prompt_length: int):
+        self.model = model
+        self.requests = requests
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        generated = input_ids[:, self.prompt_length :]
+        for row, request in enumerate(self.requests):
+            if request.future.done():
+                done[row] = True
+                continue
+            tokens = generated[row]
+            closed = request.json_end is not None and request.json_end.feed(self.model.piece(tokens[-1]))
+            if closed or len(tokens) >= request.max_tokens or int(tokens[-1]) in self.model.eos_token_ids:
+                request.completion_tokens = min(len(tokens), request.max_tokens)
+                request.future.set_result(self.model.decode(tokens, request.max_tokens))
+                done[row] = True
+        return done
+
+
+def _legacy_cache(cache):
+    return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+
+
+def _cache_nbytes(layers) -> int:
+    return sum(tensor.numel() * tensor.element_size() for layer in layers for tensor in layer)
+
+
+def _shared_cache(layers, rows: int):
+    """A fresh cache over the stored prefix tensors, broadcast to ``rows`` without copying.
+
+    ``generate`` appends to a dynamic cache by concatenating into new tensors, so
+    the stored prefix is only ever read and needs no per-call copy.
+    """
+    expanded = tuple(tuple(tensor.expand(rows, *tensor.shape[1:]) for tensor in layer) for layer in layers)
+    return DynamicCache.from_legacy_cache(expanded)
+
+
+class _PrefixCache:
+    """LRU of ``past_key_values`` for static prompt prefixes (system prompts), per model.
+
+    Entries are keyed by the rendered prefix text and evicted oldest-first once
+    their KV tensors exceed ``LLM_PREFIX_CACHE_MB``. Prefixes shorter than
+    ``LLM_PREFIX_CACHE_MIN_TOKENS`` are not worth a cache slot and are skipped.
+    ``hits`` and ``misses`` count batches; ``rows`` counts the prompts that were
+    actually served from a cached prefix.
+    """
+
+    def __init__(self, model: "_LocalModel"):
+        self._model = model
+        self.budget_bytes = int(float(os.getenv("LLM_PREFIX_CACHE_MB", "1024")) * 1024 * 1024)
+        self.min_tokens = int(os.getenv("LLM_PREFIX_CACHE_MIN_TOKENS", "32"))
+        self._entries: "OrderedDict[str, Tuple[Any, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rows = 0
+
+    def get(self, prefix: str):
+        """Return ``(prefix_ids, past_key_values)`` for ``prefix``, prefilling it on a miss."""
+        if self.budget_bytes <= 0:
+            return None
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+        prefix_ids = self._model.tokenize(prefix)
+        if prefix_ids.shape[1] < self.min_tokens:
+            return None
+        self.misses += 1
+        with torch.inference_mode():
+            cache = _legacy_cache(self._model.prefill(prefix_ids))
+        size = _cache_nbytes(cache)
+        if size > self.budget_bytes:
+            return prefix_ids, cache
+        self._entries[key] = (prefix_ids, cache, size)
+        self._bytes += size
+        while self._bytes > self.budget_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+        return prefix_ids, cache
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses, "rows": self.rows}
+
+
+class _BatchScheduler:
+    """Collects concurrent generate calls on one model and runs them as left-padded batches.
+
+    Requests with the same sampling settings and system prompt share a batch of up to
+    ``LLM_MAX_BATCH_SIZE``; the scheduler waits at most ``LLM_BATCH_WAIT_MS``
+    after the oldest pending request for others to join. A batch runs to
+    completion once started, but every caller is released when its own sequence
+    finishes.
+    """
+
+    def __init__(self, model: "_LocalModel"):
+        self._model = model
+        self.max_batch_size = max(1, int(os.getenv("LLM_MAX_BATCH_SIZE", "8")))
+        self.wait_seconds = float(os.getenv("LLM_BATCH_WAIT_MS", "10")) / 1000.0
+        self._pending: Deque[_GenerationRequest] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, request: _GenerationRequest) -> Future:
+        with self._condition:
+            self._pending.append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def _next_batch(self) -> List[_GenerationRequest]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            key = self._pending[0].batch_key
+            deadline = time.monotonic() + self.wait_seconds
+            while True:
+                batch = [request for request in self._pending if request.batch_key == key][: self.max_batch_size]
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            for request in batch:
+                self._pending.remove(request)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                self._model.generate_batch(batch)
+            except Exception as exc:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
 
 
 class _LocalModel:
     def __init__(self, model: str):
+        self.name = model
         if AutoTokenizer is None or AutoModelForCausalLM is None or torch is None:
             raise RuntimeError(
                 "Local LLM dependencies not available. Install torch and transformers to use local models."
@@ -60,6 +478,8 @@ class _LocalModel:
         )
         if self._tokenizer.pad_token_id is None and self._tokenizer.eos_token_id is not None:
             self._tokenizer.pad_token_id = self._tokenizer.eos_token_id
+        # Batched prompts are left-padded so every row's next token lines up at the end.
+        self._tokenizer.padding_side = "left"
         self._model = AutoModelForCausalLM.from_pretrained(
             model,
             torch_dtype="auto",
@@ -69,28 +489,152 @@ class _LocalModel:
         )
         self._model.eval()
 
-    def generate(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        eos = self._model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, list) else [eos] if eos is not None else [])
+        if self._tokenizer.eos_token_id is not None:
+            self.eos_token_ids.add(self._tokenizer.eos_token_id)
+        self._prefix_cache = _PrefixCache(self)
+        self._enforcer_data = None
+        self._scheduler = _BatchScheduler(self)
+
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        response_schema: Optional[Type[BaseModel]] = None,
+    ) -> str:
+        return self.submit(messages, temperature, max_tokens, response_schema).result()
+
+    def submit(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        response_schema: Optional[Type[BaseModel]] = None,
+    ) -> Future:
         prompt = self._tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True,
         )
-        inputs = self._tokenizer(prompt, return_tensors="pt")
-        device = next(self._model.parameters()).device
-        inputs = {key: value.to(device) for key, value in inputs.items()}
+        # The rendered system message is the static part of every agent prompt.
+        prefix = None
+        if messages and messages[0].get("role") == "system":
+            rendered = self._tokenizer.apply_chat_template(messages[:1], tokenize=False)
+            if prompt.startswith(rendered):
+                prefix = rendered
+        request = _GenerationRequest(prompt, temperature, max_tokens, prefix, response_schema)
+        return self._scheduler.submit(request)
+
+    @property
+    def enforces_schema(self) -> bool:
+        return JsonSchemaParser is not None and _constrained_decoding()
+
+    @property
+    def device(self):
+        return next(self._model.parameters()).device
+
+    def tokenize(self, text: str):
+        return self._tokenizer(text, return_tensors="pt")["input_ids"].to(self.device)
+
+    def prefill(self, input_ids):
+        return self._model(input_ids=input_ids, use_cache=True).past_key_values
+
+    def decode(self, tokens, max_tokens: int) -> str:
+        return self._tokenizer.decode(tokens[:max_tokens], skip_special_tokens=True).strip()
+
+    def piece(self, token) -> str:
+        return self._tokenizer.decode([int(token)], skip_special_tokens=True)
+
+    def _schema_constraint(self, requests: List[_GenerationRequest]):
+        """``prefix_allowed_tokens_fn`` that keeps every row valid for its response schema."""
+        if not self.enforces_schema or requests[0].response_schema is None:
+            return None
+        if self._enforcer_data is None:
+            self._enforcer_data = build_token_enforcer_tokenizer_data(self._tokenizer)
+        row_constraints = [
+            build_transformers_prefix_allowed_tokens_fn(
+                self._enforcer_data, JsonSchemaParser(request.response_schema.model_json_schema())
+            )
+            for request in requests
+        ]
+        return lambda batch_id, sent: row_constraints[batch_id](batch_id, sent)
+
+    def prefix_cache_stats(self) -> Dict[str, int]:
+        return self._prefix_cache.stats()
+
+    def _prefixed_inputs(self, requests: List[_GenerationRequest]):
+        """Inputs laid out as ``prefix | padding | suffix`` plus the shared prefix KV, or None.
+
+        Padding goes between the shared prefix and each row's own suffix, so the
+        cached prefix lines up for every row and only the suffixes are prefilled;
+        the attention mask hides the padding.
+        """
+        prefix = requests[0].prefix
+        if prefix is None:
+            return None
+        entry = self._prefix_cache.get(prefix)
+        if entry is None:
+            return None
+        prefix_ids, layers = entry
+        length = prefix_ids.shape[1]
+        rows = [self.tokenize(request.prompt)[0] for request in requests]
+        if any(len(row) <= length or not torch.equal(row[:length], prefix_ids[0]) for row in rows):
+            return None
+        width = max(len(row) for row in rows)
+        input_ids = torch.full((len(rows), width), self._tokenizer.pad_token_id, dtype=prefix_ids.dtype, device=self.device)
+        attention_mask = torch.zeros_like(input_ids)
+        input_ids[:, :length] = prefix_ids[0]
+        attention_mask[:, :length] = 1
+        for index, row in enumerate(rows):
+            suffix = row[length:]
+            input_ids[index, width - len(suffix) :] = suffix
+            attention_mask[index, width - len(suffix) :] = 1
+        self._prefix_cache.rows += len(rows)
+        return {"input_ids": input_ids, "attention_mask": attention_mask}, _shared_cache(layers, len(rows))
+
+    def generate_batch(self, requests: List[_GenerationRequest]) -> None:
+        with torch.inference_mode():
+            prefixed = self._prefixed_inputs(requests)
+        if prefixed is not None:
+            inputs, cache = prefixed
+        else:
+            inputs = self._tokenizer([request.prompt for request in requests], return_tensors="pt", padding=True)
+            inputs, cache = {key: value.to(self.device) for key, value in inputs.items()}, None
+        prompt_length = inputs["input_ids"].shape[1]
 
-        do_sample = temperature is not None and temperature > 0
+        first = requests[0]
         generation_args = {
-            "max_new_tokens": max_tokens,
-            "do_sample": do_sample,
+            "max_new_tokens": max(request.max_tokens for request in requests),
+            "do_sample": first.do_sample,
+            "pad_token_id": self._tokenizer.pad_token_id,
+            "stopping_criteria": StoppingCriteriaList([_ReleaseFinished(self, requests, prompt_length)]),
         }
-        if do_sample:
-            generation_args["temperature"] = temperature
+        if first.do_sample:
+            generation_args["temperature"] = first.temperature
             generation_args["top_p"] = 0.9
-
-        output = self._model.generate(**inputs, **generation_args)
-        result = output[0][inputs["input_ids"].shape[1] :]
-        return self._tokenizer.decode(result, skip_special_tokens=True).strip()
+        constraint = self._schema_constraint(requests)
+        if constraint is not None:
+            generation_args["prefix_allowed_tokens_fn"] = constraint
+        if cache is not None:
+            generation_args["past_key_values"] = cache
+
+        started = time.perf_counter()
+        with torch.inference_mode():
+            output = self._model.generate(**inputs, **generation_args)
+        for row, request in enumerate(requests):
+            if not request.future.done():
+                request.completion_tokens = min(output.shape[1] - prompt_length, request.max_tokens)
+                request.future.set_result(self.decode(output[row, prompt_length:], request.max_tokens))
+        elapsed = time.perf_counter() - started
+        completion_tokens = sum(request.completion_tokens for request in requests)
+        LLM_BATCH_SIZE.observe(len(requests), model=self.name)
+        LLM_GENERATION_SECONDS.observe(elapsed, model=self.name)
+        LLM_PROMPT_TOKENS.inc(int(inputs["attention_mask"].sum()), model=self.name)
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, model=self.name)
+        if elapsed > 0:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed, model=self.name)
 
 
 class LocalLLMClient:
@@ -99,18 +643,51 @@ class LocalLLMClient:
         self.temperature = temperature
         self.max_tokens = max_tokens
 
-    def chat(self, messages: List[Dict[str, str]]) -> str:
-        return self._backend.generate(messages, temperature=self.temperature, max_tokens=self.max_tokens)
+    @property
+    def enforces_schema(self) -> bool:
+        return self._backend.enforces_schema
+
+    def chat(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> str:
+        return self._backend.generate(
+            messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            response_schema=response_schema,
+        )
+
+    def cache_identity(self) -> Dict[str, Any]:
+        """Everything besides the messages that shapes a reply, for response caching."""
+        return {
+            "backend": "local",
+            "model": self._backend.name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "constrained": self.enforces_schema,
+        }
+
+    def submit(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> Future:
+        """Queue a generation without waiting, so a whole batch reaches the scheduler together."""
+        return self._backend.submit(
+            messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            response_schema=response_schema,
+        )
 
 
 _LOCAL_MODELS: Dict[str, _LocalModel] = {}
 _LOCAL_CLIENTS: Dict[str, LocalLLMClient] = {}
 _LOCAL_LOCK = threading.Lock()
 _MODELS_READY = False
+_API_CLIENTS: Dict[str, LLMClient] = {}
+
+
+def prefix_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {name: model.prefix_cache_stats() for name, model in _LOCAL_MODELS.items()}
 
 
 class ChatClient(Protocol):
-    def chat(self, messages: List[Dict[str, str]]) -> str:
+    def chat(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> str:
         ...
 
 
@@ -131,12 +708,39 @@ def get_local_client(model: str, temperature: float = 0.2, max_tokens: int = 800
         return _LOCAL_CLIENTS[key]
 
 
+def llm_backend() -> str:
+    """``openai`` to call an OpenAI-compatible server at ``LLM_API_BASE``, else ``local`` in-process models."""
+    backend = os.getenv("LLM_BACKEND", "").lower()
+    if backend:
+        return backend
+    return "openai" if os.getenv("LLM_API_BASE") else "local"
+
+
+def get_api_client(model: str, temperature: float = 0.2, max_tokens: int = 800) -> LLMClient:
+    api_base = os.getenv("LLM_API_BASE", "http://localhost:8000")
+    key = f"{api_base}:{model}:{temperature}:{max_tokens}"
+    with _LOCAL_LOCK:
+        if key not in _API_CLIENTS:
+            _API_CLIENTS[key] = LLMClient(
+                api_base,
+                model,
+                temperature=temperature,
+                timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "120")),
+                max_tokens=max_tokens,
+            )
+        return _API_CLIENTS[key]
+
+
 def warm_start_models() -> None:
     global _MODELS_READY
     
     if os.getenv("WARM_START_MODELS", "true").lower() not in {"1", "true", "yes"}:
         return
 
+    if llm_backend() != "local":
+        # Weights live in the inference server; there is nothing to load in-process.
+        return
+
     agent1_model = os.getenv("AGENT1_MODEL", "Qwen/Qwen2.5-32B-Instruct")
     agent3_model = os.getenv("AGENT3_MODEL", "Qwen/Qwen2.5-32B-Instruct")
     guard_model = os.getenv("GUARDRAILS_MODEL", "Qwen/Qwen2.5-1.5B-Instruct")
@@ -182,17 +786,85 @@ def extract_json(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def try_llm_json(client: Optional[ChatClient], messages: List[Dict[str, str]], retries: int = 1) -> Optional[Dict[str, Any]]:
+def try_llm_json(
+    client: Optional[ChatClient],
+    messages: List[Dict[str, str]],
+    retries: int = 1,
+    schema: Optional[Type[BaseModel]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Ask ``client`` for a JSON object, optionally shaped by ``schema``.
+
+    When the client enforces the schema while decoding, a malformed reply cannot
+    be fixed by asking again, so it is not retried.
+    """
     if client is None:
         return None
 
     attempts = retries + 1
-    for _ in range(attempts):
+    if schema is not None and getattr(client, "enforces_schema", False):
+        attempts = 1
+    label = _schema_label(schema)
+    for attempt in range(attempts):
+        if attempt:
+            LLM_JSON_RETRIES.inc(schema=label)
         try:
-            content = client.chat(messages)
+            content = client.chat(messages, response_schema=schema) if schema is not None else client.chat(messages)
             parsed = extract_json(content)
             if parsed is not None:
+                LLM_JSON_ATTEMPTS.inc(schema=label, outcome="ok")
                 return parsed
+            LLM_JSON_ATTEMPTS.inc(schema=label, outcome="parse_error")
         except Exception:
+            LLM_JSON_ATTEMPTS.inc(schema=label, outcome="error")
             continue
+    LLM_JSON_FAILURES.inc(schema=label)
     return None
+
+
+def _schema_label(schema: Optional[Type[BaseModel]]) -> str:
+    return schema.__name__ if schema is not None else "none"
+
+
+def try_llm_json_many(
+    client: Optional[ChatClient],
+    messages_list: List[List[Dict[str, str]]],
+    retries: int = 1,
+    schema: Optional[Type[BaseModel]] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """``try_llm_json`` for many conversations at once, in the same order.
+
+    Every conversation is submitted before any reply is awaited, so a local model
+    decodes them as batches and an API backend gets them concurrently. Only the
+    conversations whose reply did not parse are retried.
+    """
+    if client is None:
+        return [None] * len(messages_list)
+    if not hasattr(client, "submit"):
+        return [try_llm_json(client, messages, retries=retries, schema=schema) for messages in messages_list]
+
+    attempts = retries + 1
+    if schema is not None and getattr(client, "enforces_schema", False):
+        attempts = 1
+    label = _schema_label(schema)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(messages_list)
+    pending = list(range(len(messages_list)))
+    for attempt in range(attempts):
+        if attempt:
+            LLM_JSON_RETRIES.inc(len(pending), schema=label)
+        futures = [(position, client.submit(messages_list[position], schema)) for position in pending]
+        pending = []
+        for position, future in futures:
+            try:
+                results[position] = extract_json(future.result())
+                outcome = "ok" if results[position] is not None else "parse_error"
+            except Exception:
+                results[position] = None
+                outcome = "error"
+            LLM_JSON_ATTEMPTS.inc(schema=label, outcome=outcome)
+            if results[position] is None:
+                pending.append(position)
+        if not pending:
+            break
+    if pending:
+        LLM_JSON_FAILURES.inc(len(pending), schema=label)
+    return results
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from ..metrics import LLM_CACHE_LOOKUPS
+from .llm_client import extract_json
+
+_RESPONSE_CACHE: Optional["ResponseCache"] = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+class ResponseCache:
+    """Agent replies keyed by a hash of the model, sampling settings and messages.
+
+    Replies live in a SQLite file shared by every process on the host, with an
+    in-process LRU in front of it. Entries older than ``ttl_seconds`` are ignored
+    and deleted; when the stored replies exceed ``max_bytes`` the least recently
+    used ones are dropped until three quarters of the budget remain.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 256 * 1024 * 1024, memory_entries: int = 1024):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0}
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, reply TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def key(identity: Dict[str, Any], messages: List[Dict[str, str]], schema: Optional[Type[BaseModel]]) -> str:
+        canonical = json.dumps(
+            {
+                "identity": identity,
+                "messages": messages,
+                "schema": schema.model_json_schema() if schema is not None else None,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl_seconds <= 0 or time.time() - created < self.ttl_seconds
+
+    def _remember(self, key: str, reply: str, created: float) -> None:
+        self._memory[key] = (reply, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[1]):
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+            row = self._db.execute("SELECT reply, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            reply, created = row
+            if not self._fresh(created):
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._remember(key, reply, created)
+            self._counters["disk_hits"] += 1
+            return reply
+
+    def put(self, key: str, reply: str) -> None:
+        now = time.time()
+        size = len(reply.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, reply, created, last_used, size) VALUES (?, ?, ?, ?, ?)",
+                (key, reply, now, now, size),
+            )
+            self._remember(key, reply, now)
+            self._counters["writes"] += 1
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.max_bytes > 0 and total > self.max_bytes:
+                self._evict(total)
+
+    def _evict(self, total: int) -> None:
+        """Drop expired replies, then the least recently used, down to three quarters of ``max_bytes``."""
+        if self.ttl_seconds > 0:
+            cursor = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self._counters["expired"] += max(cursor.rowcount, 0)
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * 3 // 4
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        for (key,) in doomed:
+            self._memory.pop(key, None)
+        self._counters["evicted"] += len(doomed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            stats["entries"] = entries
+            stats["bytes"] = size
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def _usable(reply: str, schema: Optional[Type[BaseModel]]) -> bool:
+    """Only replies the agents can use are cached, so a bad one is retried rather than replayed."""
+    parsed = extract_json(reply)
+    if parsed is None:
+        return False
+    if schema is None:
+        return True
+    try:
+        schema.model_validate(parsed)
+    except Exception:
+        return False
+    return True
+
+
+class CachedChatClient:
+    """Wraps an agent's chat client so identical requests are answered from ``ResponseCache``."""
+
+    def __init__(self, client: Any, cache: ResponseCache, agent: str, identity: Dict[str, Any]):
+        self._client = client
+        self._cache = cache
+        self.agent = agent
+        self.identity = identity
+
+    @property
+    def enforces_schema(self) -> bool:
+        return getattr(self._client, "enforces_schema", False)
+
+    def _lookup(self, messages: List[Dict[str, str]], schema: Optional[Type[BaseModel]]) -> Tuple[str, Optional[str]]:
+        key = self._cache.key(self.identity, messages, schema)
+        reply = self._cache.get(key)
+        LLM_CACHE_LOOKUPS.inc(agent=self.agent, outcome="hit" if reply is not None else "miss")
+        return key, reply
+
+    def _store(self, key: str, reply: str, schema: Optional[Type[BaseModel]]) -> None:
+        if _usable(reply, schema):
+            self._cache.put(key, reply)
+
+    def chat(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> str:
+        key, reply = self._lookup(messages, response_schema)
+        if reply is not None:
+            return reply
+        reply = self._client.chat(messages, response_schema=response_schema)
+        self._store(key, reply, response_schema)
+        return reply
+
+    def submit(self, messages: List[Dict[str, str]], response_schema: Optional[Type[BaseModel]] = None) -> Future:
+        key, reply = self._lookup(messages, response_schema)
+        if reply is not None:
+            future: Future = Future()
+            future.set_result(reply)
+            return future
+        future = self._client.submit(messages, response_schema)
+
+        def store(done: Future) -> None:
+            if not done.cancelled() and done.exception() is None:
+                self._store(key, done.result(), response_schema)
+
+        future.add_done_callback(store)
+        return future
+
+
+def _default_path() -> Path:
+    return Path(__file__).resolve().parents[2] / "data" / "llm_cache" / "responses.sqlite"
+
+
+def response_cache() -> ResponseCache:
+    global _RESPONSE_CACHE
+    with _RESPONSE_CACHE_LOCK:
+        if _RESPONSE_CACHE is None:
+            _RESPONSE_CACHE = ResponseCache(
+                Path(os.getenv("LLM_CACHE_PATH", str(_default_path()))),
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+            )
+        return _RESPONSE_CACHE
+
+
+def cache_enabled(agent: str) -> bool:
+    """Opt-in: ``<AGENT>_CACHE`` (e.g. ``AGENT1_CACHE``) overrides the global ``LLM_CACHE`` switch, off by default."""
+    default = os.getenv("LLM_CACHE", "false")
+    return os.getenv(f"{agent}_CACHE", default).lower() in {"1", "true", "yes"}
+
+
+def with_response_cache(client: Any, agent: str) -> Any:
+    if not cache_enabled(agent):
+        return client
+    return CachedChatClient(client, response_cache(), agent, client.cache_identity())
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    if _RESPONSE_CACHE is None:
+        return {"enabled": cache_enabled("LLM")}
+    return {"enabled": True, **_RESPONSE_CACHE.stats()}
@@ -1,10 +1,31 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from .llm_client import ChatClient, try_llm_json
-from ..schemas import ReversePrompt, ReversePromptOutput, RoutingDecision, SignalExtraction, RiskScores
+from .llm_client import ChatClient, try_llm_json, try_llm_json_many
+from ..metrics import AGENT_FALLBACKS
+from ..schemas import EvidenceQuote, ReversePrompt, ReversePromptOutput, RoutingDecision, SignalExtraction, RiskScores
+
+
+def situation_background(routing: RoutingDecision, scores: RiskScores, signals: SignalExtraction) -> str:
+    return (
+        f"This {signals.topic} case has been routed to {routing.primary_team} with {routing.priority} priority. "
+        f"Customer sentiment appears {signals.sentiment} with {signals.urgency} urgency. "
+        f"Risk profile: virality={scores.virality}, churn={scores.churn}, compliance={scores.compliance}."
+    )
+
+
+def evidence_line(evidence: EvidenceQuote) -> str:
+    return f"[{evidence.source} @ {evidence.timestamp}] {evidence.quote}"
+
+
+def key_considerations(routing: RoutingDecision, signals: SignalExtraction) -> List[str]:
+    return [
+        f"Case routed to {routing.primary_team} based on {signals.topic} topic",
+        f"Priority set to {routing.priority} due to risk factors",
+        f"Watchers: {', '.join(routing.watchers) if routing.watchers else 'None'}",
+    ]
 
 
 def _deterministic_prompt(
@@ -14,21 +35,10 @@ def _deterministic_prompt(
     playbook_snippets: List[Dict[str, str]],
     event_snippets: List[Dict[str, str]],
 ) -> ReversePromptOutput:
-    primary_team = routing.primary_team
-    
-    # Build contextual background
-    situation_background = (
-        f"This {signals.topic} case has been routed to {primary_team} with {routing.priority} priority. "
-        f"Customer sentiment appears {signals.sentiment} with {signals.urgency} urgency. "
-        f"Risk profile: virality={scores.virality}, churn={scores.churn}, compliance={scores.compliance}."
-    )
-    
     customer_context = signals.summary
     
     # Extract evidence with references
-    evidence_analysis = []
-    for ev in signals.evidence:
-        evidence_analysis.append(f"[{ev.source} @ {ev.timestamp}] {ev.quote}")
+    evidence_analysis = [evidence_line(ev) for ev in signals.evidence]
     
     # Policy excerpts from RAG
     relevant_policy_excerpts = []
@@ -47,20 +57,13 @@ def _deterministic_prompt(
     if not similar_cases:
         similar_cases.append("No similar historical events found")
     
-    # Key considerations based on routing and signals
-    key_considerations = [
-        f"Case routed to {primary_team} based on {signals.topic} topic",
-        f"Priority set to {routing.priority} due to risk factors",
-        f"Watchers: {', '.join(routing.watchers) if routing.watchers else 'None'}",
-    ]
-    
     prompt = ReversePrompt(
-        situation_background=situation_background,
+        situation_background=situation_background(routing, scores, signals),
         customer_context=customer_context,
         evidence_analysis=evidence_analysis,
         relevant_policy_excerpts=relevant_policy_excerpts,
         similar_cases=similar_cases,
-        key_considerations=key_considerations,
+        key_considerations=key_considerations(routing, signals),
     )
     
     return ReversePromptOutput(
@@ -72,14 +75,13 @@ def _deterministic_prompt(
     )
 
 
-def generate_reverse_prompt(
+def _messages(
     routing: RoutingDecision,
     scores: RiskScores,
     signals: SignalExtraction,
     playbook_snippets: List[Dict[str, str]],
     event_snippets: List[Dict[str, str]],
-    client: ChatClient | None = None,
-) -> ReversePromptOutput:
+) -> List[Dict[str, str]]:
     system_prompt = (
         "You create contextual background for an employee to understand a customer situation. "
         "This is like writing a system prompt for a human - give them the full context they need.\n\n"
@@ -128,7 +130,17 @@ def generate_reverse_prompt(
         "}"
     )
 
-    parsed = try_llm_json(client, [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+
+def _from_reply(
+    parsed: Optional[Dict],
+    routing: RoutingDecision,
+    scores: RiskScores,
+    signals: SignalExtraction,
+    playbook_snippets: List[Dict[str, str]],
+    event_snippets: List[Dict[str, str]],
+) -> ReversePromptOutput:
     if parsed:
         try:
             return ReversePromptOutput(**parsed)
@@ -139,4 +151,32 @@ def generate_reverse_prompt(
     if strict:
         raise RuntimeError("LLM did not return valid JSON for reverse prompt generation.")
 
+    AGENT_FALLBACKS.inc(agent="reverse_prompt")
     return _deterministic_prompt(routing, scores, signals, playbook_snippets, event_snippets)
+
+
+def generate_reverse_prompt(
+    routing: RoutingDecision,
+    scores: RiskScores,
+    signals: SignalExtraction,
+    playbook_snippets: List[Dict[str, str]],
+    event_snippets: List[Dict[str, str]],
+    client: ChatClient | None = None,
+) -> ReversePromptOutput:
+    args = (routing, scores, signals, playbook_snippets, event_snippets)
+    parsed = try_llm_json(client, _messages(*args), schema=ReversePromptOutput)
+    return _from_reply(parsed, *args)
+
+
+def generate_reverse_prompt_batch(
+    routings: List[RoutingDecision],
+    scores: List[RiskScores],
+    signals: List[SignalExtraction],
+    playbook_snippets: List[List[Dict[str, str]]],
+    event_snippets: List[List[Dict[str, str]]],
+    client: ChatClient | None = None,
+) -> List[ReversePromptOutput]:
+    """``generate_reverse_prompt`` for many incidents with all generations submitted together."""
+    rows = list(zip(routings, scores, signals, playbook_snippets, event_snippets))
+    replies = try_llm_json_many(client, [_messages(*row) for row in rows], schema=ReversePromptOutput)
+    return [_from_reply(parsed, *row) for parsed, row in zip(replies, rows)]
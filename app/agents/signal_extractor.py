@@ -1,43 +1,61 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-from .llm_client import ChatClient, try_llm_json
+from .llm_client import ChatClient, try_llm_json, try_llm_json_many
+from ..metrics import AGENT_FALLBACKS
 from ..schemas import EvidenceQuote, EventRecord, SignalExtraction, SignalFlags
 
 
+# Checked in order; the first group with a matching keyword wins.
+TOPIC_KEYWORDS = [
+    # Bugs/technical issues first (more specific than billing)
+    ("bug", ["bug", "error", "crash", "broken", "not working", "incorrect", "wrong", "glitch"]),
+    ("billing", ["bill", "charge", "invoice", "price"]),
+    ("outage", ["outage", "down", "offline", "service unavailable"]),
+    ("account", ["account", "login", "password", "locked"]),
+    ("fraud", ["fraud", "scam", "unauthorized", "stolen"]),
+    ("policy", ["policy"]),
+    ("service", ["support", "service", "agent", "help"]),
+]
+
+INTENT_KEYWORDS = [
+    ("bug_report", ["bug", "error", "broken", "crash", "glitch"]),
+    ("refund_request", ["refund", "chargeback", "money back"]),
+    ("cancellation_threat", ["cancel", "close my account", "leaving"]),
+    ("legal_threat", ["lawyer", "legal", "regulator", "lawsuit"]),
+    ("information_request", ["why", "how", "can you", "what is"]),
+]
+
+
+def _matching_labels(text: str, groups: List[Tuple[str, List[str]]]) -> List[str]:
+    return [label for label, words in groups if any(word in text for word in words)]
+
+
+def heuristic_confidence(incident: EventRecord) -> float:
+    """How unambiguous the keyword classification of ``incident`` is, from 0 to 1.
+
+    A topic or intent matched by exactly one keyword group scores 1, one matched
+    by ``n`` competing groups scores ``1/n`` and one matched by none scores 0, as
+    unrecognised text says nothing about the incident. The lower of the two wins.
+    """
+    text = incident.text.lower()
+    scores = []
+    for groups in (TOPIC_KEYWORDS, INTENT_KEYWORDS):
+        matches = len(_matching_labels(text, groups))
+        scores.append(0.0 if matches == 0 else 1.0 / matches)
+    return min(scores)
+
+
 def _heuristic_signals(incident: EventRecord) -> SignalExtraction:
     text = incident.text.lower()
 
-    topic = "other"
-    # Check for bugs/technical issues first (more specific)
-    if any(word in text for word in ["bug", "error", "crash", "broken", "not working", "incorrect", "wrong", "glitch"]):
-        topic = "bug"
-    elif any(word in text for word in ["bill", "charge", "invoice", "price"]) and "bug" not in text and "error" not in text:
-        topic = "billing"
-    elif any(word in text for word in ["outage", "down", "offline", "service unavailable"]):
-        topic = "outage"
-    elif any(word in text for word in ["account", "login", "password", "locked"]):
-        topic = "account"
-    elif any(word in text for word in ["fraud", "scam", "unauthorized", "stolen"]):
-        topic = "fraud"
-    elif "policy" in text:
-        topic = "policy"
-    elif any(word in text for word in ["support", "service", "agent", "help"]):
-        topic = "service"
-
-    intent = "other"
-    if any(word in text for word in ["bug", "error", "broken", "crash", "glitch"]):
-        intent = "bug_report"
-    elif any(word in text for word in ["refund", "chargeback", "money back"]):
-        intent = "refund_request"
-    elif any(word in text for word in ["cancel", "close my account", "leaving"]):
-        intent = "cancellation_threat"
-    elif any(word in text for word in ["lawyer", "legal", "regulator", "lawsuit"]):
-        intent = "legal_threat"
-    elif any(word in text for word in ["why", "how", "can you", "what is"]):
-        intent = "information_request"
+    topics = _matching_labels(text, TOPIC_KEYWORDS)
+    topic = topics[0] if topics else "other"
+
+    intents = _matching_labels(text, INTENT_KEYWORDS)
+    intent = intents[0] if intents else "other"
 
     sentiment = "neutral"
     if any(word in text for word in ["angry", "upset", "terrible", "unacceptable", "frustrated"]):
@@ -80,12 +98,7 @@ def _heuristic_signals(incident: EventRecord) -> SignalExtraction:
     )
 
 
-def extract_signals(
-    incident: EventRecord,
-    event_snippets: List[Dict[str, str]],
-    global_policy: str,
-    client: ChatClient | None = None,
-) -> SignalExtraction:
+def _messages(incident: EventRecord, event_snippets: List[Dict[str, str]], global_policy: str) -> List[Dict[str, str]]:
     system_prompt = (
         "You are an expert analyst extracting structured signals from customer incidents. "
         "Analyze the incident carefully and classify it correctly:\n"
@@ -105,21 +118,7 @@ def extract_signals(
         "- 'complaint': General dissatisfaction\n"
         "- 'information_request': Asking questions\n"
         "\n"
-        "Return ONLY valid JSON matching the schema."
-    )
-
-    snippets_text = "\n".join(
-        f"[{item.get('source','')}] {item.get('timestamp','')}: {item.get('text','')}" for item in event_snippets
-    )
-
-    user_prompt = (
-        "Incident:\n"
-        f"{incident.model_dump()}\n\n"
-        "Event snippets (historical context):\n"
-        f"{snippets_text}\n\n"
-        "Global policy excerpt:\n"
-        f"{global_policy}\n\n"
-        "Analyze the incident and return JSON:\n"
+        "Return ONLY valid JSON matching the schema:\n"
         "{\n"
         '  "topic": "bug|billing|outage|account|fraud|policy|service|other",\n'
         '  "intent": "bug_report|complaint|refund_request|cancellation_threat|legal_threat|information_request|other",\n'
@@ -130,13 +129,32 @@ def extract_signals(
         '    "repeat_contact": true/false,\n'
         '    "high_reach": true/false,\n'
         '    "compliance_sensitive": true/false\n'
-        '  },\n'
+        "  },\n"
         '  "evidence": [{"source": "email", "timestamp": "2026-01-31T10:05:00Z", "quote": "exact quote from incident"}],\n'
         '  "summary": "One sentence summarizing the issue."\n'
-        "}"
+        "}\n\n"
+        "Global policy excerpt:\n"
+        f"{global_policy}"
+    )
+
+    snippets_text = "\n".join(
+        f"[{item.get('source','')}] {item.get('timestamp','')}: {item.get('text','')}" for item in event_snippets
+    )
+
+    # Everything static (instructions, schema, global policy) lives in the system
+    # prompt so local models can reuse its KV cache across incidents.
+    user_prompt = (
+        "Incident:\n"
+        f"{incident.model_dump()}\n\n"
+        "Event snippets (historical context):\n"
+        f"{snippets_text}\n\n"
+        "Analyze the incident and return the JSON."
     )
 
-    parsed = try_llm_json(client, [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+
+def _from_reply(incident: EventRecord, parsed: Optional[Dict]) -> SignalExtraction:
     if parsed:
         try:
             return SignalExtraction(**parsed)
@@ -147,4 +165,27 @@ def extract_signals(
     if strict:
         raise RuntimeError("LLM did not return valid JSON for signal extraction.")
 
+    AGENT_FALLBACKS.inc(agent="signal_extractor")
     return _heuristic_signals(incident)
+
+
+def extract_signals(
+    incident: EventRecord,
+    event_snippets: List[Dict[str, str]],
+    global_policy: str,
+    client: ChatClient | None = None,
+) -> SignalExtraction:
+    parsed = try_llm_json(client, _messages(incident, event_snippets, global_policy), schema=SignalExtraction)
+    return _from_reply(incident, parsed)
+
+
+def extract_signals_batch(
+    incidents: List[EventRecord],
+    event_snippets: List[List[Dict[str, str]]],
+    global_policy: str,
+    client: ChatClient | None = None,
+) -> List[SignalExtraction]:
+    """``extract_signals`` for many incidents with all generations submitted together."""
+    messages = [_messages(incident, snippets, global_policy) for incident, snippets in zip(incidents, event_snippets)]
+    replies = try_llm_json_many(client, messages, schema=SignalExtraction)
+    return [_from_reply(incident, parsed) for incident, parsed in zip(incidents, replies)]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict
+
+from .agents.signal_extractor import _heuristic_signals, heuristic_confidence
+from .routing import route_incident
+from .schemas import EventRecord, RiskScores, RoutingDecision, SignalExtraction
+from .scoring import score_risk
+
+PRIORITIES = ["P0", "P1", "P2", "P3"]
+
+HEURISTIC_TIER = "heuristic"
+LLM_TIER = "llm"
+
+
+def cascade_enabled() -> bool:
+    return os.getenv("PIPELINE_CASCADE", "false").lower() in {"1", "true", "yes"}
+
+
+class Triage:
+    """Keyword heuristics, scores and routing for an incident, computed without any LLM call."""
+
+    def __init__(self, signals: SignalExtraction, scores: RiskScores, routing: RoutingDecision, confidence: float):
+        self.signals = signals
+        self.scores = scores
+        self.routing = routing
+        self.confidence = confidence
+
+    @property
+    def fast_path(self) -> bool:
+        """True when the incident is low-risk and classified confidently enough to skip the LLM agents.
+
+        ``CASCADE_MAX_PRIORITY`` is the most urgent priority served by the heuristic
+        tier (``P3`` by default, so P0-P2 always escalate) and
+        ``CASCADE_MIN_CONFIDENCE`` the lowest acceptable ``heuristic_confidence``.
+        A topic or intent the keywords did not recognise (``other``) always escalates.
+        """
+        max_priority = os.getenv("CASCADE_MAX_PRIORITY", "P3").upper()
+        min_confidence = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.5"))
+        if max_priority not in PRIORITIES or self.routing.priority not in PRIORITIES:
+            return False
+        if self.signals.topic == "other" or self.signals.intent == "other":
+            return False
+        low_risk = PRIORITIES.index(self.routing.priority) >= PRIORITIES.index(max_priority)
+        return low_risk and self.confidence >= min_confidence
+
+
+def triage(incident: EventRecord) -> Triage:
+    signals = _heuristic_signals(incident)
+    scores = score_risk(signals, incident.metadata)
+    routing = route_incident(signals, scores)
+    return Triage(signals, scores, routing, heuristic_confidence(incident))
+
+
+class TierStats:
+    """Counts how many incidents each cascade tier served."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {HEURISTIC_TIER: 0, LLM_TIER: 0}
+
+    def record(self, tier: str) -> None:
+        with self._lock:
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "enabled": cascade_enabled(),
+            "total": total,
+            "tiers": {
+                tier: {"count": count, "fraction": round(count / total, 4) if total else 0.0}
+                for tier, count in counts.items()
+            },
+        }
+
+
+CASCADE_STATS = TierStats()
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import difflib
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set, Tuple
+
+from .agents.guardrails_verifier import merge_guardrails, verify_deterministic
+from .agents.reverse_prompt import evidence_line, key_considerations, situation_background
+from .cascade import PRIORITIES, triage
+from .metrics import COALESCED
+from .schemas import DashboardCard, EventRecord, EvidenceQuote, ReversePromptOutput, RiskScores, RoutingDecision, SignalExtraction
+from .scoring import priority_from_scores, score_risk
+
+try:  # Optional; difflib is used when rapidfuzz is not installed.
+    from rapidfuzz import fuzz
+except Exception:  # pragma: no cover - optional at runtime
+    fuzz = None
+
+COALESCED_TIER = "coalesced"
+
+# Intents that change how an incident must be handled, so they always get a fresh run.
+ESCALATING_INTENTS = {"legal_threat", "cancellation_threat", "refund_request"}
+
+_NUM_PERM = 32
+_BANDS = 8
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [((seed * 0x9E3779B1) % _PRIME or 1, (seed * 0x85EBCA6B + 1) % _PRIME) for seed in range(1, _NUM_PERM + 1)]
+
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"(?:^|\s)(?:rt\s+)?@\w+:?")
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def coalesce_enabled() -> bool:
+    return os.getenv("PIPELINE_COALESCE", "false").lower() in {"1", "true", "yes"}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, without URLs, @mentions/retweet markers and punctuation, so reposts compare equal."""
+    text = _MENTION.sub(" ", _URL.sub(" ", text.lower()))
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def similarity(left: str, right: str) -> float:
+    """0-100 similarity of two normalized texts, insensitive to word order."""
+    if fuzz is not None:
+        return fuzz.token_sort_ratio(left, right)
+    return difflib.SequenceMatcher(None, " ".join(sorted(left.split())), " ".join(sorted(right.split()))).ratio() * 100
+
+
+def minhash(text: str, width: int = 5) -> Tuple[int, ...]:
+    """MinHash signature over character shingles of a normalized text."""
+    shingles = {text[start : start + width] for start in range(max(1, len(text) - width + 1))}
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+    return tuple(min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * _ROWS : (band + 1) * _ROWS]) for band in range(_BANDS)]
+
+
+class _Entry:
+    """One processed (or in-flight) incident and everything coalesced into it."""
+
+    def __init__(self, entry_id: int, incident: EventRecord, text: str):
+        self.entry_id = entry_id
+        self.incident = incident
+        self.text = text
+        self.signature = minhash(text)
+        self.threads = {incident.thread_id}
+        fast = triage(incident)
+        self.intent = fast.signals.intent
+        self.priority = fast.routing.priority
+        self.updated = time.monotonic()
+        self.future: Future = Future()
+        self.card: Optional[DashboardCard] = None
+        self.lock = threading.Lock()
+
+
+class IncidentCoalescer:
+    """Finds incidents already being handled that a new one merely repeats.
+
+    Recent incidents are indexed by normalized text, by ``thread_id`` and by
+    MinHash LSH bands; band collisions are confirmed with a fuzzy match of at
+    least ``COALESCE_SIMILARITY``. A repeat is attached to the existing card
+    instead of running the pipeline. A follow-up on a known thread that is not
+    a near-duplicate is still attached unless it escalates (a more urgent
+    heuristic priority or a new escalating intent), in which case it gets a
+    fresh run. Entries expire after ``COALESCE_WINDOW_SECONDS``. With
+    ``THREAD_STATE`` on, the pipeline sends messages on a known thread to the
+    thread delta update instead and never claims them here.
+    """
+
+    def __init__(self):
+        self.window = float(os.getenv("COALESCE_WINDOW_SECONDS", "3600"))
+        self.threshold = float(os.getenv("COALESCE_SIMILARITY", "90"))
+        self.max_entries = int(os.getenv("COALESCE_MAX_ENTRIES", "10000"))
+        self.max_evidence = int(os.getenv("COALESCE_MAX_EVIDENCE", "10"))
+        self.viral_count = int(os.getenv("COALESCE_VIRAL_COUNT", "5"))
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_text: Dict[str, int] = {}
+        self._by_thread: Dict[str, int] = {}
+        self._by_band: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.window
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.updated >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._drop(entry)
+
+    def _drop(self, entry: _Entry) -> None:
+        self._entries.pop(entry.entry_id, None)
+        if self._by_text.get(entry.text) == entry.entry_id:
+            del self._by_text[entry.text]
+        for thread_id in entry.threads:
+            if self._by_thread.get(thread_id) == entry.entry_id:
+                del self._by_thread[thread_id]
+        for band in _bands(entry.signature):
+            members = self._by_band.get(band)
+            if members is not None:
+                members.discard(entry.entry_id)
+                if not members:
+                    del self._by_band[band]
+
+    def _near_duplicate(self, text: str) -> Optional[_Entry]:
+        candidates: Set[int] = set()
+        for band in _bands(minhash(text)):
+            candidates |= self._by_band.get(band, set())
+        best, best_score = None, self.threshold
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            score = similarity(text, entry.text)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _escalates(self, entry: _Entry, incident: EventRecord) -> bool:
+        fast = triage(incident)
+        more_urgent = PRIORITIES.index(fast.routing.priority) < PRIORITIES.index(entry.priority)
+        new_intent = fast.signals.intent in ESCALATING_INTENTS and fast.signals.intent != entry.intent
+        return more_urgent or new_intent
+
+    def knows_thread(self, thread_id: str) -> bool:
+        with self._lock:
+            return thread_id in self._by_thread
+
+    def claim(self, incident: EventRecord) -> Tuple[_Entry, bool]:
+        """The entry ``incident`` belongs to, and whether the caller must run the pipeline for it."""
+        text = normalize(incident.text)
+        with self._lock:
+            self._expire()
+            entry_id = self._by_text.get(text)
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            reason = "duplicate"
+            if entry is None:
+                entry = self._near_duplicate(text)
+            if entry is None and incident.thread_id in self._by_thread:
+                entry = self._entries[self._by_thread[incident.thread_id]]
+                reason = "thread"
+                if self._escalates(entry, incident):
+                    entry = None
+                    reason = "escalated"
+            if entry is not None:
+                entry.updated = time.monotonic()
+                self._entries.move_to_end(entry.entry_id)
+                # Follow-ups on a repeat's own thread belong here too.
+                entry.threads.add(incident.thread_id)
+                self._by_thread.setdefault(incident.thread_id, entry.entry_id)
+                COALESCED.inc(reason=reason)
+                return entry, False
+
+            self._next_id += 1
+            entry = _Entry(self._next_id, incident, text)
+            self._entries[entry.entry_id] = entry
+            self._by_text[text] = entry.entry_id
+            self._by_thread[incident.thread_id] = entry.entry_id
+            for band in _bands(entry.signature):
+                self._by_band.setdefault(band, set()).add(entry.entry_id)
+            if reason == "escalated":
+                COALESCED.inc(reason=reason)
+            return entry, True
+
+    def resolve(self, entry: _Entry, card: DashboardCard) -> None:
+        with entry.lock:
+            entry.card = card
+        entry.future.set_result(card)
+
+    def fail(self, entry: _Entry, exc: BaseException) -> None:
+        """Forget an entry whose pipeline run failed; waiting repeats see the error and run on their own."""
+        with self._lock:
+            self._drop(entry)
+        entry.future.set_exception(exc)
+
+    def attach(self, entry: _Entry, incident: EventRecord) -> DashboardCard:
+        """Add ``incident`` to the entry's card as extra evidence and return the updated card for ``incident``.
+
+        When the repeat raises the priority, the narrative sections that state it are
+        rewritten and the rule-based guardrails re-checked, as for a thread update.
+        """
+        entry.future.result()
+        with entry.lock:
+            card = entry.card
+            signals = card.signals.model_copy(deep=True)
+            evidence = EvidenceQuote(source=incident.source, timestamp=incident.timestamp, quote=incident.text[:240])
+            added = len(signals.evidence) < self.max_evidence
+            if added:
+                signals.evidence.append(evidence)
+            related = card.related_event_ids + [incident.event_id]
+            signals.signals.repeat_contact = True
+            if len(related) + 1 >= self.viral_count:
+                signals.signals.virality_threat = True
+
+            # Repeats only ever raise risk; the card keeps its team.
+            rescored = score_risk(signals, entry.incident.metadata)
+            scores = RiskScores(**{field: max(getattr(card.scores, field), getattr(rescored, field)) for field in RiskScores.model_fields})
+            priority = min(card.routing.priority, priority_from_scores(scores), key=PRIORITIES.index)
+            routing = card.routing.model_copy(update={"priority": priority})
+            reverse_prompt = _refresh_reverse_prompt(card, evidence if added else None, signals, scores, routing)
+
+            updated = card.model_copy(
+                update={
+                    "signals": signals,
+                    "scores": scores,
+                    "routing": routing,
+                    "reverse_prompt": reverse_prompt,
+                    "related_event_ids": related,
+                }
+            )
+            guardrails = merge_guardrails(card.guardrails, verify_deterministic(updated))
+            status = "ready" if guardrails.passed else "blocked"
+            entry.card = updated.model_copy(update={"guardrails": guardrails, "status": status})
+            # The stored card stays the leader's; the caller gets one for the repeat itself.
+            related = [entry.incident.event_id] + [event_id for event_id in related if event_id != incident.event_id]
+            return entry.card.model_copy(
+                update={"incident": incident, "related_event_ids": related, "tier": COALESCED_TIER, "trace": None}
+            )
+
+
+def _refresh_reverse_prompt(
+    card: DashboardCard,
+    evidence: Optional[EvidenceQuote],
+    signals: SignalExtraction,
+    scores: RiskScores,
+    routing: RoutingDecision,
+) -> ReversePromptOutput:
+    """The card's reverse prompt with the repeat's evidence and, if they changed, its risk and priority."""
+    prompt = card.reverse_prompt.employee_prompt
+    citations = dict(card.reverse_prompt.citations)
+    updates = {}
+    if evidence is not None:
+        updates["evidence_analysis"] = prompt.evidence_analysis + [evidence_line(evidence)]
+        sources = list(citations.get("evidence_sources", []))
+        citations["evidence_sources"] = sources + ([evidence.source] if evidence.source not in sources else [])
+    if routing != card.routing or scores != card.scores:
+        updates["situation_background"] = situation_background(routing, scores, signals)
+    if routing != card.routing:
+        updates["key_considerations"] = key_considerations(routing, signals)
+    return ReversePromptOutput(employee_prompt=prompt.model_copy(update=updates), citations=citations)
+
+
+COALESCER = IncidentCoalescer()
@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from .agents.llm_client import warm_start_models
+from .metrics import INGEST_EVENTS
+from .pipeline import process_incidents
+from .schemas import DashboardCard, EventRecord
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# One line read from a source: (file path or None for stdin, offset just past the line, raw line).
+# ``None`` items are heartbeats that let a partial micro-batch flush while a source is idle.
+_Line = Optional[Tuple[Optional[str], int, bytes]]
+
+
+def _default_checkpoint() -> Path:
+    return ROOT_DIR / "data" / "ingest" / "checkpoint.json"
+
+
+def _default_dead_letter() -> Path:
+    return ROOT_DIR / "data" / "ingest" / "dead_letter.jsonl"
+
+
+class Checkpoint:
+    """Byte offset per tailed file up to which every event has been processed.
+
+    Saved atomically as JSON after each committed batch. Events in flight when
+    the worker stops are read again on restart (at-least-once delivery).
+    """
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.offsets: Dict[str, int] = {}
+        if path is not None and path.exists():
+            self.offsets = json.loads(path.read_text(encoding="utf-8"))
+
+    def offset(self, source: str) -> int:
+        return self.offsets.get(source, 0)
+
+    def commit(self, offsets: Dict[str, int]) -> None:
+        self.offsets.update(offsets)
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_suffix(".tmp")
+        partial.write_text(json.dumps(self.offsets, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(partial, self.path)
+
+
+class _Committer:
+    """Commits batch offsets in read order, however the workers finish them."""
+
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._next = 0
+        self._done: Dict[int, Dict[str, int]] = {}
+
+    def done(self, seq: int, offsets: Dict[str, int]) -> None:
+        with self._lock:
+            self._done[seq] = offsets
+            ready: Dict[str, int] = {}
+            while self._next in self._done:
+                ready.update(self._done.pop(self._next))
+                self._next += 1
+            if ready:
+                self.checkpoint.commit(ready)
+
+
+class Throughput:
+    """Events processed, reported per interval and as the sustained rate since start."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self._mark = self.started
+        self._counts = {"processed": 0, "invalid": 0, "failed": 0}
+        self._since_mark = 0
+
+    def record(self, outcome: str, count: int) -> None:
+        if not count:
+            return
+        INGEST_EVENTS.inc(count, outcome=outcome)
+        with self._lock:
+            self._counts[outcome] += count
+            if outcome == "processed":
+                self._since_mark += count
+
+    def snapshot(self, reset: bool = False) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            interval = max(now - self._mark, 1e-9)
+            elapsed = max(now - self.started, 1e-9)
+            stats: Dict[str, float] = dict(self._counts)
+            stats["events_per_sec"] = round(self._since_mark / interval, 2)
+            stats["sustained_events_per_sec"] = round(self._counts["processed"] / elapsed, 2)
+            stats["elapsed_seconds"] = round(elapsed, 1)
+            if reset:
+                self._mark = now
+                self._since_mark = 0
+        return stats
+
+
+def _files(sources: List[Path]) -> List[Path]:
+    files: List[Path] = []
+    for source in sources:
+        files.extend(sorted(source.glob("*.jsonl")) if source.is_dir() else [source])
+    return [path for path in files if path.is_file()]
+
+
+def _complete(raw: bytes) -> bool:
+    """Whether a last line without its newline is whole JSON rather than a record still being written."""
+    try:
+        json.loads(raw)
+    except ValueError:
+        return False
+    return True
+
+
+def _tail(sources: List[Path], checkpoint: Checkpoint, follow: bool, poll: float, stop: threading.Event) -> Iterator[_Line]:
+    """Complete lines appended to the files (or ``*.jsonl`` in directories) since their checkpoint.
+
+    Directories are rescanned on every pass, so new files are picked up. A file
+    shorter than its offset was truncated or rotated and is read from the start.
+    """
+    offsets: Dict[str, int] = {}
+    while not stop.is_set():
+        progressed = False
+        for path in _files(sources):
+            name = str(path.resolve())
+            offset = offsets.get(name, checkpoint.offset(name))
+            if path.stat().st_size < offset:
+                logger.warning("%s shrank below its checkpoint; reading it from the start", name)
+                offset = 0
+            with path.open("rb") as handle:
+                handle.seek(offset)
+                for raw in handle:
+                    if not raw.endswith(b"\n") and not _complete(raw):
+                        break
+                    offset += len(raw)
+                    progressed = True
+                    yield name, offset, raw
+                    if stop.is_set():
+                        return
+            offsets[name] = offset
+        if not follow:
+            return
+        if not progressed:
+            yield None
+            stop.wait(poll)
+
+
+def _stdin(stream: TextIO, poll: float, stop: threading.Event) -> Iterator[_Line]:
+    """NDJSON lines from ``stream``; read on a helper thread so idle periods still flush batches."""
+    lines: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=1024)
+
+    def read() -> None:
+        for text in stream:
+            lines.put(text)
+        lines.put(None)
+
+    threading.Thread(target=read, name="ingest-stdin", daemon=True).start()
+    while not stop.is_set():
+        try:
+            text = lines.get(timeout=poll)
+        except queue.Empty:
+            yield None
+            continue
+        if text is None:
+            return
+        yield None, 0, text.encode("utf-8")
+
+
+def _batches(lines: Iterator[_Line], batch_size: int, max_wait: float, throughput: Throughput) -> Iterator[Tuple[List[EventRecord], Dict[str, int]]]:
+    """Validated micro-batches of at most ``batch_size`` events, flushed after ``max_wait`` seconds.
+
+    Invalid lines are logged, counted and skipped; their offsets still advance.
+    """
+    records: List[EventRecord] = []
+    offsets: Dict[str, int] = {}
+    pending = 0
+    opened = time.monotonic()
+    for line in lines:
+        if line is not None:
+            source, offset, raw = line
+            if source is not None:
+                offsets[source] = offset
+            pending += 1
+            if pending == 1:
+                opened = time.monotonic()
+            text = raw.decode("utf-8", errors="replace").strip()
+            if text:
+                try:
+                    records.append(EventRecord.model_validate_json(text))
+                except ValidationError as exc:
+                    throughput.record("invalid", 1)
+                    error = exc.errors()[0]
+                    logger.warning("Skipping invalid event at %s:%s: %s %s", source or "stdin", offset, error["msg"], list(error["loc"]))
+        if pending and (len(records) >= batch_size or line is None or time.monotonic() - opened >= max_wait):
+            yield records, offsets
+            records, offsets, pending = [], {}, 0
+    if pending:
+        yield records, offsets
+
+
+class IngestWorker:
+    """Feeds micro-batches of events through a bounded queue to a pool of pipeline workers.
+
+    The reader blocks once ``queue_depth`` batches are waiting, so a slow
+    pipeline throttles how fast sources are read instead of buffering them in
+    memory. Each worker runs ``process_incidents`` on one batch at a time and
+    writes the cards as JSONL to ``output``. A failing batch is retried
+    ``retries`` times with exponential backoff, then its events are appended to
+    ``dead_letter`` before its offsets are committed; a batch interrupted by a
+    shutdown is left uncommitted and read again on restart.
+    """
+
+    def __init__(
+        self,
+        output: TextIO,
+        checkpoint: Checkpoint,
+        dead_letter: Path,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        batch_wait: Optional[float] = None,
+        queue_depth: Optional[int] = None,
+        report_every: Optional[float] = None,
+    ):
+        self.output = output
+        self.checkpoint = checkpoint
+        self.dead_letter = dead_letter
+        self.retries = int(os.getenv("INGEST_RETRIES", "3"))
+        self.backoff = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "1.0"))
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", "16"))
+        self.batch_wait = batch_wait or float(os.getenv("INGEST_BATCH_WAIT_SECONDS", "0.5"))
+        self.queue_depth = queue_depth or int(os.getenv("INGEST_QUEUE_DEPTH", "8"))
+        self.report_every = report_every or float(os.getenv("INGEST_REPORT_SECONDS", "10"))
+        self.stop = threading.Event()
+        self.throughput = Throughput()
+        self._queue: "queue.Queue[Optional[Tuple[int, List[EventRecord], Dict[str, int]]]]" = queue.Queue(maxsize=self.queue_depth)
+        self._committer = _Committer(checkpoint)
+        self._output_lock = threading.Lock()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            seq, records, offsets = item
+            if records:
+                cards, error = self._process(records)
+                if cards is None:
+                    if self.stop.is_set() or not self._dead_letter(records, error):
+                        # Not committed, so the batch and everything after it is read again on restart.
+                        continue
+                    self.throughput.record("failed", len(records))
+                else:
+                    with self._output_lock:
+                        for card in cards:
+                            self.output.write(card.model_dump_json() + "\n")
+                        self.output.flush()
+                    self.throughput.record("processed", len(cards))
+            self._committer.done(seq, offsets)
+
+    def _process(self, records: List[EventRecord]) -> Tuple[Optional[List[DashboardCard]], str]:
+        """Cards for ``records``, or None and the last error once every attempt failed or the worker is stopping."""
+        error = ""
+        for attempt in range(self.retries + 1):
+            try:
+                return process_incidents(records), ""
+            except Exception as exc:
+                error = repr(exc)
+                logger.exception("Pipeline failed for events %s (attempt %d)", [record.event_id for record in records], attempt + 1)
+            if attempt < self.retries and self.stop.wait(self.backoff * 2**attempt):
+                break
+        return None, error
+
+    def _dead_letter(self, records: List[EventRecord], error: str) -> bool:
+        """Append events that kept failing to the dead-letter file; False (and stop) if that is impossible."""
+        failed_at = time.time()
+        try:
+            with self._output_lock:
+                self.dead_letter.parent.mkdir(parents=True, exist_ok=True)
+                with self.dead_letter.open("a", encoding="utf-8") as handle:
+                    for record in records:
+                        handle.write(json.dumps({"event": record.model_dump(), "error": error, "failed_at": failed_at}) + "\n")
+        except OSError:
+            logger.exception("Cannot write the dead-letter file %s; stopping", self.dead_letter)
+            self.stop.set()
+            return False
+        logger.error("Moved %d events to %s after %d attempts", len(records), self.dead_letter, self.retries + 1)
+        return True
+
+    def _report(self) -> None:
+        while not self.stop.wait(self.report_every):
+            stats = self.throughput.snapshot(reset=True)
+            logger.info(
+                "%.2f events/sec (sustained %.2f); processed=%d invalid=%d failed=%d queued_batches=%d",
+                stats["events_per_sec"],
+                stats["sustained_events_per_sec"],
+                stats["processed"],
+                stats["invalid"],
+                stats["failed"],
+                self._queue.qsize(),
+            )
+
+    def _enqueue(self, item: Tuple[int, List[EventRecord], Dict[str, int]]) -> bool:
+        while not self.stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, lines: Iterator[_Line]) -> Dict[str, float]:
+        threads = [threading.Thread(target=self._work, name=f"ingest-{index}") for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        threading.Thread(target=self._report, name="ingest-report", daemon=True).start()
+        try:
+            for seq, (records, offsets) in enumerate(_batches(lines, self.batch_size, self.batch_wait, self.throughput)):
+                if not self._enqueue((seq, records, offsets)):
+                    break
+        finally:
+            # Batches already queued are finished so their offsets are committed.
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+            self.stop.set()
+        return self.throughput.snapshot()
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, float]:
+    parser = argparse.ArgumentParser(description="Stream events from JSONL files or stdin through the incident pipeline.")
+    parser.add_argument("sources", nargs="*", default=["-"], help="JSONL files or directories to tail, or - for NDJSON on stdin.")
+    parser.add_argument("--output", default="-", help="File to append dashboard cards to as JSONL (default: stdout).")
+    parser.add_argument("--checkpoint", default=os.getenv("INGEST_CHECKPOINT_PATH", str(_default_checkpoint())))
+    parser.add_argument(
+        "--dead-letter",
+        default=os.getenv("INGEST_DEAD_LETTER_PATH", str(_default_dead_letter())),
+        help="JSONL file receiving events that still fail after every retry.",
+    )
+    parser.add_argument("--once", action="store_true", help="Process what the files hold now and exit instead of tailing them.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", stream=sys.stderr)
+
+    if os.getenv("AUTO_LOAD_MODELS", "false").lower() in {"1", "true", "yes"}:
+        warm_start_models()
+
+    from_stdin = args.sources == ["-"]
+    checkpoint = Checkpoint(None if from_stdin else Path(args.checkpoint))
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    worker = IngestWorker(output, checkpoint, Path(args.dead_letter), workers=args.workers, batch_size=args.batch_size)
+    poll = float(os.getenv("INGEST_POLL_SECONDS", "1.0"))
+
+    def shutdown(signum, frame) -> None:
+        logger.info("Stopping; finishing queued batches")
+        worker.stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    if from_stdin:
+        lines = _stdin(sys.stdin, poll, worker.stop)
+    else:
+        lines = _tail([Path(source) for source in args.sources], checkpoint, not args.once, poll, worker.stop)
+    try:
+        stats = worker.run(lines)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logger.info(
+        "Processed %d events (%d invalid, %d failed) in %.1fs: %.2f events/sec sustained",
+        stats["processed"],
+        stats["invalid"],
+        stats["failed"],
+        stats["elapsed_seconds"],
+        stats["sustained_events_per_sec"],
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    main()
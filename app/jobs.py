@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import JOB_ITEMS
+from .pipeline import PIPELINE_EXECUTOR, PipelineQueueTimeout, PipelineSaturated, process_incident, process_incidents
+from .schemas import DashboardCard, EventRecord
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ITEM_PENDING = "pending"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+# Called once every item of a job has finished, with its events and cards in submission order.
+Finalizer = Callable[[List[EventRecord], List[DashboardCard]], Dict[str, Any]]
+
+_JOB_STORE: Optional["JobStore"] = None
+_JOB_STORE_LOCK = threading.Lock()
+
+
+class _Stopping(Exception):
+    """The store was stopped while a worker waited for pipeline capacity."""
+
+
+class JobStore:
+    """Durable batch jobs: every event of a job is an item that workers claim, process and store.
+
+    Jobs and items live in a SQLite file, so a job survives restarts and may be
+    worked on by every API process on the host. Items are claimed in batches
+    under a lease of ``lease_seconds``; an item whose worker died is claimed
+    again once its lease runs out, while finished items keep their stored card
+    and are never recomputed. Each finished item gets the next ``seq`` of its
+    job, which clients use as a cursor for partial results.
+    """
+
+    def __init__(self, path: Path, workers: int = 2, batch_size: int = 8, lease_seconds: float = 900, poll_seconds: float = 1.0):
+        self.path = Path(path)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._finalizers: Dict[str, Finalizer] = {}
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, event TEXT NOT NULL, status TEXT NOT NULL, "
+            "card TEXT, error TEXT, seq INTEGER, lease_until REAL, PRIMARY KEY (job_id, idx))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_until)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_seq ON items (job_id, seq)")
+
+    def register(self, kind: str, finalize: Finalizer) -> None:
+        """Run ``finalize`` when a job of ``kind`` completes and store what it returns as the job result."""
+        self._finalizers[kind] = finalize
+
+    def _transaction(self, work: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return value
+
+    def submit(self, kind: str, incidents: List[EventRecord]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert() -> None:
+            self._db.execute(
+                "INSERT INTO jobs (job_id, kind, status, total, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, len(incidents), now, now),
+            )
+            self._db.executemany(
+                "INSERT INTO items (job_id, idx, event, status) VALUES (?, ?, ?, ?)",
+                [(job_id, index, incident.model_dump_json(), ITEM_PENDING) for index, incident in enumerate(incidents)],
+            )
+
+        self._transaction(insert)
+        if not incidents:
+            self._finalize(job_id)
+        self._wake.set()
+        return job_id
+
+    def _claim(self) -> List[Tuple[str, int, EventRecord]]:
+        """Up to ``batch_size`` pending (or abandoned) items, oldest first, leased to this worker."""
+        now = time.time()
+
+        def claim() -> List[Tuple[str, int, str]]:
+            rows = self._db.execute(
+                "SELECT rowid, job_id, idx, event FROM items "
+                "WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY rowid LIMIT ?",
+                (ITEM_PENDING, ITEM_RUNNING, now, self.batch_size),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE items SET status = ?, lease_until = ? WHERE rowid = ?",
+                [(ITEM_RUNNING, now + self.lease_seconds, row[0]) for row in rows],
+            )
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, updated = ? WHERE job_id = ? AND status = ?",
+                [(JOB_RUNNING, now, job_id, JOB_QUEUED) for job_id in {row[1] for row in rows}],
+            )
+            return [(job_id, index, event) for _, job_id, index, event in rows]
+
+        return [(job_id, index, EventRecord.model_validate_json(event)) for job_id, index, event in self._transaction(claim)]
+
+    def _finish(self, job_id: str, index: int, card: Optional[DashboardCard], error: Optional[str]) -> bool:
+        """Store one item's outcome; True when it was the last unfinished item of its job."""
+        status = ITEM_DONE if card is not None else ITEM_FAILED
+
+        def finish() -> bool:
+            row = self._db.execute("SELECT status FROM items WHERE job_id = ? AND idx = ?", (job_id, index)).fetchone()
+            if row is None or row[0] in (ITEM_DONE, ITEM_FAILED):
+                # Another process finished it after our lease ran out.
+                return False
+            total, completed, failed = self._db.execute(
+                "SELECT total, completed, failed FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            self._db.execute(
+                "UPDATE items SET status = ?, card = ?, error = ?, seq = ?, lease_until = NULL WHERE job_id = ? AND idx = ?",
+                (status, card.model_dump_json() if card is not None else None, error, completed + failed + 1, job_id, index),
+            )
+            column = "completed" if card is not None else "failed"
+            self._db.execute(f"UPDATE jobs SET {column} = {column} + 1, updated = ? WHERE job_id = ?", (time.time(), job_id))
+            return completed + failed + 1 == total
+
+        last = self._transaction(finish)
+        JOB_ITEMS.inc(status=status)
+        return last
+
+    def _release(self, batch: List[Tuple[str, int, EventRecord]]) -> None:
+        """Hand unfinished items back so a restarted process need not wait out their lease."""
+
+        def release() -> None:
+            self._db.executemany(
+                "UPDATE items SET status = ?, lease_until = NULL WHERE job_id = ? AND idx = ? AND status = ?",
+                [(ITEM_PENDING, job_id, index, ITEM_RUNNING) for job_id, index, _ in batch],
+            )
+
+        try:
+            self._transaction(release)
+        except sqlite3.OperationalError:
+            logger.exception("Releasing job items failed; they are claimed again once their lease runs out")
+
+    def _finalize(self, job_id: str) -> None:
+        with self._lock:
+            kind = self._db.execute("SELECT kind FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT event, card FROM items WHERE job_id = ? AND status = ? ORDER BY idx", (job_id, ITEM_DONE)
+            ).fetchall()
+        status, result, error = JOB_DONE, None, None
+        finalize = self._finalizers.get(kind)
+        if finalize is not None:
+            try:
+                result = json.dumps(
+                    finalize(
+                        [EventRecord.model_validate_json(event) for event, _ in rows],
+                        [DashboardCard.model_validate_json(card) for _, card in rows],
+                    )
+                )
+            except Exception as exc:
+                logger.exception("Finalizing job %s failed", job_id)
+                status, error = JOB_FAILED, str(exc)
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE job_id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run ``func`` on ``PIPELINE_EXECUTOR``, waiting while it is saturated so API requests keep priority."""
+        while not self._stop.is_set():
+            try:
+                return PIPELINE_EXECUTOR.call(func, *args)
+            except (PipelineSaturated, PipelineQueueTimeout):
+                self._stop.wait(self.poll_seconds)
+        raise _Stopping()
+
+    def _process(self, batch: List[Tuple[str, int, EventRecord]]) -> None:
+        incidents = [incident for _, _, incident in batch]
+        try:
+            try:
+                outcomes: List[Tuple[Optional[DashboardCard], Optional[str]]] = [
+                    (card, None) for card in self._run(process_incidents, incidents)
+                ]
+            except _Stopping:
+                raise
+            except Exception:
+                # Retry one by one so a single bad event does not fail the whole batch.
+                outcomes = []
+                for incident in incidents:
+                    try:
+                        outcomes.append((self._run(process_incident, incident), None))
+                    except _Stopping:
+                        raise
+                    except Exception as exc:
+                        logger.exception("Job item %s failed", incident.event_id)
+                        outcomes.append((None, str(exc)))
+        except _Stopping:
+            self._release(batch)
+            return
+        for (job_id, index, _), (card, error) in zip(batch, outcomes):
+            if self._finish(job_id, index, card, error):
+                self._finalize(job_id)
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = self._claim()
+            except sqlite3.OperationalError:
+                logger.exception("Claiming job items failed")
+                batch = []
+            if not batch:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            try:
+                self._process(batch)
+            except Exception:
+                # Items left unfinished are claimed again once their lease runs out.
+                logger.exception("Processing job items failed")
+
+    def _recover(self) -> None:
+        """Finalize jobs whose items all finished before a restart interrupted their finalization."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) AND completed + failed = total", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        for (job_id,) in rows:
+            self._finalize(job_id)
+
+    def start(self) -> None:
+        if self._threads or self.workers <= 0:
+            return
+        self._recover()
+        self._threads = [threading.Thread(target=self._work, name=f"jobs-{index}", daemon=True) for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers, waiting up to ``timeout`` seconds each for their current batch."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get(self, job_id: str, after: int = 0) -> Optional[Dict[str, Any]]:
+        """Job progress and the items finished after cursor ``after`` (their ``seq``), in completion order."""
+        with self._lock:
+            job = self._db.execute(
+                "SELECT kind, status, total, completed, failed, result, error, created, updated FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._db.execute(
+                "SELECT idx, event, status, card, error, seq FROM items WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        kind, status, total, completed, failed, result, error, created, updated = job
+        items = [
+            {
+                "index": index,
+                "event_id": json.loads(event)["event_id"],
+                "status": item_status,
+                "seq": seq,
+                "card": DashboardCard.model_validate_json(card) if card is not None else None,
+                "error": item_error,
+            }
+            for index, event, item_status, card, item_error, seq in rows
+        ]
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "cursor": items[-1]["seq"] if items else after,
+            "items": items,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "created": created,
+            "updated": updated,
+        }
+
+
+def _default_path() -> Path:
+    return Path(__file__).resolve().parents[1] / "data" / "jobs" / "jobs.sqlite"
+
+
+def job_store() -> JobStore:
+    global _JOB_STORE
+    with _JOB_STORE_LOCK:
+        if _JOB_STORE is None:
+            _JOB_STORE = JobStore(
+                Path(os.getenv("JOBS_PATH", str(_default_path()))),
+                workers=int(os.getenv("JOBS_WORKERS", "2")),
+                batch_size=int(os.getenv("JOBS_BATCH_SIZE", "8")),
+                lease_seconds=float(os.getenv("JOBS_LEASE_SECONDS", "900")),
+                poll_seconds=float(os.getenv("JOBS_POLL_SECONDS", "1.0")),
+            )
+        return _JOB_STORE
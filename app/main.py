@@ -1,15 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import os
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
-from fastapi import FastAPI, HTTPException, Path
+from fastapi import FastAPI, Header, HTTPException, Path, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from .agents.llm_client import warm_start_models
-from .pipeline import process_incident
-from .rag.retrieve import build_indexes, load_events
-from .schemas import CleanDemoCard, DashboardCard, EventRecord
+from .agents.llm_client import prefix_cache_stats, try_llm_json, warm_start_models
+from .agents.response_cache import response_cache_stats
+from .cascade import CASCADE_STATS
+from .jobs import JOB_DONE, JOB_FAILED, job_store
+from .metrics import PROMETHEUS_CONTENT_TYPE, render_metrics
+from .pipeline import (
+    PIPELINE_EXECUTOR,
+    PipelineQueueTimeout,
+    PipelineSaturated,
+    _client_from_env,
+    process_batch_async,
+    process_incident_async,
+)
+from .rag.index_build import build_indexes, update_indexes
+from .rag.retrieve import embedding_cache_stats, load_events
+from .schemas import BatchAnalysis, CleanDemoCard, DashboardCard, EventRecord, IncidentCluster
 
 app = FastAPI(title="Customer Incident Radar", version="0.1.0")
 
@@ -18,10 +33,32 @@ class ProcessRequest(BaseModel):
     limit: Optional[int] = 5
 
 
+class JobRequest(BaseModel):
+    events: Optional[List[EventRecord]] = None  # Defaults to the first `limit` samples
+    limit: Optional[int] = 5
+    collective: bool = False
+
+
+@app.exception_handler(PipelineSaturated)
+async def pipeline_saturated(request: Request, exc: PipelineSaturated) -> JSONResponse:
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(PipelineQueueTimeout)
+async def pipeline_queue_timeout(request: Request, exc: PipelineQueueTimeout) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
 @app.get("/health")
 async def health() -> dict:
     """Health check endpoint"""
-    return {"status": "ok"}
+    return {"status": "ok", "pipeline": PIPELINE_EXECUTOR.stats(), "cascade": CASCADE_STATS.snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Stage latencies, token counts, LLM retries/fallbacks and index search times in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.on_event("startup")
@@ -31,13 +68,26 @@ async def load_models() -> None:
         warm_start_models()
 
 
+@app.on_event("startup")
+async def start_job_workers() -> None:
+    store = job_store()
+    store.register("collective", lambda incidents, cards: _collective_analysis([incident.model_dump() for incident in incidents], cards).model_dump())
+    store.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers() -> None:
+    timeout = float(os.getenv("JOBS_SHUTDOWN_TIMEOUT_SECONDS", "30"))
+    await asyncio.to_thread(job_store().stop, timeout)
+
+
 # ========== Core Processing Endpoints ==========
 
 
 @app.post("/process", response_model=CleanDemoCard)
 async def process_custom_incident(incident: EventRecord) -> CleanDemoCard:
     """Process a custom incident and return structured analysis"""
-    card = process_incident(incident)
+    card = await process_incident_async(incident)
     return _format_clean_card(card)
 
 
@@ -56,7 +106,7 @@ async def process_by_event_id(
         )
     
     incident = EventRecord(**event_data)
-    card = process_incident(incident)
+    card = await process_incident_async(incident)
     return _format_clean_card(card)
 
 
@@ -68,21 +118,14 @@ async def process_multiple(request: ProcessRequest) -> List[CleanDemoCard]:
         raise HTTPException(status_code=404, detail="No sample events found")
     
     limit = request.limit or 5
-    clean_cards = []
-    
-    for event in events[:limit]:
-        card = process_incident(EventRecord(**event))
-        clean_cards.append(_format_clean_card(card))
-    
-    return clean_cards
+    incidents = [EventRecord(**event) for event in events[:limit]]
+    cards = await process_batch_async(incidents)
+    return [_format_clean_card(card) for card in cards]
 
 
 @app.post("/process/batch/collective")
 async def process_collective_batch(request: ProcessRequest) -> dict:
     """Process multiple incidents collectively with pattern detection and aggregate analysis"""
-    from .schemas import BatchAnalysis, IncidentCluster
-    from collections import defaultdict
-    
     events = load_events()
     if not events:
         raise HTTPException(status_code=404, detail="No sample events found")
@@ -91,16 +134,21 @@ async def process_collective_batch(request: ProcessRequest) -> dict:
     selected_events = events[:limit]
     
     # Process all events individually first
-    dashboard_cards = []
-    clean_cards = []
-    for event in selected_events:
-        card = process_incident(EventRecord(**event))
-        dashboard_cards.append(card)
-        clean_cards.append(_format_clean_card(card))
+    incidents = [EventRecord(**event) for event in selected_events]
+    dashboard_cards = await process_batch_async(incidents)
+    # The analysis makes a long LLM call; keep it off the event loop like the per-incident work.
+    analysis = await PIPELINE_EXECUTOR.run(_collective_analysis, selected_events, dashboard_cards)
+    return analysis.dict()
+
+
+def _collective_analysis(selected_events: List[dict], dashboard_cards: List[DashboardCard]) -> BatchAnalysis:
+    """Cluster already processed incidents and aggregate their risks, shared by the batch endpoint and collective jobs"""
+    from collections import defaultdict
+    
+    clean_cards = [_format_clean_card(card) for card in dashboard_cards]
     
     # Collective analysis
-    from .agents.llm_client import get_local_client
-    client = get_local_client()
+    client = _client_from_env("COLLECTIVE", "Qwen/Qwen2.5-32B-Instruct", 0.3, 1500)
     
     # Build comprehensive incident summaries with all analysis data
     incident_summaries = []
@@ -172,17 +220,8 @@ Respond in this exact JSON format (use event indices 0-{len(incident_summaries)-
   "team_alerts": {{"Finance": "5 billing incidents with High/Critical priority", "Development/IT": "System bug causing duplicate charges", "Legal": "2 policy violations requiring immediate remediation"}}
 }}"""
     
-    import json
-    response = client.chat.completions.create(
-        model="local-model",
-        messages=[{"role": "user", "content": pattern_prompt}],
-        temperature=0.3,
-        max_tokens=1500,
-    )
-    
-    try:
-        analysis_json = json.loads(response.choices[0].message.content.strip())
-    except:
+    analysis_json = try_llm_json(client, [{"role": "user", "content": pattern_prompt}])
+    if analysis_json is None:
         # Fallback if LLM doesn't return valid JSON
         analysis_json = {
             "clusters": [],
@@ -218,7 +257,7 @@ Respond in this exact JSON format (use event indices 0-{len(incident_summaries)-
     
     # Average the risks
     for key in aggregate_risks:
-        aggregate_risks[key] = round(aggregate_risks[key] / len(clean_cards))
+        aggregate_risks[key] = round(aggregate_risks[key] / len(clean_cards)) if clean_cards else 0
     
     # Find highest risk events
     risk_scores_per_event = []
@@ -255,7 +294,65 @@ Respond in this exact JSON format (use event indices 0-{len(incident_summaries)-
         team_alerts=analysis_json.get("team_alerts", {})
     )
     
-    return batch_analysis.dict()
+    return batch_analysis
+
+
+# ========== Job Endpoints ==========
+
+
+def _job_view(job: dict) -> dict:
+    items = [
+        {**item, "card": _format_clean_card(item["card"]).model_dump() if item["card"] is not None else None}
+        for item in job["items"]
+    ]
+    return {**job, "items": items}
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest) -> dict:
+    """Queue incidents (given events or the first `limit` samples) for background processing and return the job id"""
+    if request.events is not None:
+        incidents = request.events
+    else:
+        events = load_events()
+        if not events:
+            raise HTTPException(status_code=404, detail="No sample events found")
+        incidents = [EventRecord(**event) for event in events[: request.limit or 5]]
+    kind = "collective" if request.collective else "batch"
+    job_id = await asyncio.to_thread(job_store().submit, kind, incidents)
+    return {"job_id": job_id, "kind": kind, "total": len(incidents), "status_url": f"/jobs/{job_id}", "stream_url": f"/jobs/{job_id}/stream"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, after: int = 0) -> dict:
+    """Job progress and the cards completed after the `after` cursor (pass back the returned `cursor` to page)"""
+    job = await asyncio.to_thread(job_store().get, job_id, after)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return _job_view(job)
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, request: Request, after: int = 0, last_event_id: Optional[int] = Header(None)) -> StreamingResponse:
+    """Server-sent events: an `item` event per completed incident as it finishes, then `done` (reconnects resume via Last-Event-ID)"""
+    store = job_store()
+    if await asyncio.to_thread(store.status, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    poll = float(os.getenv("JOBS_STREAM_POLL_SECONDS", "0.5"))
+
+    async def events() -> AsyncIterator[str]:
+        cursor = max(after, last_event_id or 0)
+        while not await request.is_disconnected():
+            job = _job_view(await asyncio.to_thread(store.get, job_id, cursor))
+            for item in job.pop("items"):
+                cursor = item["seq"]
+                yield f"id: {cursor}\nevent: item\ndata: {json.dumps(item)}\n\n"
+            if job["status"] in (JOB_DONE, JOB_FAILED):
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+            await asyncio.sleep(poll)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 # ========== Utility Endpoints ==========
@@ -276,7 +373,7 @@ async def list_available_samples() -> List[dict]:
 
 
 @app.post("/models/download")
-async def download_models() -> dict:
+def download_models() -> dict:
     """Download and load AI models into memory"""
     try:
         warm_start_models()
@@ -285,16 +382,36 @@ async def download_models() -> dict:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.get("/models/prefix-cache")
+async def prefix_cache() -> dict:
+    """Entries, bytes and hit counters of each loaded model's prompt-prefix KV cache"""
+    return prefix_cache_stats()
+
+
+@app.get("/models/response-cache")
+async def response_cache() -> dict:
+    """Entries, size and hit rate of the agent response cache"""
+    return response_cache_stats()
+
+
 @app.post("/indexes/build")
-async def build_rag_indexes() -> dict:
-    """Build RAG indexes from playbooks and sample data"""
+def build_rag_indexes(full: bool = False) -> dict:
+    """Ingest new sample events and changed playbooks into the RAG indexes (full=true rebuilds)"""
     try:
+        if not full:
+            return update_indexes()
         event_count, playbook_count = build_indexes()
         return {"events": event_count, "playbooks": playbook_count}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.get("/indexes/embedding-cache")
+async def embedding_cache() -> dict:
+    """Hit/miss counters for the on-disk embedding cache"""
+    return embedding_cache_stats()
+
+
 # ========== Helper Functions ==========
 
 
@@ -309,7 +426,7 @@ def _format_clean_card(card: DashboardCard) -> CleanDemoCard:
         risk_scores=card.scores,
         reverse_prompt=card.reverse_prompt.employee_prompt,
     )
-async def download_models() -> dict:
+def download_models() -> dict:
     try:
         warm_start_models()
         return {"status": "success", "message": "Models downloaded and loaded successfully"}
@@ -318,8 +435,10 @@ async def download_models() -> dict:
 
 
 @app.post("/indexes/build")
-async def build_rag_indexes() -> dict:
+def build_rag_indexes(full: bool = False) -> dict:
     try:
+        if not full:
+            return update_indexes()
         event_count, playbook_count = build_indexes()
         return {"events": event_count, "playbooks": playbook_count}
     except Exception as exc:
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; spans a cached embedding lookup up to a long 32B generation.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_REGISTRY: List["_Metric"] = []
+
+
+class _Metric:
+    """A labelled metric that only does a dict update under a lock when recorded.
+
+    All formatting happens in ``render``, i.e. only when ``/metrics`` is scraped.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative counts per bucket (+Inf last), sum, count.
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            entry[0][slot] += 1
+            entry[1][0] += value
+            entry[1][1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), list(totals)) for key, (counts, totals) in self._values.items()}
+        lines = []
+        for key, (counts, (total, count)) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {_number(count)}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("rpm_stage_duration_seconds", "Duration of each pipeline stage.", ["graph", "stage"])
+PIPELINE_SECONDS = Histogram("rpm_pipeline_duration_seconds", "End-to-end duration of a pipeline run.", ["graph"])
+COALESCED = Counter(
+    "rpm_coalesced_total", "Incidents attached to an existing card (duplicate, thread) or re-run because they escalated.", ["reason"]
+)
+INCIDENTS = Counter("rpm_incidents_total", "Incidents processed, by cascade tier and card status.", ["tier", "status"])
+JOB_ITEMS = Counter("rpm_job_items_total", "Batch job items finished, by status.", ["status"])
+INGEST_EVENTS = Counter("rpm_ingest_events_total", "Events read by the streaming ingestion worker, by outcome.", ["outcome"])
+
+LLM_JSON_ATTEMPTS = Counter("rpm_llm_json_attempts_total", "Agent LLM calls, by schema and outcome.", ["schema", "outcome"])
+LLM_JSON_RETRIES = Counter("rpm_llm_json_retries_total", "Agent LLM calls repeated after an unusable reply.", ["schema"])
+LLM_JSON_FAILURES = Counter("rpm_llm_json_failures_total", "Agent calls that returned no usable JSON after all attempts.", ["schema"])
+LLM_CACHE_LOOKUPS = Counter("rpm_llm_cache_lookups_total", "Agent response cache lookups, by agent and hit/miss.", ["agent", "outcome"])
+AGENT_FALLBACKS = Counter("rpm_agent_fallbacks_total", "Deterministic fallbacks used because the LLM reply was unusable.", ["agent"])
+
+LLM_PROMPT_TOKENS = Counter("rpm_llm_prompt_tokens_total", "Prompt tokens sent to a model.", ["model"])
+LLM_COMPLETION_TOKENS = Counter("rpm_llm_completion_tokens_total", "Completion tokens generated by a model.", ["model"])
+LLM_GENERATION_SECONDS = Histogram("rpm_llm_generation_seconds", "Duration of one generate call or API request.", ["model"])
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rpm_llm_tokens_per_second", "Completion tokens per second of one generate call or API request.", ["model"], THROUGHPUT_BUCKETS
+)
+LLM_BATCH_SIZE = Histogram("rpm_llm_batch_size", "Requests decoded together per local generate call.", ["model"], SIZE_BUCKETS)
+
+EMBED_SECONDS = Histogram("rpm_embedding_seconds", "Duration of query embedding, cache lookups included.")
+INDEX_SEARCH_SECONDS = Histogram("rpm_index_search_seconds", "Duration of an index search.", ["index"])
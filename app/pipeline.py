@@ -1,17 +1,35 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from .agents.guardrails_verifier import verify_guardrails
-from .agents.llm_client import get_local_client
-from .agents.reverse_prompt import generate_reverse_prompt
-from .agents.signal_extractor import extract_signals
-from .rag.retrieve import retrieve_events, retrieve_playbooks
+from .agents.guardrails_verifier import merge_guardrails, verify_deterministic, verify_guardrails, verify_guardrails_batch
+from .agents.llm_client import get_api_client, get_local_client, llm_backend
+from .agents.response_cache import with_response_cache
+from .agents.reverse_prompt import _deterministic_prompt, generate_reverse_prompt, generate_reverse_prompt_batch
+from .agents.signal_extractor import extract_signals, extract_signals_batch
+from .cascade import CASCADE_STATS, HEURISTIC_TIER, LLM_TIER, Triage, cascade_enabled, triage
+from .coalesce import COALESCED_TIER, COALESCER, coalesce_enabled
+from .metrics import INCIDENTS
+from .rag.retrieve import RetrievalContext
 from .routing import route_incident
 from .scoring import score_risk
-from .schemas import DashboardCard, EventRecord, GuardrailResult
+from .schemas import DashboardCard, EventRecord, GuardrailResult, ThreadState
+from .stages import StageGraph
+from .threads import (
+    THREAD_TIER,
+    advance,
+    merge_signals,
+    new_state,
+    thread_state_enabled,
+    thread_store,
+    update_reverse_prompt,
+)
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 DATA_DIR = (ROOT_DIR / ".." / "data").resolve()
@@ -26,31 +44,31 @@ def _load_global_policy() -> str:
 
 _GLOBAL_POLICY = _load_global_policy()
 
+EVENT_TOP_K = 6
+PLAYBOOK_TOP_K = 3
+
 
 def _client_from_env(prefix: str, default_model: str, default_temperature: float, default_max_tokens: int):
     model = os.getenv(f"{prefix}_MODEL", default_model)
     temperature = float(os.getenv(f"{prefix}_TEMPERATURE", str(default_temperature)))
     max_tokens = int(os.getenv(f"{prefix}_MAX_TOKENS", str(default_max_tokens)))
-    return get_local_client(model=model, temperature=temperature, max_tokens=max_tokens)
-
-
-def process_incident(incident: EventRecord) -> DashboardCard:
-    event_snippets = retrieve_events(incident.text, top_k=6)
-    global_policy = _GLOBAL_POLICY
-
-    signal_client = _client_from_env("AGENT1", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
-    signals = extract_signals(incident, event_snippets, global_policy, client=signal_client)
+    if llm_backend() == "openai":
+        client = get_api_client(model=model, temperature=temperature, max_tokens=max_tokens)
+    else:
+        client = get_local_client(model=model, temperature=temperature, max_tokens=max_tokens)
+    return with_response_cache(client, prefix)
 
-    scores = score_risk(signals, incident.metadata)
-    routing = route_incident(signals, scores)
 
-    # Retrieve from ALL playbooks without team filtering for comprehensive policy coverage
-    playbook_snippets = retrieve_playbooks(incident.text, team=None, top_k=3)
+def retrieval_contexts(incidents: List[EventRecord]) -> List[RetrievalContext]:
+    """Embed all incidents in one pass and run one search per index for the whole batch."""
+    context = RetrievalContext.from_queries([incident.text for incident in incidents])
+    context.events(top_k=EVENT_TOP_K)
+    context.playbooks(team=None, top_k=PLAYBOOK_TOP_K)
+    return [context.row(position) for position in range(len(incidents))]
 
-    reverse_client = _client_from_env("AGENT3", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
-    reverse_prompt = generate_reverse_prompt(routing, scores, signals, playbook_snippets, event_snippets, client=reverse_client)
 
-    temp_card = DashboardCard(
+def _build_card(incident: EventRecord, signals, scores, routing, reverse_prompt) -> DashboardCard:
+    return DashboardCard(
         incident=incident,
         signals=signals,
         scores=scores,
@@ -60,17 +78,403 @@ def process_incident(incident: EventRecord) -> DashboardCard:
         status="pending",
     )
 
+
+def _verify(card: DashboardCard) -> GuardrailResult:
     guard_client = _client_from_env("GUARDRAILS", "Qwen/Qwen2.5-1.5B-Instruct", 0.1, 400)
-    guardrails = verify_guardrails(temp_card, client=guard_client)
+    return verify_guardrails(card, client=guard_client)
+
+
+def process_incident(incident: EventRecord, context: Optional[RetrievalContext] = None) -> DashboardCard:
+    """Process one incident, or attach it to the card of an incident it repeats when coalescing is on."""
+    if not coalesce_enabled() or _follows_thread(incident):
+        return _run_incident(incident, context)
+    entry, leader = COALESCER.claim(incident)
+    if not leader:
+        try:
+            return _coalesced(entry, incident)
+        except Exception:
+            # The run it was waiting for failed; handle this one on its own.
+            return _run_incident(incident, context)
+    try:
+        card = _run_incident(incident, context)
+    except BaseException as exc:
+        COALESCER.fail(entry, exc)
+        raise
+    COALESCER.resolve(entry, card)
+    return card
+
+
+def _follows_thread(incident: EventRecord) -> bool:
+    """With ``THREAD_STATE`` on, a message on a known thread gets the thread delta update, not coalescing."""
+    if not thread_state_enabled():
+        return False
+    return COALESCER.knows_thread(incident.thread_id) or thread_store().get(incident.thread_id) is not None
+
+
+def _coalesced(entry, incident: EventRecord) -> DashboardCard:
+    card = COALESCER.attach(entry, incident)
+    CASCADE_STATS.record(COALESCED_TIER)
+    INCIDENTS.inc(tier=COALESCED_TIER, status=card.status)
+    return card
+
+
+def _run_incident(incident: EventRecord, context: Optional[RetrievalContext] = None) -> DashboardCard:
+    """Run the pipeline, or fold the incident into its thread's card when ``THREAD_STATE`` is on."""
+    if not thread_state_enabled():
+        return _run_graph(incident, context)[0]
+    store = thread_store()
+    with store.lock(incident.thread_id):
+        state = store.get(incident.thread_id)
+        if state is not None:
+            card = _update_thread(state, incident)
+            store.put(advance(state, incident, card))
+            return card
+        card, results = _run_graph(incident, context)
+        store.put(new_state(card, results["events"], results["playbooks"]))
+        return card
+
+
+def _update_thread(state: ThreadState, incident: EventRecord) -> DashboardCard:
+    """Delta update of a thread's card from one new message, reusing the thread's retrieved context.
+
+    Only the new message goes through signal extraction; scores and routing are
+    recomputed from the merged signals and only the affected reverse-prompt
+    sections are rewritten, so the cost does not grow with the thread.
+    """
+    previous = state.card
+
+    def extract():
+        if cascade_enabled():
+            fast = triage(incident)
+            if fast.fast_path:
+                return fast.signals
+        signal_client = _client_from_env("AGENT1", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
+        return extract_signals(incident, state.event_snippets, _GLOBAL_POLICY, client=signal_client)
 
+    def card(signals, scores, routing, reverse_prompt):
+        return previous.model_copy(
+            update={
+                "incident": incident,
+                "signals": signals,
+                "scores": scores,
+                "routing": routing,
+                "reverse_prompt": reverse_prompt,
+                "related_event_ids": state.event_ids,
+            }
+        )
+
+    graph = StageGraph("thread")
+    graph.add("latest", extract)
+    graph.add("signals", lambda latest: merge_signals(previous.signals, latest), ["latest"])
+    graph.add("scores", lambda signals: score_risk(signals, incident.metadata or previous.incident.metadata), ["signals"])
+    graph.add("routing", route_incident, ["signals", "scores"])
+    graph.add(
+        "reverse_prompt",
+        lambda latest, signals, scores, routing: update_reverse_prompt(previous, latest, signals, scores, routing),
+        ["latest", "signals", "scores", "routing"],
+    )
+    graph.add("card", card, ["signals", "scores", "routing", "reverse_prompt"])
+    graph.add("guardrails", lambda card: merge_guardrails(previous.guardrails, verify_deterministic(card)), ["card"])
+    results, trace = graph.run()
+
+    CASCADE_STATS.record(THREAD_TIER)
+    guardrails = results["guardrails"]
     status = "ready" if guardrails.passed else "blocked"
+    INCIDENTS.inc(tier=THREAD_TIER, status=status)
+    return results["card"].model_copy(update={"guardrails": guardrails, "status": status, "tier": THREAD_TIER, "trace": trace})
 
-    return DashboardCard(
-        incident=incident,
-        signals=signals,
-        scores=scores,
-        routing=routing,
-        reverse_prompt=reverse_prompt,
-        guardrails=guardrails,
-        status=status,
+
+def _run_graph(incident: EventRecord, context: Optional[RetrievalContext] = None) -> Tuple[DashboardCard, Dict[str, Any]]:
+    """Run the pipeline as a stage graph; retrieval overlaps with the LLM stages that do not need it.
+
+    With ``PIPELINE_CASCADE`` on, incidents the keyword heuristics classify as
+    clearly low-risk get a deterministic card and never reach the LLM agents.
+    """
+    global_policy = _GLOBAL_POLICY
+    fast = None
+    if cascade_enabled():
+        fast = triage(incident)
+        if not fast.fast_path:
+            fast = None
+
+    def extract(events):
+        signal_client = _client_from_env("AGENT1", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
+        return extract_signals(incident, events, global_policy, client=signal_client)
+
+    def reverse(routing, scores, signals, playbooks, events):
+        if fast is not None:
+            return _deterministic_prompt(routing, scores, signals, playbooks, events)
+        reverse_client = _client_from_env("AGENT3", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
+        return generate_reverse_prompt(routing, scores, signals, playbooks, events, client=reverse_client)
+
+    graph = StageGraph()
+    if context is None:
+        graph.add("embed", lambda: RetrievalContext.from_queries([incident.text]))
+    else:
+        graph.add("embed", lambda: context)
+    graph.add("events", lambda ctx: ctx.events(top_k=EVENT_TOP_K)[0], ["embed"])
+    # Retrieve from ALL playbooks without team filtering for comprehensive policy coverage
+    graph.add("playbooks", lambda ctx: ctx.playbooks(team=None, top_k=PLAYBOOK_TOP_K)[0], ["embed"])
+    if fast is None:
+        graph.add("signals", extract, ["events"])
+        graph.add("scores", lambda signals: score_risk(signals, incident.metadata), ["signals"])
+        graph.add("routing", route_incident, ["signals", "scores"])
+    else:
+        graph.add("signals", lambda: fast.signals)
+        graph.add("scores", lambda: fast.scores)
+        graph.add("routing", lambda: fast.routing)
+    graph.add("reverse_prompt", reverse, ["routing", "scores", "signals", "playbooks", "events"])
+    graph.add(
+        "card",
+        lambda signals, scores, routing, reverse_prompt: _build_card(incident, signals, scores, routing, reverse_prompt),
+        ["signals", "scores", "routing", "reverse_prompt"],
     )
+    graph.add("guardrails", _verify if fast is None else verify_deterministic, ["card"])
+    results, trace = graph.run()
+
+    tier = LLM_TIER if fast is None else HEURISTIC_TIER
+    CASCADE_STATS.record(tier)
+    guardrails = results["guardrails"]
+    status = "ready" if guardrails.passed else "blocked"
+    INCIDENTS.inc(tier=tier, status=status)
+    card = results["card"].model_copy(update={"guardrails": guardrails, "status": status, "tier": tier, "trace": trace})
+    return card, results
+
+
+def _fast_paths(incidents: List[EventRecord]) -> List[Optional[Triage]]:
+    """The cascade triage of each incident served by the heuristic tier, None for the rest."""
+    if not cascade_enabled():
+        return [None] * len(incidents)
+    triaged = [triage(incident) for incident in incidents]
+    return [fast if fast.fast_path else None for fast in triaged]
+
+
+def _per_tier(fast: List[Optional[Triage]], heuristic: Callable[..., Any], llm: Callable[..., Any], *columns: List[Any]) -> List[Any]:
+    """Apply ``heuristic`` row by row to fast-path rows and ``llm`` once to the columns of the others."""
+    results: List[Any] = [None] * len(fast)
+    escalated = [position for position, row in enumerate(fast) if row is None]
+    for position, row in enumerate(fast):
+        if row is not None:
+            results[position] = heuristic(row, *(column[position] for column in columns))
+    if escalated:
+        outputs = llm(*([column[position] for position in escalated] for column in columns))
+        for position, output in zip(escalated, outputs):
+            results[position] = output
+    return results
+
+
+def process_incidents(incidents: List[EventRecord]) -> List[DashboardCard]:
+    """Process a batch; with coalescing on, only incidents that repeat nothing recent run the pipeline."""
+    if not coalesce_enabled():
+        return _run_incidents(incidents)
+    # Claimed in order, so a follow-up sees the thread its predecessor in the batch opened.
+    claims = [None if _follows_thread(incident) else COALESCER.claim(incident) for incident in incidents]
+    leaders = [position for position, claim in enumerate(claims) if claim is None or claim[1]]
+    try:
+        leader_cards = _run_incidents([incidents[position] for position in leaders])
+    except BaseException as exc:
+        for position in leaders:
+            if claims[position] is not None:
+                COALESCER.fail(claims[position][0], exc)
+        raise
+    cards: List[Optional[DashboardCard]] = [None] * len(incidents)
+    for position, card in zip(leaders, leader_cards):
+        if claims[position] is not None:
+            COALESCER.resolve(claims[position][0], card)
+        cards[position] = card
+    for position, claim in enumerate(claims):
+        if claim is not None and not claim[1]:
+            try:
+                cards[position] = _coalesced(claim[0], incidents[position])
+            except Exception:
+                cards[position] = _run_incident(incidents[position])
+    return cards
+
+
+def _run_incidents(incidents: List[EventRecord]) -> List[DashboardCard]:
+    """Batch-run incidents on new threads, then fold the rest into their threads in order."""
+    if not thread_state_enabled():
+        return _run_batch_graph(incidents)[0]
+    store = thread_store()
+    fresh: List[int] = []
+    seen = set()
+    for position, incident in enumerate(incidents):
+        if incident.thread_id not in seen and store.get(incident.thread_id) is None:
+            fresh.append(position)
+        seen.add(incident.thread_id)
+    cards: List[Optional[DashboardCard]] = [None] * len(incidents)
+    fresh_cards, results = _run_batch_graph([incidents[position] for position in fresh])
+    for row, (position, card) in enumerate(zip(fresh, fresh_cards)):
+        with store.lock(card.incident.thread_id):
+            store.put(new_state(card, results["events"][row], results["playbooks"][row]))
+        cards[position] = card
+    for position, incident in enumerate(incidents):
+        if cards[position] is None:
+            cards[position] = _run_incident(incident)
+    return cards
+
+
+def _run_batch_graph(incidents: List[EventRecord]) -> Tuple[List[DashboardCard], Dict[str, Any]]:
+    """Run each pipeline stage once for the whole batch.
+
+    Produces the same cards as ``process_incident`` per incident, but embeds and
+    searches once and submits each agent's generations together, so the batch
+    costs about one batched call per stage instead of one call per incident.
+    """
+    if not incidents:
+        return [], {}
+    global_policy = _GLOBAL_POLICY
+    fast = _fast_paths(incidents)
+
+    # Clients are created only when some rows escalate, as process_incident does.
+    def extract(events):
+        return _per_tier(
+            fast,
+            lambda row, incident, snippets: row.signals,
+            lambda batch, snippets: extract_signals_batch(
+                batch, snippets, global_policy, client=_client_from_env("AGENT1", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
+            ),
+            incidents,
+            events,
+        )
+
+    def reverse(routing, scores, signals, playbooks, events):
+        return _per_tier(
+            fast,
+            lambda row, *args: _deterministic_prompt(*args),
+            lambda *columns: generate_reverse_prompt_batch(
+                *columns, client=_client_from_env("AGENT3", "Qwen/Qwen2.5-32B-Instruct", 0.2, 800)
+            ),
+            routing,
+            scores,
+            signals,
+            playbooks,
+            events,
+        )
+
+    def verify(cards):
+        return _per_tier(
+            fast,
+            lambda row, card: verify_deterministic(card),
+            lambda batch: verify_guardrails_batch(
+                batch, client=_client_from_env("GUARDRAILS", "Qwen/Qwen2.5-1.5B-Instruct", 0.1, 400)
+            ),
+            cards,
+        )
+
+    graph = StageGraph("batch")
+    graph.add("embed", lambda: retrieval_contexts(incidents))
+    graph.add("events", lambda contexts: [ctx.events(top_k=EVENT_TOP_K)[0] for ctx in contexts], ["embed"])
+    # Retrieve from ALL playbooks without team filtering for comprehensive policy coverage
+    graph.add("playbooks", lambda contexts: [ctx.playbooks(team=None, top_k=PLAYBOOK_TOP_K)[0] for ctx in contexts], ["embed"])
+    graph.add("signals", extract, ["events"])
+    graph.add(
+        "scores",
+        lambda signals: [score_risk(row, incident.metadata) for row, incident in zip(signals, incidents)],
+        ["signals"],
+    )
+    graph.add("routing", lambda signals, scores: [route_incident(*row) for row in zip(signals, scores)], ["signals", "scores"])
+    graph.add("reverse_prompt", reverse, ["routing", "scores", "signals", "playbooks", "events"])
+    graph.add(
+        "card",
+        lambda signals, scores, routing, reverse_prompt: [
+            _build_card(*row) for row in zip(incidents, signals, scores, routing, reverse_prompt)
+        ],
+        ["signals", "scores", "routing", "reverse_prompt"],
+    )
+    graph.add("guardrails", verify, ["card"])
+    results, trace = graph.run()
+
+    cards = []
+    for card, guardrails, row in zip(results["card"], results["guardrails"], fast):
+        tier = LLM_TIER if row is None else HEURISTIC_TIER
+        CASCADE_STATS.record(tier)
+        status = "ready" if guardrails.passed else "blocked"
+        INCIDENTS.inc(tier=tier, status=status)
+        cards.append(card.model_copy(update={"guardrails": guardrails, "status": status, "tier": tier, "trace": trace}))
+    return cards, results
+
+
+class PipelineSaturated(RuntimeError):
+    """Every worker is busy and the wait queue is full; callers should back off and retry."""
+
+
+class PipelineQueueTimeout(RuntimeError):
+    """A job waited in the queue longer than ``PIPELINE_QUEUE_TIMEOUT_SECONDS`` and was dropped."""
+
+
+class PipelineExecutor:
+    """Runs blocking pipeline work (torch generation, FAISS, disk) off the asyncio event loop.
+
+    ``PIPELINE_WORKERS`` threads execute jobs and at most ``PIPELINE_QUEUE_DEPTH``
+    more may wait. Beyond that, submissions are refused with ``PipelineSaturated``
+    instead of queueing without bound, so the event loop keeps answering cheap
+    requests such as ``/health`` under full load.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None, queue_timeout: Optional[float] = None):
+        self.workers = workers or int(os.getenv("PIPELINE_WORKERS", "4"))
+        self.queue_depth = queue_depth if queue_depth is not None else int(os.getenv("PIPELINE_QUEUE_DEPTH", "16"))
+        self.queue_timeout = queue_timeout or float(os.getenv("PIPELINE_QUEUE_TIMEOUT_SECONDS", "120"))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self.rejected = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "rejected": self.rejected,
+            }
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._admitted >= self.workers + self.queue_depth:
+                self.rejected += 1
+                raise PipelineSaturated("Pipeline is at capacity")
+            self._admitted += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._admitted -= 1
+
+    def _call(self, submitted: float, func: Callable[..., Any], args: tuple) -> Any:
+        if time.monotonic() - submitted > self.queue_timeout:
+            raise PipelineQueueTimeout("Job waited too long for a pipeline worker")
+        with self._lock:
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _submit(self, func: Callable[..., Any], args: tuple) -> Future:
+        self._admit()
+        future = self._executor.submit(self._call, time.monotonic(), func, args)
+        # Release the slot when the job ends, not when the awaiting request goes away.
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self._submit(func, args))
+
+    def call(self, func: Callable[..., Any], *args: Any) -> Any:
+        """``run`` for background threads: same admission control, blocks until the job is done."""
+        return self._submit(func, args).result()
+
+
+PIPELINE_EXECUTOR = PipelineExecutor()
+
+
+async def process_incident_async(incident: EventRecord, context: Optional[RetrievalContext] = None) -> DashboardCard:
+    return await PIPELINE_EXECUTOR.run(process_incident, incident, context)
+
+
+async def process_batch_async(incidents: List[EventRecord]) -> List[DashboardCard]:
+    return await PIPELINE_EXECUTOR.run(process_incidents, incidents)
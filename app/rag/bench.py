@@ -0,0 +1,117 @@
+"""Recall-vs-latency benchmark for the event index types.
+
+Builds every configured index type over synthetic clustered, unit-normalized
+corpora and compares it against exact ``IndexFlatIP`` search::
+
+    python -m app.rag.bench --sizes 10000 100000 1000000 --dim 256 \
+        --types flat ivf ivfpq hnsw --nprobe 8 16 32 --ef-search 32 64 128
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from .index_factory import INDEX_TYPES, IndexConfig, configure_search, create_index, faiss, train_index
+
+
+def synthetic_corpus(rows: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Gaussian blobs around random centres, like topic-clustered incident embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = np.empty((rows, dim), dtype="float32")
+    step = 100_000
+    for start in range(0, rows, step):
+        end = min(start + step, rows)
+        labels = rng.integers(0, clusters, end - start)
+        vectors[start:end] = centres[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _recall(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found, truth))
+    return hits / float(len(truth) * k)
+
+
+def _latencies_ms(index, queries: np.ndarray, k: int) -> np.ndarray:
+    timings = np.empty(len(queries))
+    for position in range(len(queries)):
+        started = time.perf_counter()
+        index.search(queries[position : position + 1], k)
+        timings[position] = (time.perf_counter() - started) * 1000.0
+    return timings
+
+
+def run(
+    sizes: List[int],
+    dim: int,
+    kinds: List[str],
+    query_count: int,
+    k: int,
+    nprobes: List[int],
+    ef_searches: List[int],
+) -> List[Dict[str, object]]:
+    results = []
+    for rows in sizes:
+        corpus = synthetic_corpus(rows, dim)
+        queries = synthetic_corpus(query_count, dim, seed=1)
+        exact = faiss.IndexFlatIP(dim)
+        exact.add(corpus)
+        _, truth = exact.search(queries, k)
+
+        for kind in kinds:
+            # The benchmark always builds the requested type, even for small corpora.
+            config = IndexConfig(kind=kind, min_rows=0)
+            started = time.perf_counter()
+            index = create_index(dim, rows, config)
+            train_index(index, corpus, config)
+            index.add(corpus)
+            build_seconds = time.perf_counter() - started
+            size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+            if kind in {"ivf", "ivfpq"}:
+                sweeps = [{"nprobe": value} for value in nprobes]
+            elif kind == "hnsw":
+                sweeps = [{"ef_search": value} for value in ef_searches]
+            else:
+                sweeps = [{}]
+
+            for params in sweeps:
+                for name, value in params.items():
+                    setattr(config, name, value)
+                configure_search(index, config)
+                _, found = index.search(queries, k)
+                latencies = _latencies_ms(index, queries, k)
+                result = {
+                    "rows": rows,
+                    **config.describe(rows),
+                    **params,
+                    f"recall@{k}": round(_recall(found, truth, k), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                    "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                    "build_s": round(build_seconds, 2),
+                    "size_mb": round(size_mb, 1),
+                }
+                results.append(result)
+                print(json.dumps(result), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    if faiss is None:
+        raise SystemExit("faiss is not available. Install faiss-cpu to run the benchmark.")
+    parser = argparse.ArgumentParser(description="Benchmark event index types (recall vs latency vs size).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (bge-m3 is 1024).")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+    run(args.sizes, args.dim, args.types, args.queries, args.k, args.nprobe, args.ef_search)
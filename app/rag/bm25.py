@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of ``term -> (row, term frequency)`` postings.
+
+    A query only touches the postings of its own terms, so cost follows the
+    selectivity of the query rather than the size of the corpus.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[List[int]]] = {}
+        self.doc_lengths: List[int] = []
+        self._total_length = 0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        index = cls(k1=k1, b=b)
+        index.add(texts)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            row = len(self.doc_lengths)
+            terms = tokenize(text)
+            self.doc_lengths.append(len(terms))
+            self._total_length += len(terms)
+            for term, freq in Counter(terms).items():
+                self.postings.setdefault(term, []).append([row, freq])
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        predicate: Optional[Callable[[int], bool]] = None,
+    ) -> List[Tuple[int, float]]:
+        count = len(self.doc_lengths)
+        if not count or top_k <= 0:
+            return []
+        avg_length = self._total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[row] / avg_length)
+                scores[row] = scores.get(row, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        candidates = scores.items()
+        if predicate is not None:
+            candidates = [(row, score) for row, score in candidates if predicate(row)]
+        return heapq.nlargest(top_k, candidates, key=lambda item: item[1])
+
+    def save(self, path: Path) -> None:
+        payload = {"k1": self.k1, "b": self.b, "doc_lengths": self.doc_lengths, "postings": self.postings}
+        Path(path).write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.postings = payload["postings"]
+        index.doc_lengths = payload["doc_lengths"]
+        index._total_length = sum(index.doc_lengths)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], top_k: int, k: int = 60) -> List[int]:
+    """Fuse several ranked row lists; each appearance contributes ``1 / (k + rank)``."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return [row for row, _ in heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])]
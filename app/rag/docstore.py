@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+OFFSET_DTYPE = np.dtype("<u8")
+
+
+class DocStore:
+    """Read-only JSONL metadata addressed by row id.
+
+    ``<name>.offsets`` holds the byte offset of every record as little-endian
+    uint64. Both files are memory-mapped, so opening a store costs nothing per
+    record and several workers share one page-cache copy. Records are decoded
+    only when a search hit asks for them.
+    """
+
+    def __init__(self, path: Path, offsets_path: Path, count: Optional[int] = None):
+        self.path = Path(path)
+        self._data = None
+        self._offsets = np.zeros(0, dtype=OFFSET_DTYPE)
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return
+
+        with self.path.open("rb") as handle:
+            self._data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if Path(offsets_path).exists() and Path(offsets_path).stat().st_size:
+            self._offsets = np.memmap(offsets_path, dtype=OFFSET_DTYPE, mode="r")
+        else:
+            # Stores written before offset tables existed: index them once in memory.
+            self._offsets = np.asarray(_scan_offsets(self._data), dtype=OFFSET_DTYPE)
+        if count is not None:
+            self._offsets = self._offsets[:count]
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, row: int) -> Dict[str, str]:
+        if row < 0 or row >= len(self._offsets):
+            raise IndexError(row)
+        start = int(self._offsets[row])
+        end = self._data.find(b"\n", start)
+        if end == -1:
+            end = len(self._data)
+        return json.loads(self._data[start:end])
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def get_many(self, rows: Iterable[int]) -> List[Dict[str, str]]:
+        return [self[row] for row in rows]
+
+
+def _scan_offsets(data) -> List[int]:
+    offsets = []
+    position = 0
+    size = len(data)
+    while position < size:
+        end = data.find(b"\n", position)
+        if end == -1:
+            end = size
+        if data[position:end].strip():
+            offsets.append(position)
+        position = end + 1
+    return offsets
+
+
+def append_records(path: Path, offsets_path: Path, records: Iterable[Dict[str, str]]) -> int:
+    """Append records to ``path`` and their offsets to ``offsets_path``; returns the count."""
+    path = Path(path)
+    start = path.stat().st_size if path.exists() else 0
+    offsets = []
+    with path.open("ab") as handle:
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=True) + "\n").encode("utf-8")
+            offsets.append(start)
+            handle.write(line)
+            start += len(line)
+    with Path(offsets_path).open("ab") as handle:
+        handle.write(np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes())
+    return len(offsets)
+
+
+def write_records(path: Path, offsets_path: Path, records: Iterable[Dict[str, str]]) -> int:
+    for target in (Path(path), Path(offsets_path)):
+        if target.exists():
+            os.remove(target)
+    return append_records(path, offsets_path, records)
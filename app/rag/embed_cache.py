@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_") or "default"
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store shared by every process on the host.
+
+    Vectors live in an append-only ``vectors.bin`` matrix that is read through a
+    memory map, with ``keys.tsv`` mapping ``sha256(model, text)`` to a row. An
+    in-process LRU sits in front of the map. When the matrix grows past
+    ``max_entries`` it is compacted down to the most recently used rows.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        model_name: str,
+        dtype: str = "float16",
+        max_entries: int = 500_000,
+        memory_entries: int = 4096,
+    ):
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.directory = Path(directory) / _slug(model_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.directory / "vectors.bin"
+        self._keys_path = self.directory / "keys.tsv"
+        self._meta_path = self.directory / "meta.json"
+        self._lock_path = self.directory / ".lock"
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._rows: Dict[str, int] = {}
+        self._last_used: Dict[str, int] = {}
+        self._tick = 0
+        self._keys_offset = 0
+        # Inodes of the keys.tsv/vectors.bin pair that ``_rows`` and ``_matrix`` were read from.
+        self._generation: Optional[Tuple[int, int]] = None
+        self._matrix: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        with self._file_lock():
+            self._load_meta()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Serializes writers, compaction and map reloads across processes; not reentrant."""
+        if fcntl is None:
+            yield
+            return
+        with self._lock_path.open("a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _load_meta(self) -> None:
+        """Read the stored dimension; the caller holds the file lock."""
+        self._dim = None
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            self._dim = meta.get("dim")
+            if meta.get("dtype") != self.dtype.name:
+                # Stored rows use another precision; start over rather than mixing them.
+                self._reset_files()
+
+    def _reset_files(self) -> None:
+        """Delete the stored rows; the caller holds the file lock."""
+        for path in (self._vectors_path, self._keys_path, self._meta_path):
+            if path.exists():
+                path.unlink()
+        self._dim = None
+
+    def _current_generation(self) -> Optional[Tuple[int, int]]:
+        try:
+            return os.stat(self._keys_path).st_ino, os.stat(self._vectors_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _sync(self) -> None:
+        """Bring the key map and the vector map up to date together; the caller holds the file lock.
+
+        When another process replaced the files (compaction or reset) every row
+        number read so far is stale, so both are reloaded from scratch; otherwise
+        only keys appended since the last sync are read and the map is extended.
+        """
+        generation = self._current_generation()
+        if generation != self._generation:
+            self._rows.clear()
+            self._last_used.clear()
+            self._keys_offset = 0
+            self._matrix = None
+            self._load_meta()
+            generation = self._current_generation()
+            self._generation = generation
+        if generation is None or self._dim is None:
+            return
+        with self._keys_path.open("rb") as handle:
+            handle.seek(self._keys_offset)
+            data = handle.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("ascii").splitlines():
+            digest, _, row = line.partition("\t")
+            if row:
+                self._rows[digest] = int(row)
+        self._keys_offset += end
+        rows = self._vectors_path.stat().st_size // (self._dim * self.dtype.itemsize)
+        if rows and (self._matrix is None or self._matrix.shape[0] < rows):
+            self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(rows, self._dim))
+
+    def _mapped(self, digest: str) -> Optional[np.ndarray]:
+        """The vector for ``digest`` from the current map, without touching the files."""
+        row = self._rows.get(digest)
+        if row is None or self._matrix is None or row >= self._matrix.shape[0]:
+            return None
+        return np.asarray(self._matrix[row], dtype="float32")
+
+    def _remember(self, digest: str, vector: np.ndarray) -> None:
+        self._memory[digest] = vector
+        self._memory.move_to_end(digest)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            refreshed = False
+            for text in texts:
+                digest = self._key(text)
+                self._tick += 1
+                vector = self._memory.get(digest)
+                if vector is not None:
+                    self._memory.move_to_end(digest)
+                    self._last_used[digest] = self._tick
+                    self._counters["memory_hits"] += 1
+                    results.append(vector)
+                    continue
+                # ``_rows`` and ``_matrix`` always come from the same generation, so a
+                # stale pair still returns the right vector; anything else is re-read
+                # under the file lock once per call.
+                vector = self._mapped(digest)
+                if vector is None and not refreshed:
+                    with self._file_lock():
+                        self._sync()
+                    refreshed = True
+                    vector = self._mapped(digest)
+                if vector is None:
+                    self._counters["misses"] += 1
+                else:
+                    self._counters["disk_hits"] += 1
+                    self._last_used[digest] = self._tick
+                    self._remember(digest, vector)
+                results.append(vector)
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        if not texts:
+            return
+        stored = np.ascontiguousarray(vectors, dtype=self.dtype)
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._dim is None:
+                self._dim = int(stored.shape[1])
+                self._meta_path.write_text(json.dumps({"dim": self._dim, "dtype": self.dtype.name}), encoding="utf-8")
+            elif self._dim != stored.shape[1]:
+                raise ValueError(f"Embedding dimension {stored.shape[1]} does not match cache dimension {self._dim}.")
+
+            pending = {}
+            for text, vector in zip(texts, stored):
+                digest = self._key(text)
+                if digest not in self._rows:
+                    pending[digest] = vector
+                self._remember(digest, vector.astype("float32"))
+
+            if pending:
+                row = self._vectors_path.stat().st_size // (self._dim * self.dtype.itemsize) if self._vectors_path.exists() else 0
+                lines = []
+                with self._vectors_path.open("ab") as handle:
+                    for digest, vector in pending.items():
+                        handle.write(vector.tobytes())
+                        self._rows[digest] = row
+                        lines.append(f"{digest}\t{row}\n")
+                        row += 1
+                with self._keys_path.open("a", encoding="ascii") as handle:
+                    handle.write("".join(lines))
+                self._keys_offset = self._keys_path.stat().st_size
+                self._generation = self._current_generation()
+                self._counters["writes"] += len(pending)
+
+            if len(self._rows) > self.max_entries:
+                self._compact()
+
+    def _compact(self) -> None:
+        """Keep the most recently used three quarters of ``max_entries`` rows."""
+        keep_count = max(1, self.max_entries * 3 // 4)
+        ranked = sorted(self._rows.items(), key=lambda item: (self._last_used.get(item[0], 0), item[1]), reverse=True)
+        keep = ranked[:keep_count]
+        rows = self._vectors_path.stat().st_size // (self._dim * self.dtype.itemsize)
+        matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(rows, self._dim))
+
+        vectors_tmp = self._vectors_path.with_suffix(".bin.tmp")
+        keys_tmp = self._keys_path.with_suffix(".tsv.tmp")
+        new_rows: Dict[str, int] = {}
+        with vectors_tmp.open("wb") as vectors_handle, keys_tmp.open("w", encoding="ascii") as keys_handle:
+            for new_row, (digest, old_row) in enumerate(sorted(keep, key=lambda item: item[1])):
+                vectors_handle.write(np.ascontiguousarray(matrix[old_row]).tobytes())
+                keys_handle.write(f"{digest}\t{new_row}\n")
+                new_rows[digest] = new_row
+        del matrix
+        self._matrix = None
+        os.replace(vectors_tmp, self._vectors_path)
+        os.replace(keys_tmp, self._keys_path)
+
+        self._counters["evicted"] += len(self._rows) - len(new_rows)
+        self._rows = new_rows
+        self._last_used = {digest: used for digest, used in self._last_used.items() if digest in new_rows}
+        self._keys_offset = self._keys_path.stat().st_size
+        self._generation = self._current_generation()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._rows)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .retrieve import SentenceTransformer, _embed_texts, _embedding_cache, _embedding_settings
+
+logger = logging.getLogger(__name__)
+
+_WORKER_EMBEDDER = None
+
+
+def _worker_init(model_name: str, device: str) -> None:
+    global _WORKER_EMBEDDER
+    _WORKER_EMBEDDER = SentenceTransformer(model_name, device=device)
+
+
+def _worker_encode(texts: List[str]) -> np.ndarray:
+    return _WORKER_EMBEDDER.encode(texts, normalize_embeddings=True).astype("float32")
+
+
+class EmbeddingPool:
+    """Embeds a stream of batches, in-process or across CPU worker processes.
+
+    Each worker loads its own copy of the embedding model. At most
+    ``2 * workers`` batches are in flight, so memory stays bounded by the batch
+    size whatever the length of the stream. Results come back in input order.
+    The embedding cache is consulted in the parent, and only misses are shipped
+    to the workers.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers if workers is not None else int(os.getenv("EMBED_WORKERS", "1"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "EmbeddingPool":
+        if self.workers > 1:
+            if SentenceTransformer is None:
+                raise RuntimeError("Embeddings model not available to build indexes.")
+            model_name, device = _embedding_settings()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(model_name, device),
+            )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _embed_local(self, texts: List[str]) -> np.ndarray:
+        embeddings = _embed_texts(texts)
+        if embeddings is None:
+            raise RuntimeError("Embeddings model not available to build indexes.")
+        return embeddings
+
+    def _submit(self, texts: List[str]) -> _PendingBatch:
+        # Consult the cache in the parent so hits never travel to a worker.
+        cache = _embedding_cache()
+        cached: List[Optional[np.ndarray]] = cache.get_many(texts) if cache is not None else [None] * len(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        future = self._executor.submit(_worker_encode, missing) if missing else None
+        return _PendingBatch(texts, cached, missing, future)
+
+    def map(self, batches: Iterable[Tuple[Any, List[str]]]) -> Iterator[Tuple[Any, np.ndarray]]:
+        """Yield ``(payload, embeddings)`` for every ``(payload, texts)`` batch, in order."""
+        if self._executor is None:
+            for payload, texts in batches:
+                yield payload, self._embed_local(texts)
+            return
+
+        in_flight: Deque[Tuple[Any, _PendingBatch]] = deque()
+        for payload, texts in batches:
+            in_flight.append((payload, self._submit(texts)))
+            if len(in_flight) >= 2 * self.workers:
+                payload, pending = in_flight.popleft()
+                yield payload, pending.result()
+        while in_flight:
+            payload, pending = in_flight.popleft()
+            yield payload, pending.result()
+
+
+class _PendingBatch:
+    def __init__(self, texts: List[str], cached: List[Optional[np.ndarray]], missing: List[str], future: Optional[Future]):
+        self.texts = texts
+        self.cached = cached
+        self.missing = missing
+        self.future = future
+
+    def result(self) -> np.ndarray:
+        if self.future is None:
+            return np.vstack(self.cached).astype("float32")
+        fresh = self.future.result()
+        cache = _embedding_cache()
+        if cache is not None:
+            cache.put_many(self.missing, fresh)
+            # Read back so vectors match the cache precision, as on the in-process path.
+            fresh = cache.get_many(self.missing)
+        by_text = dict(zip(self.missing, fresh))
+        vectors = [vector if vector is not None else by_text[text] for text, vector in zip(self.texts, self.cached)]
+        return np.vstack(vectors).astype("float32")
+
+
+class Progress:
+    """Logs rows embedded and sustained throughput while a build streams."""
+
+    def __init__(self, label: str, every_seconds: float = 5.0):
+        self.label = label
+        self.every_seconds = every_seconds
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def advance(self, rows: int) -> None:
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last_report >= self.every_seconds:
+            self._last_report = now
+            logger.info("%s: %d rows embedded (%.1f rows/s)", self.label, self.rows, self.rate)
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def finish(self) -> None:
+        logger.info("%s: done, %d rows in %.1fs (%.1f rows/s)", self.label, self.rows, time.perf_counter() - self.started, self.rate)
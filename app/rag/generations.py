@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class GenerationStore:
+    """Versioned index directories published through an atomically replaced manifest.
+
+    Writers fill a fresh directory under ``generations/`` and call ``publish``;
+    readers poll ``MANIFEST.json`` (one ``stat`` per request) and switch over on
+    their next request. Nothing inside a published generation is rewritten.
+    """
+
+    def __init__(self, root: Path, keep: int = 2):
+        self.root = Path(root)
+        self.keep = keep
+        self.generations_dir = self.root / "generations"
+        self.manifest_path = self.root / "MANIFEST.json"
+        self._lock_path = self.root / ".build.lock"
+        self._build_lock = threading.Lock()
+
+    @contextmanager
+    def build_lock(self) -> Iterator[None]:
+        """Serializes builds and updates across threads and every process sharing ``root``."""
+        with self._build_lock:
+            if fcntl is None:
+                yield
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            with self._lock_path.open("a") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def create(self) -> Path:
+        name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        path = self.generations_dir / name
+        path.mkdir(parents=True, exist_ok=False)
+        return path
+
+    def publish(self, path: Path) -> None:
+        manifest = {"generation": path.name, "published_at": time.time()}
+        tmp_path = self.manifest_path.with_suffix(f".json.{uuid.uuid4().hex[:8]}.tmp")
+        tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp_path, self.manifest_path)
+
+    def manifest_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def current(self) -> Optional[Path]:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        path = self.generations_dir / manifest["generation"]
+        return path if path.exists() else None
+
+    def collect_garbage(self, in_use: Iterable[str] = ()) -> List[str]:
+        """Delete generations older than the newest ``keep`` that no local reader holds.
+
+        The ``keep`` window covers readers in other processes that have not polled
+        the manifest yet.
+        """
+        if not self.generations_dir.exists():
+            return []
+        current = self.current()
+        protected = set(in_use)
+        if current is not None:
+            protected.add(current.name)
+        names = sorted(path.name for path in self.generations_dir.iterdir() if path.is_dir())
+        protected.update(names[-self.keep :] if self.keep > 0 else [])
+        removed = []
+        for name in names:
+            if name in protected:
+                continue
+            shutil.rmtree(self.generations_dir / name, ignore_errors=True)
+            removed.append(name)
+        return removed
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Share an unchanged file between generations without copying its bytes."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def copy_prefix(source: Path, target: Path, size: int) -> None:
+    """Copy the first ``size`` bytes of ``source``, for a file the new generation appends to.
+
+    Appending to or truncating a hard link would change the file under every
+    generation that shares it.
+    """
+    with source.open("rb") as reader, target.open("wb") as writer:
+        remaining = size
+        while remaining > 0:
+            block = reader.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            writer.write(block)
+            remaining -= len(block)
@@ -1,8 +1,501 @@
 from __future__ import annotations
 
-from .retrieve import build_indexes
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .bm25 import BM25Index
+from .docstore import append_records
+from .embed_pool import EmbeddingPool, Progress
+from .generations import copy_prefix, link_or_copy
+from .index_factory import IndexConfig, create_index, train_index
+from .retrieve import (
+    EVENT_BM25_FILE,
+    EVENT_INDEX_FILE,
+    EVENT_META_FILE,
+    EVENT_OFFSETS_FILE,
+    INDEX_STORE,
+    PLAYBOOK_BM25_FILE,
+    PLAYBOOK_DIR,
+    PLAYBOOK_INDEX_FILE,
+    PLAYBOOK_META_FILE,
+    PLAYBOOK_TEAMS_FILE,
+    SAMPLES_DIR,
+    _LIVE_GENERATIONS,
+    _load_jsonl,
+    _normalize_team,
+    chunk_text,
+    event_doc,
+    faiss,
+)
+from .shards import (
+    SHARDS_DIR,
+    bucket_bounds,
+    bucket_for,
+    is_expired,
+    retention_days_from_env,
+    shard_by_from_env,
+)
+
+STATE_FILE = "state.json"
+
+logger = logging.getLogger(__name__)
+
+
+def _write_jsonl(path: Path, records: List[Dict[str, str]]) -> None:
+    lines = [json.dumps(record, ensure_ascii=True) for record in records]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _load_state(generation: Optional[Path]) -> Dict:
+    if generation is None or not (generation / STATE_FILE).exists():
+        return {}
+    return json.loads((generation / STATE_FILE).read_text(encoding="utf-8"))
+
+
+def _save_state(generation: Path, state: Dict) -> None:
+    (generation / STATE_FILE).write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def _publish(target: Path) -> None:
+    INDEX_STORE.publish(target)
+    INDEX_STORE.collect_garbage(in_use=[target.name, *_LIVE_GENERATIONS.keys()])
+
+
+def _event_entry(event: Dict) -> Tuple[str, Dict[str, str]]:
+    metadata = event.get("metadata", {}) or {}
+    extra = " ".join(
+        filter(None, [event.get("source"), metadata.get("product"), metadata.get("ticket_id")])
+    )
+    text = f"{event.get('text','')} {extra}".strip()
+    return text, event_doc(event)
+
+
+def _stream_events(offsets: Dict[str, int]) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Yield ``(embedding text, doc)`` for complete records past each file's high-water mark.
+
+    ``offsets`` is advanced in place as records are read; a trailing line without
+    a newline is left for the next run.
+    """
+    for file in sorted(SAMPLES_DIR.glob("*.jsonl")):
+        offset = offsets.get(file.name, 0)
+        with file.open("rb") as handle:
+            handle.seek(offset)
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                offsets[file.name] = offset
+                if line.strip():
+                    yield _event_entry(json.loads(line))
+        offsets.setdefault(file.name, offset)
+
+
+def _bucket(doc: Dict[str, str], shard_by: str) -> str:
+    return "" if shard_by == "none" else bucket_for(doc.get("timestamp"), shard_by)
+
+
+def _count_pending(offsets: Dict[str, int], shard_by: str) -> Dict[str, int]:
+    """Count records per shard past the high-water marks without holding them, to size the indexes."""
+    counts: Dict[str, int] = {}
+    for file in sorted(SAMPLES_DIR.glob("*.jsonl")):
+        with file.open("rb") as handle:
+            handle.seek(offsets.get(file.name, 0))
+            if shard_by == "none":
+                for block in iter(lambda: handle.read(1 << 20), b""):
+                    counts[""] = counts.get("", 0) + block.count(b"\n")
+                continue
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    bucket = bucket_for(json.loads(line).get("timestamp"), shard_by)
+                    counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def _batch_size() -> int:
+    return int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+
+def _batches(entries: Iterable[Tuple[str, Dict[str, str]]], size: int) -> Iterator[Tuple[List[Dict[str, str]], List[str]]]:
+    docs: List[Dict[str, str]] = []
+    texts: List[str] = []
+    for text, doc in entries:
+        texts.append(text)
+        docs.append(doc)
+        if len(texts) >= size:
+            yield docs, texts
+            docs, texts = [], []
+    if texts:
+        yield docs, texts
+
+
+class _EventWriter:
+    """Streams embedded events into one event index directory: the generation root or a shard.
+
+    With a ``source`` the previous generation's files are carried over and only
+    loaded if new rows arrive. An untrained (IVF) index holds vectors back until
+    it has ``train_size`` of them, so memory stays bounded by the batch size plus
+    that training sample.
+    """
+
+    def __init__(self, directory: Path, config: IndexConfig, rows_hint: int, source: Optional[Path] = None, state: Optional[Dict] = None):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.config = config
+        self.rows_hint = rows_hint
+        self.source = source
+        self.state = dict(state or {})
+        self.events = self.state.get("events", 0)
+        self.added = 0
+        self.index = None
+        self.created = False
+        self.bm25: Optional[BM25Index] = None
+        self._held: List[np.ndarray] = []
+        self._held_rows = 0
+        if source is None:
+            (directory / EVENT_META_FILE).touch()
+            (directory / EVENT_OFFSETS_FILE).touch()
+            self.bm25 = BM25Index()
+            return
+        # The new generation appends to its own copy of the recorded prefix; anything
+        # past the recorded size is debris from an aborted update.
+        copy_prefix(source / EVENT_META_FILE, directory / EVENT_META_FILE, self.state["event_meta_bytes"])
+        copy_prefix(source / EVENT_OFFSETS_FILE, directory / EVENT_OFFSETS_FILE, self.events * 8)
+
+    def _open_source(self) -> None:
+        if (self.source / EVENT_BM25_FILE).exists():
+            self.bm25 = BM25Index.load(self.source / EVENT_BM25_FILE)
+        else:
+            rows = _load_jsonl(self.source / EVENT_META_FILE)[: self.events]
+            self.bm25 = BM25Index.build(doc["text"] for doc in rows)
+        if self.events:
+            self.index = faiss.read_index(str(self.source / EVENT_INDEX_FILE))
+
+    def add(self, docs: List[Dict[str, str]], vectors: np.ndarray) -> None:
+        if self.bm25 is None:
+            self._open_source()
+        if self.index is None:
+            self.index = create_index(vectors.shape[1], self.rows_hint, self.config)
+            self.created = True
+        append_records(self.directory / EVENT_META_FILE, self.directory / EVENT_OFFSETS_FILE, docs)
+        self.bm25.add(doc["text"] for doc in docs)
+        self.events += len(docs)
+        self.added += len(docs)
+        if self.index.is_trained:
+            self.index.add(vectors)
+            return
+        self._held.append(vectors)
+        self._held_rows += len(vectors)
+        if self._held_rows >= min(self.config.train_size, self.rows_hint):
+            self._train_and_add()
+
+    def _train_and_add(self) -> None:
+        vectors = np.concatenate(self._held)
+        self._held, self._held_rows = [], 0
+        train_index(self.index, vectors, self.config)
+        self.index.add(vectors)
+
+    def finish(self) -> Dict:
+        """Write the index files and return this directory's state entry."""
+        if self._held:
+            self._train_and_add()
+        if self.added or self.source is None:
+            if self.index is not None:
+                faiss.write_index(self.index, str(self.directory / EVENT_INDEX_FILE))
+            self.bm25.save(self.directory / EVENT_BM25_FILE)
+        else:
+            if self.events:
+                link_or_copy(self.source / EVENT_INDEX_FILE, self.directory / EVENT_INDEX_FILE)
+            if (self.source / EVENT_BM25_FILE).exists():
+                link_or_copy(self.source / EVENT_BM25_FILE, self.directory / EVENT_BM25_FILE)
+        if self.source is None or self.created:
+            self.state["event_index"] = self.config.describe(self.events)
+        self.state["events"] = self.events
+        self.state["event_meta_bytes"] = (self.directory / EVENT_META_FILE).stat().st_size
+        return self.state
+
+
+def _write_events(pool: EmbeddingPool, target: Path, state: Dict, source: Optional[Path] = None) -> int:
+    """Stream events past the high-water marks into ``target`` and update ``state``; returns rows added.
+
+    With ``INDEX_SHARD_BY`` set, each day or month of ``timestamp`` gets its own
+    index under ``shards/``. Shards past ``INDEX_RETENTION_DAYS`` are left out of
+    the new generation, so their files are deleted once older generations are
+    collected, and events that fall in them are not embedded at all.
+    """
+    config = IndexConfig.from_env()
+    shard_by = shard_by_from_env()
+    retention = retention_days_from_env()
+    offsets: Dict[str, int] = dict(state.get("event_offsets", {}))
+    pending = _count_pending(offsets, shard_by)
+    if source is None:
+        existing: Dict[str, Dict] = {}
+    elif shard_by == "none":
+        existing = {"": {key: state[key] for key in ("events", "event_index", "event_meta_bytes") if key in state}}
+    else:
+        existing = dict(state.get("shards", {}))
+
+    expired: Dict[str, bool] = {}
+
+    def is_live(bucket: str) -> bool:
+        if bucket not in expired:
+            expired[bucket] = is_expired(bucket_bounds(bucket, shard_by), retention)
+        return not expired[bucket]
+
+    writers: Dict[str, _EventWriter] = {}
+
+    def writer(bucket: str) -> _EventWriter:
+        if bucket not in writers:
+            directory = target / SHARDS_DIR / bucket if bucket else target
+            shard_source = None
+            if bucket in existing:
+                shard_source = source / SHARDS_DIR / bucket if bucket else source
+            rows_hint = existing.get(bucket, {}).get("events", 0) + pending.get(bucket, 0)
+            writers[bucket] = _EventWriter(directory, config, rows_hint, shard_source, existing.get(bucket))
+        return writers[bucket]
+
+    if shard_by == "none":
+        writer("")
+    for bucket in sorted(existing):
+        if is_live(bucket):
+            writer(bucket)
+        else:
+            logger.info("Dropping expired event shard %s", bucket)
+
+    entries = (entry for entry in _stream_events(offsets) if is_live(_bucket(entry[1], shard_by)))
+    progress = Progress("events")
+    for docs, vectors in pool.map(_batches(entries, _batch_size())):
+        rows_by_bucket: Dict[str, List[int]] = {}
+        for row, doc in enumerate(docs):
+            rows_by_bucket.setdefault(_bucket(doc, shard_by), []).append(row)
+        for bucket, rows in rows_by_bucket.items():
+            writer(bucket).add([docs[row] for row in rows], vectors[rows])
+        progress.advance(len(docs))
+    progress.finish()
+
+    shards = {bucket: entry.finish() for bucket, entry in sorted(writers.items())}
+    state["shard_by"] = shard_by
+    state["event_offsets"] = offsets
+    if shard_by == "none":
+        state.pop("shards", None)
+        state.update(shards[""])
+    else:
+        for key in ("event_index", "event_meta_bytes"):
+            state.pop(key, None)
+        state["shards"] = shards
+        state["events"] = sum(entry["events"] for entry in shards.values())
+    return sum(entry.added for entry in writers.values())
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _playbook_chunks(path: Path) -> List[Dict[str, str]]:
+    team = _normalize_team(path.stem)
+    text = path.read_text(encoding="utf-8")
+    return [
+        {
+            "text": chunk,
+            "team": team,
+            "source": path.name,
+            "chunk_id": f"{path.stem}_{idx}",
+        }
+        for idx, chunk in enumerate(chunk_text(text, chunk_size=450, overlap=90))
+    ]
+
+
+def _write_playbook_indexes(target: Path, vectors: np.ndarray, docs: List[Dict[str, str]]) -> None:
+    """Write the global playbook index plus one sub-index per team over the same rows."""
+    playbook_index = faiss.IndexFlatIP(vectors.shape[1])
+    playbook_index.add(vectors)
+    faiss.write_index(playbook_index, str(target / PLAYBOOK_INDEX_FILE))
+    _write_jsonl(target / PLAYBOOK_META_FILE, docs)
+    BM25Index.build(doc["text"] for doc in docs).save(target / PLAYBOOK_BM25_FILE)
+
+    rows_by_team: Dict[str, List[int]] = {}
+    for row, doc in enumerate(docs):
+        rows_by_team.setdefault(doc.get("team", ""), []).append(row)
+
+    teams = {}
+    for team, rows in sorted(rows_by_team.items()):
+        filename = f"playbooks.{re.sub(r'[^A-Za-z0-9]+', '_', team).strip('_').lower()}.faiss"
+        team_index = faiss.IndexFlatIP(vectors.shape[1])
+        team_index.add(vectors[rows])
+        faiss.write_index(team_index, str(target / filename))
+        teams[team] = {"file": filename, "rows": rows}
+    (target / PLAYBOOK_TEAMS_FILE).write_text(json.dumps(teams), encoding="utf-8")
+
+
+def _link_playbook_indexes(source: Path, target: Path) -> None:
+    link_or_copy(source / PLAYBOOK_INDEX_FILE, target / PLAYBOOK_INDEX_FILE)
+    link_or_copy(source / PLAYBOOK_META_FILE, target / PLAYBOOK_META_FILE)
+    link_or_copy(source / PLAYBOOK_BM25_FILE, target / PLAYBOOK_BM25_FILE)
+    if not (source / PLAYBOOK_TEAMS_FILE).exists():
+        return
+    link_or_copy(source / PLAYBOOK_TEAMS_FILE, target / PLAYBOOK_TEAMS_FILE)
+    teams = json.loads((source / PLAYBOOK_TEAMS_FILE).read_text(encoding="utf-8"))
+    for entry in teams.values():
+        link_or_copy(source / entry["file"], target / entry["file"])
+
+
+def _embed_playbooks(pool: EmbeddingPool, docs: List[Dict[str, str]]) -> List[np.ndarray]:
+    progress = Progress("playbooks")
+    vectors = []
+    for batch, embeddings in pool.map(_batches(((doc["text"], doc) for doc in docs), _batch_size())):
+        vectors.append(embeddings)
+        progress.advance(len(batch))
+    progress.finish()
+    return vectors
+
+
+def build_indexes() -> Tuple[int, int]:
+    """Rebuild both indexes from scratch into a new generation and publish it.
+
+    Events are streamed from the sample JSONL files and embedded in
+    ``EMBED_BATCH_SIZE`` batches across ``EMBED_WORKERS`` processes, each batch
+    going straight into the index and the on-disk metadata.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is not available. Install faiss-cpu to build indexes.")
+
+    with INDEX_STORE.build_lock():
+        target = INDEX_STORE.create()
+        try:
+            state: Dict = {}
+            with EmbeddingPool() as pool:
+                _write_events(pool, target, state)
+
+                playbooks = []
+                hashes: Dict[str, str] = {}
+                for file in sorted(PLAYBOOK_DIR.glob("*.md")):
+                    playbooks.extend(_playbook_chunks(file))
+                    hashes[file.name] = _file_hash(file)
+                playbook_vectors = _embed_playbooks(pool, playbooks)
+
+            if playbook_vectors:
+                _write_playbook_indexes(target, np.concatenate(playbook_vectors), playbooks)
+
+            state.update({"playbook_hashes": hashes, "playbooks": len(playbooks)})
+            _save_state(target, state)
+        except Exception:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        _publish(target)
+        return state["events"], len(playbooks)
+
+
+def _can_update(source: Optional[Path], state: Dict) -> bool:
+    if source is None or not state or not (source / PLAYBOOK_INDEX_FILE).exists():
+        return False
+    shard_by = shard_by_from_env()
+    if state.get("shard_by", "none") != shard_by:
+        return False
+    if shard_by == "none":
+        directories = {source: state}
+    else:
+        directories = {source / SHARDS_DIR / bucket: entry for bucket, entry in state.get("shards", {}).items()}
+    for directory, entry in directories.items():
+        # An empty corpus has no vectors to size an index with, so events.faiss is only
+        # written once the first events arrive.
+        required = (EVENT_INDEX_FILE, EVENT_OFFSETS_FILE) if entry.get("events") else (EVENT_OFFSETS_FILE,)
+        if "event_meta_bytes" not in entry or not all((directory / name).exists() for name in required):
+            return False
+    offsets = state.get("event_offsets", {})
+    for name, offset in offsets.items():
+        path = SAMPLES_DIR / name
+        if not path.exists() or path.stat().st_size < offset:
+            # A source was truncated or removed, so previously indexed rows are stale.
+            return False
+    return True
+
+
+def _update_playbooks(pool: EmbeddingPool, source: Path, target: Path, state: Dict) -> int:
+    old_hashes: Dict[str, str] = state.get("playbook_hashes", {})
+    hashes = {file.name: _file_hash(file) for file in sorted(PLAYBOOK_DIR.glob("*.md"))}
+    changed = {name for name, digest in hashes.items() if old_hashes.get(name) != digest}
+    removed = set(old_hashes) - set(hashes)
+    indexed = (source / PLAYBOOK_TEAMS_FILE).exists() and (source / PLAYBOOK_BM25_FILE).exists()
+    if not changed and not removed and indexed:
+        _link_playbook_indexes(source, target)
+        return 0
+
+    index = faiss.read_index(str(source / PLAYBOOK_INDEX_FILE))
+    vectors = index.reconstruct_n(0, index.ntotal)
+    docs = _load_jsonl(source / PLAYBOOK_META_FILE)
+    keep = [row for row, doc in enumerate(docs) if doc.get("source") not in changed | removed]
+
+    new_docs = []
+    for name in sorted(changed):
+        new_docs.extend(_playbook_chunks(PLAYBOOK_DIR / name))
+
+    parts = [vectors[keep]] + _embed_playbooks(pool, new_docs)
+    _write_playbook_indexes(target, np.concatenate(parts).astype("float32"), [docs[row] for row in keep] + new_docs)
+
+    state["playbook_hashes"] = hashes
+    state["playbooks"] = len(keep) + len(new_docs)
+    return len(new_docs)
+
+
+def update_indexes() -> Dict[str, int]:
+    """Embed only events past the stored high-water marks and playbooks whose content changed.
+
+    The result is published as a new generation; falls back to a full rebuild when
+    no consistent previous generation exists.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is not available. Install faiss-cpu to build indexes.")
+
+    with INDEX_STORE.build_lock():
+        source = INDEX_STORE.current()
+        state = _load_state(source)
+        can_update = _can_update(source, state)
+        if can_update:
+            target = INDEX_STORE.create()
+            try:
+                with EmbeddingPool() as pool:
+                    events_added = _write_events(pool, target, state, source)
+                    chunks_embedded = _update_playbooks(pool, source, target, state)
+                _save_state(target, state)
+            except Exception:
+                shutil.rmtree(target, ignore_errors=True)
+                raise
+            _publish(target)
+
+    if not can_update:
+        events, playbooks = build_indexes()
+        return {"events": events, "playbooks": playbooks, "events_added": events, "playbook_chunks_embedded": playbooks}
+
+    return {
+        "events": state["events"],
+        "playbooks": state.get("playbooks", 0),
+        "events_added": events_added,
+        "playbook_chunks_embedded": chunks_embedded,
+    }
 
 
 if __name__ == "__main__":
-    events, playbooks = build_indexes()
-    print(f"Built {events} event vectors and {playbooks} playbook vectors.")
+    parser = argparse.ArgumentParser(description="Build or update the RAG indexes.")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of ingesting the delta.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.full:
+        events, playbooks = build_indexes()
+        print(f"Built {events} event vectors and {playbooks} playbook vectors.")
+    else:
+        stats = update_indexes()
+        print(
+            f"Indexed {stats['events_added']} new events ({stats['events']} total) and "
+            f"re-embedded {stats['playbook_chunks_embedded']} playbook chunks ({stats['playbooks']} total)."
+        )
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover - optional at runtime
+    faiss = None
+
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+
+class IndexConfig:
+    """Build and search settings for the event vector index.
+
+    ``flat`` is exact brute force. ``ivf`` and ``ivfpq`` partition vectors into
+    ``nlist`` cells (PQ also compresses them) and probe ``nprobe`` cells per
+    query. ``hnsw`` walks a proximity graph with ``ef_search`` candidates.
+    Approximate types fall back to ``flat`` below ``min_rows`` vectors, where
+    brute force is both exact and fast.
+    """
+
+    def __init__(
+        self,
+        kind: str = "flat",
+        nlist: Optional[int] = None,
+        pq_m: int = 32,
+        pq_bits: int = 8,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        nprobe: int = 16,
+        ef_search: int = 64,
+        train_size: int = 100_000,
+        min_rows: int = 10_000,
+    ):
+        kind = kind.lower()
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{kind}'. Expected one of {list(INDEX_TYPES)}.")
+        self.kind = kind
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_size = train_size
+        self.min_rows = min_rows
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        nlist = os.getenv("INDEX_NLIST")
+        return cls(
+            kind=os.getenv("INDEX_TYPE", "flat"),
+            nlist=int(nlist) if nlist else None,
+            pq_m=int(os.getenv("INDEX_PQ_M", "32")),
+            pq_bits=int(os.getenv("INDEX_PQ_BITS", "8")),
+            hnsw_m=int(os.getenv("INDEX_HNSW_M", "32")),
+            ef_construction=int(os.getenv("INDEX_EF_CONSTRUCTION", "200")),
+            nprobe=int(os.getenv("INDEX_NPROBE", "16")),
+            ef_search=int(os.getenv("INDEX_EF_SEARCH", "64")),
+            train_size=int(os.getenv("INDEX_TRAIN_SIZE", "100000")),
+            min_rows=int(os.getenv("INDEX_MIN_ROWS", "10000")),
+        )
+
+    def resolve_kind(self, rows: int) -> str:
+        return "flat" if self.kind != "flat" and rows < self.min_rows else self.kind
+
+    def nlist_for(self, rows: int) -> int:
+        if self.nlist:
+            nlist = self.nlist
+        else:
+            nlist = int(4 * math.sqrt(max(rows, 1)))
+        # k-means wants roughly 39 training points per centroid.
+        return max(1, min(nlist, rows // 39 or 1))
+
+    def describe(self, rows: int) -> Dict[str, object]:
+        kind = self.resolve_kind(rows)
+        info: Dict[str, object] = {"type": kind}
+        if kind in {"ivf", "ivfpq"}:
+            info["nlist"] = self.nlist_for(rows)
+        if kind == "ivfpq":
+            info.update({"pq_m": self.pq_m, "pq_bits": self.pq_bits})
+        if kind == "hnsw":
+            info.update({"hnsw_m": self.hnsw_m, "ef_construction": self.ef_construction})
+        return info
+
+
+def create_index(dim: int, rows: int, config: IndexConfig):
+    """Create an empty inner-product index of the configured type sized for ``rows`` vectors."""
+    if faiss is None:
+        raise RuntimeError("faiss is not available. Install faiss-cpu to build indexes.")
+    kind = config.resolve_kind(rows)
+    metric = faiss.METRIC_INNER_PRODUCT
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "ivf":
+        return faiss.index_factory(dim, f"IVF{config.nlist_for(rows)},Flat", metric)
+    if kind == "ivfpq":
+        if dim % config.pq_m:
+            raise ValueError(f"INDEX_PQ_M={config.pq_m} must divide the embedding dimension {dim}.")
+        return faiss.index_factory(dim, f"IVF{config.nlist_for(rows)},PQ{config.pq_m}x{config.pq_bits}", metric)
+    index = faiss.IndexHNSWFlat(dim, config.hnsw_m, metric)
+    index.hnsw.efConstruction = config.ef_construction
+    return index
+
+
+def train_index(index, vectors: np.ndarray, config: IndexConfig, seed: int = 0) -> None:
+    """Train on a random sample of at most ``train_size`` vectors when the index needs it."""
+    if index.is_trained:
+        return
+    sample = vectors
+    if len(vectors) > config.train_size:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), config.train_size, replace=False)]
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+
+
+def configure_search(index, config: IndexConfig) -> None:
+    """Apply query-time knobs; they are read at load so tuning needs no rebuild."""
+    if faiss is None:
+        return
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = min(config.nprobe, ivf.nlist)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = config.ef_search
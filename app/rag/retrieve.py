@@ -1,12 +1,39 @@
 from __future__ import annotations
 
+import heapq
 import json
+import logging
 import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
 
 import numpy as np
 
+from ..metrics import EMBED_SECONDS, INDEX_SEARCH_SECONDS
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .docstore import DocStore
+from .embed_cache import EmbeddingCache
+from .generations import GenerationStore
+from .index_factory import IndexConfig, configure_search
+from .shards import (
+    SHARDS_DIR,
+    UNDATED_SHARD,
+    TimeBound,
+    bucket_bounds,
+    is_expired,
+    overlaps,
+    parse_timestamp,
+    retention_days_from_env,
+    within,
+)
+
 try:
     import faiss  # type: ignore
 except Exception:  # pragma: no cover - optional at runtime
@@ -23,16 +50,32 @@ SAMPLES_DIR = DATA_DIR / "samples"
 PLAYBOOK_DIR = DATA_DIR / "playbooks"
 INDEX_DIR = DATA_DIR / "indexes"
 
-EVENT_INDEX_PATH = INDEX_DIR / "events.faiss"
-EVENT_META_PATH = INDEX_DIR / "events.jsonl"
-PLAYBOOK_INDEX_PATH = INDEX_DIR / "playbooks.faiss"
-PLAYBOOK_META_PATH = INDEX_DIR / "playbooks.jsonl"
+EVENT_INDEX_FILE = "events.faiss"
+EVENT_META_FILE = "events.jsonl"
+EVENT_OFFSETS_FILE = "events.offsets"
+PLAYBOOK_INDEX_FILE = "playbooks.faiss"
+PLAYBOOK_META_FILE = "playbooks.jsonl"
+PLAYBOOK_TEAMS_FILE = "playbook_teams.json"
+EVENT_BM25_FILE = "events.bm25.json"
+PLAYBOOK_BM25_FILE = "playbooks.bm25.json"
+STATE_FILE = "state.json"
+
+RETRIEVAL_MODES = {"vector", "hybrid", "keyword"}
+# Hybrid mode fuses this many candidates per ranking for every requested hit.
+HYBRID_DEPTH = 4
+
+INDEX_STORE = GenerationStore(INDEX_DIR, keep=int(os.getenv("INDEX_KEEP_GENERATIONS", "2")))
 
 _EMBEDDER = None
-_EVENT_INDEX = None
-_EVENT_DOCS: List[Dict[str, str]] = []
-_PLAYBOOK_INDEX = None
-_PLAYBOOK_DOCS: List[Dict[str, str]] = []
+_EMBED_CACHE: Optional[EmbeddingCache] = None
+_GENERATION: Optional["IndexGeneration"] = None
+_GENERATION_STAMP = None
+_GENERATION_LOCK = threading.Lock()
+_LIVE_GENERATIONS: "weakref.WeakValueDictionary[str, IndexGeneration]" = weakref.WeakValueDictionary()
+_SHARD_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_SHARD_EXECUTOR_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
 
 
 TEAM_MAP = {
@@ -46,24 +89,66 @@ def _normalize_team(name: str) -> str:
     return TEAM_MAP.get(name, name)
 
 
+def _embedding_settings() -> Tuple[str, str]:
+    return os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3"), os.getenv("EMBEDDING_DEVICE", "cpu")
+
+
 def _load_embedder() -> Optional[SentenceTransformer]:
     global _EMBEDDER
     if _EMBEDDER is not None:
         return _EMBEDDER
     if SentenceTransformer is None:
         return None
-    model_name = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
-    device = os.getenv("EMBEDDING_DEVICE", "cpu")
+    model_name, device = _embedding_settings()
     _EMBEDDER = SentenceTransformer(model_name, device=device)
     return _EMBEDDER
 
 
+def _embedding_cache() -> Optional[EmbeddingCache]:
+    global _EMBED_CACHE
+    if _EMBED_CACHE is not None:
+        return _EMBED_CACHE
+    if os.getenv("EMBEDDING_CACHE", "true").lower() not in {"1", "true", "yes"}:
+        return None
+    _EMBED_CACHE = EmbeddingCache(
+        Path(os.getenv("EMBEDDING_CACHE_DIR", str(INDEX_DIR / "embed_cache"))),
+        model_name=os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3"),
+        dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float16"),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000")),
+        memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096")),
+    )
+    return _EMBED_CACHE
+
+
+def embedding_cache_stats() -> Dict[str, object]:
+    cache = _embedding_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+def _encode_cached(texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """Serve ``texts`` from the embedding cache and ``encode`` only the distinct misses."""
+    cache = _embedding_cache()
+    if cache is None:
+        return np.asarray(encode(texts), dtype="float32")
+
+    vectors = cache.get_many(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    if missing:
+        fresh = np.asarray(encode(missing), dtype="float32")
+        cache.put_many(missing, fresh)
+        by_text = dict(zip(missing, cache.get_many(missing)))
+        vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+    return np.vstack(vectors).astype("float32")
+
+
 def _embed_texts(texts: List[str]) -> Optional[np.ndarray]:
     embedder = _load_embedder()
     if embedder is None:
         return None
-    embeddings = embedder.encode(texts, normalize_embeddings=True)
-    return embeddings.astype("float32")
+    with EMBED_SECONDS.time():
+        return _encode_cached(texts, lambda batch: embedder.encode(batch, normalize_embeddings=True))
 
 
 def _load_jsonl(path: Path) -> List[Dict[str, str]]:
@@ -78,11 +163,6 @@ def _load_jsonl(path: Path) -> List[Dict[str, str]]:
     return records
 
 
-def _write_jsonl(path: Path, records: List[Dict[str, str]]) -> None:
-    lines = [json.dumps(record, ensure_ascii=True) for record in records]
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
-
-
 def load_events() -> List[Dict[str, str]]:
     records: List[Dict[str, str]] = []
     for file in SAMPLES_DIR.glob("*.jsonl"):
@@ -94,6 +174,16 @@ def load_events() -> List[Dict[str, str]]:
     return records
 
 
+def event_doc(event: Dict) -> Dict[str, str]:
+    return {
+        "text": event.get("text", ""),
+        "source": event.get("source", ""),
+        "timestamp": event.get("timestamp", ""),
+        "event_id": event.get("event_id", ""),
+        "thread_id": event.get("thread_id", ""),
+    }
+
+
 def load_playbooks() -> List[Dict[str, str]]:
     records: List[Dict[str, str]] = []
     for file in PLAYBOOK_DIR.glob("*.md"):
@@ -127,124 +217,488 @@ def chunk_text(text: str, chunk_size: int = 450, overlap: int = 90) -> List[str]
     return chunks
 
 
-def build_indexes() -> Tuple[int, int]:
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
-
-    events = load_events()
-    playbooks = load_playbooks()
-
-    event_texts = []
-    event_docs = []
-    for event in events:
-        metadata = event.get("metadata", {}) or {}
-        extra = " ".join(
-            filter(None, [event.get("source"), metadata.get("product"), metadata.get("ticket_id")])
-        )
-        text = f"{event.get('text','')} {extra}".strip()
-        event_texts.append(text)
-        event_docs.append(
-            {
-                "text": event.get("text", ""),
-                "source": event.get("source", ""),
-                "timestamp": event.get("timestamp", ""),
-                "event_id": event.get("event_id", ""),
-                "thread_id": event.get("thread_id", ""),
-            }
-        )
-
-    playbook_texts = [doc["text"] for doc in playbooks]
-
-    if faiss is None:
-        raise RuntimeError("faiss is not available. Install faiss-cpu to build indexes.")
-
-    event_embeddings = _embed_texts(event_texts)
-    playbook_embeddings = _embed_texts(playbook_texts)
-    if event_embeddings is None or playbook_embeddings is None:
-        raise RuntimeError("Embeddings model not available to build indexes.")
-
-    event_index = faiss.IndexFlatIP(event_embeddings.shape[1])
-    event_index.add(event_embeddings)
-    faiss.write_index(event_index, str(EVENT_INDEX_PATH))
-    _write_jsonl(EVENT_META_PATH, event_docs)
-
-    playbook_index = faiss.IndexFlatIP(playbook_embeddings.shape[1])
-    playbook_index.add(playbook_embeddings)
-    faiss.write_index(playbook_index, str(PLAYBOOK_INDEX_PATH))
-    _write_jsonl(PLAYBOOK_META_PATH, playbooks)
-
-    return len(event_docs), len(playbooks)
-
-
-def _load_indexes() -> None:
-    global _EVENT_INDEX, _EVENT_DOCS, _PLAYBOOK_INDEX, _PLAYBOOK_DOCS
-
-    if _EVENT_INDEX is None and EVENT_INDEX_PATH.exists() and faiss is not None:
-        _EVENT_INDEX = faiss.read_index(str(EVENT_INDEX_PATH))
-        _EVENT_DOCS = _load_jsonl(EVENT_META_PATH)
-
-    if _PLAYBOOK_INDEX is None and PLAYBOOK_INDEX_PATH.exists() and faiss is not None:
-        _PLAYBOOK_INDEX = faiss.read_index(str(PLAYBOOK_INDEX_PATH))
-        _PLAYBOOK_DOCS = _load_jsonl(PLAYBOOK_META_PATH)
-
-
-def _keyword_rank(query: str, docs: List[Dict[str, str]], top_k: int) -> List[Dict[str, str]]:
-    query_terms = set(query.lower().split())
-    scored = []
-    for doc in docs:
-        text = doc.get("text", "").lower()
-        score = sum(1 for term in query_terms if term in text)
-        scored.append((score, doc))
-    scored.sort(key=lambda item: item[0], reverse=True)
-    return [doc for score, doc in scored[:top_k] if score > 0]
-
-
-def retrieve_events(query: str, top_k: int = 5) -> List[Dict[str, str]]:
-    _load_indexes()
-    if _EVENT_INDEX is not None and _EVENT_DOCS:
-        embeddings = _embed_texts([query])
-        if embeddings is not None:
-            scores, indices = _EVENT_INDEX.search(embeddings, top_k)
+def _read_index(path: Path):
+    """Open a FAISS index memory-mapped so workers share the page cache instead of heap copies."""
+    if os.getenv("INDEX_MMAP", "true").lower() in {"1", "true", "yes"}:
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Index types without mmap support in this faiss build load into RAM.
+            pass
+    return faiss.read_index(str(path))
+
+
+Scored = List[Tuple[float, Any]]
+
+
+class ShardHits:
+    """Scored ``(score, key)`` hits per query from one or more event shards.
+
+    ``vector`` or ``keyword`` is None when no shard could produce that ranking.
+    ``resolve`` turns a key into its event record, so records are only decoded
+    for the hits that survive the merge.
+    """
+
+    def __init__(
+        self,
+        vector: Optional[List[Scored]],
+        keyword: Optional[List[Scored]],
+        resolve: Callable[[Any], Dict[str, str]],
+    ):
+        self.vector = vector
+        self.keyword = keyword
+        self.resolve = resolve
+
+    @classmethod
+    def merge(cls, parts: List["ShardHits"], queries: int, depth: int) -> "ShardHits":
+        """Keep the best ``depth`` hits per query across shards.
+
+        Inner-product scores are directly comparable between shards. BM25 scores
+        use per-shard statistics, which is close enough to order keyword hits.
+        """
+
+        def best(name: str) -> Optional[List[Scored]]:
+            rankings = [(position, getattr(part, name)) for position, part in enumerate(parts)]
+            rankings = [(position, ranking) for position, ranking in rankings if ranking is not None]
+            if not rankings:
+                return None
             return [
-                _EVENT_DOCS[idx]
-                for idx in indices[0]
-                if idx >= 0 and idx < len(_EVENT_DOCS)
+                heapq.nlargest(
+                    depth,
+                    ((score, (position, key)) for position, ranking in rankings for score, key in ranking[query]),
+                    key=lambda item: item[0],
+                )
+                for query in range(queries)
             ]
 
-    events = load_events()
-    docs = [
-        {
-            "text": event.get("text", ""),
-            "source": event.get("source", ""),
-            "timestamp": event.get("timestamp", ""),
-        }
-        for event in events
-    ]
-    return _keyword_rank(query, docs, top_k)
-
-
-def retrieve_playbooks(query: str, team: Optional[str] = None, top_k: int = 4) -> List[Dict[str, str]]:
-    _load_indexes()
-    filtered_docs = _PLAYBOOK_DOCS
-    if team:
-        filtered_docs = [doc for doc in _PLAYBOOK_DOCS if doc.get("team") == team]
-
-    if _PLAYBOOK_INDEX is not None and _PLAYBOOK_DOCS:
-        embeddings = _embed_texts([query])
-        if embeddings is not None:
-            scores, indices = _PLAYBOOK_INDEX.search(embeddings, top_k * 2)
-            docs = [
-                _PLAYBOOK_DOCS[idx]
-                for idx in indices[0]
-                if idx >= 0 and idx < len(_PLAYBOOK_DOCS)
+        return cls(best("vector"), best("keyword"), lambda key: parts[key[0]].resolve(key[1]))
+
+    def ranked(self, mode: str, top_k: int) -> List[List[Any]]:
+        if self.vector is None:
+            return [[key for _, key in hits[:top_k]] for hits in self.keyword or []]
+        if mode != "hybrid" or self.keyword is None:
+            return [[key for _, key in hits[:top_k]] for hits in self.vector]
+        return [
+            reciprocal_rank_fusion([[key for _, key in vector], [key for _, key in keyword]], top_k)
+            for vector, keyword in zip(self.vector, self.keyword)
+        ]
+
+    def to_payload(self) -> Dict[str, Any]:
+        """Serialize for a shard server response, with each hit's record inlined once."""
+        positions: Dict[Any, int] = {}
+        docs: List[Dict[str, str]] = []
+
+        def encode(rankings: Optional[List[Scored]]):
+            if rankings is None:
+                return None
+            encoded = []
+            for hits in rankings:
+                for _, key in hits:
+                    if key not in positions:
+                        positions[key] = len(docs)
+                        docs.append(self.resolve(key))
+                encoded.append([[score, positions[key]] for score, key in hits])
+            return encoded
+
+        return {"vector": encode(self.vector), "keyword": encode(self.keyword), "docs": docs}
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "ShardHits":
+        def decode(rankings) -> Optional[List[Scored]]:
+            if rankings is None:
+                return None
+            return [[(float(score), int(key)) for score, key in hits] for hits in rankings]
+
+        return cls(decode(payload.get("vector")), decode(payload.get("keyword")), payload.get("docs", []).__getitem__)
+
+
+class EventShard:
+    """The event index of one time bucket, or of all events when the generation is unsharded."""
+
+    def __init__(self, name: str, path: Path, count: Optional[int], bounds: Optional[Tuple[datetime, datetime]]):
+        self.name = name
+        self.path = path
+        self.bounds = bounds
+        self.index = None
+        self._keyword_lock = threading.Lock()
+        self._keywords: Optional[Tuple[Sequence[Dict[str, str]], BM25Index]] = None
+        if faiss is not None and (path / EVENT_INDEX_FILE).exists():
+            self.index = _read_index(path / EVENT_INDEX_FILE)
+            configure_search(self.index, IndexConfig.from_env())
+        # Event metadata is fetched lazily per hit; the shared events.jsonl may hold rows
+        # appended by newer generations, so only this generation's prefix is visible.
+        self.docs = DocStore(path / EVENT_META_FILE, path / EVENT_OFFSETS_FILE, count=count)
+
+    def keywords(self) -> Tuple[Sequence[Dict[str, str]], BM25Index]:
+        with self._keyword_lock:
+            if self._keywords is None:
+                docs = self.docs or [event_doc(event) for event in load_events()]
+                self._keywords = _keywords(self.path, docs, EVENT_BM25_FILE)
+            return self._keywords
+
+    def search(
+        self,
+        embeddings: Optional[np.ndarray],
+        queries: List[str],
+        depth: int,
+        mode: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> ShardHits:
+        # Shards straddling the requested window over-fetch, then drop out-of-range hits.
+        exact = within(self.bounds, since, until)
+        fetch = depth if exact else depth * 2
+        docs = self.docs
+
+        vector = None
+        if self.index is not None and self.docs and embeddings is not None:
+            scores, indices = self.index.search(embeddings, fetch)
+            vector = [
+                [(float(score), int(row)) for score, row in zip(row_scores, rows) if row >= 0]
+                for row_scores, rows in zip(scores, indices)
             ]
-            if team:
-                docs = [doc for doc in docs if doc.get("team") == team]
-            if docs:
-                return docs[:top_k]
-
-    if not filtered_docs:
-        filtered_docs = load_playbooks()
-        if team:
-            filtered_docs = [doc for doc in filtered_docs if doc.get("team") == team]
-
-    return _keyword_rank(query, filtered_docs, top_k)
+        keyword = None
+        if vector is None or mode == "hybrid":
+            docs, bm25 = self.keywords()
+            keyword = [[(score, row) for row, score in bm25.search(query, fetch)] for query in queries]
+
+        if not exact:
+
+            def in_range(hits: Scored) -> Scored:
+                kept = []
+                for score, row in hits:
+                    timestamp = parse_timestamp(docs[row].get("timestamp"))
+                    if timestamp is not None and (since is None or timestamp >= since) and (until is None or timestamp <= until):
+                        kept.append((score, row))
+                return kept[:depth]
+
+            vector = [in_range(hits) for hits in vector] if vector is not None else None
+            keyword = [in_range(hits) for hits in keyword] if keyword is not None else None
+        return ShardHits(vector, keyword, docs.__getitem__)
+
+
+def _keywords(path: Path, docs: Sequence[Dict[str, str]], filename: str) -> Tuple[Sequence[Dict[str, str]], BM25Index]:
+    if docs and (path / filename).exists():
+        return docs, BM25Index.load(path / filename)
+    # No persisted inverted index (older generation or nothing built yet):
+    # build one in memory, once per generation.
+    return docs, BM25Index.build(doc.get("text", "") for doc in docs)
+
+
+def _shard_executor() -> ThreadPoolExecutor:
+    global _SHARD_EXECUTOR
+    with _SHARD_EXECUTOR_LOCK:
+        if _SHARD_EXECUTOR is None:
+            workers = int(os.getenv("SHARD_SEARCH_THREADS", str(min(8, os.cpu_count() or 1))))
+            _SHARD_EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+        return _SHARD_EXECUTOR
+
+
+def _fan_out(calls: List[Callable[[], ShardHits]]) -> List[ShardHits]:
+    """Run shard searches in parallel; FAISS releases the GIL while it scans."""
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    return list(_shard_executor().map(lambda call: call(), calls))
+
+
+def search_shards(
+    shards: List[EventShard],
+    embeddings: Optional[np.ndarray],
+    queries: List[str],
+    depth: int,
+    mode: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> ShardHits:
+    calls = [partial(_timed_search, shard, embeddings, queries, depth, mode, since, until) for shard in shards]
+    return ShardHits.merge(_fan_out(calls), len(queries), depth)
+
+
+def _timed_search(shard: EventShard, *args: Any) -> ShardHits:
+    with INDEX_SEARCH_SECONDS.time(index="event_shard"):
+        return shard.search(*args)
+
+
+def _shard_endpoints() -> List[str]:
+    return [endpoint.strip().rstrip("/") for endpoint in os.getenv("SHARD_ENDPOINTS", "").split(",") if endpoint.strip()]
+
+
+def _remote_search(endpoint: str, payload: Dict[str, Any]) -> ShardHits:
+    try:
+        with INDEX_SEARCH_SECONDS.time(index="remote_shard"):
+            response = httpx.post(f"{endpoint}/search", json=payload, timeout=float(os.getenv("SHARD_TIMEOUT_SECONDS", "10")))
+        response.raise_for_status()
+        return ShardHits.from_payload(response.json())
+    except (httpx.HTTPError, ValueError) as exc:
+        # One unreachable shard server degrades recall instead of failing the request.
+        logger.warning("Shard server %s failed: %s", endpoint, exc)
+        return ShardHits(None, None, lambda key: {})
+
+
+class IndexGeneration:
+    """One immutable, published set of event and playbook indexes."""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self.event_shards: List[EventShard] = []
+        self.playbook_index = None
+        self.playbook_docs: List[Dict[str, str]] = []
+        self.team_indexes: Dict[str, Tuple[object, np.ndarray]] = {}
+        self._keyword_lock = threading.Lock()
+        self._playbook_keywords: Optional[Tuple[List[Dict[str, str]], BM25Index]] = None
+
+        state = {}
+        if (path / STATE_FILE).exists():
+            state = json.loads((path / STATE_FILE).read_text(encoding="utf-8"))
+        self.shard_by = state.get("shard_by", "none")
+        if "shards" in state:
+            for shard, info in sorted(state["shards"].items()):
+                bounds = bucket_bounds(shard, self.shard_by)
+                self.event_shards.append(EventShard(shard, path / SHARDS_DIR / shard, info.get("events"), bounds))
+        else:
+            self.event_shards.append(EventShard("", path, state.get("events"), None))
+        if faiss is not None and (path / PLAYBOOK_INDEX_FILE).exists():
+            self.playbook_index = _read_index(path / PLAYBOOK_INDEX_FILE)
+        self.playbook_docs = _load_jsonl(path / PLAYBOOK_META_FILE)
+        if faiss is not None and (path / PLAYBOOK_TEAMS_FILE).exists():
+            teams = json.loads((path / PLAYBOOK_TEAMS_FILE).read_text(encoding="utf-8"))
+            for team, entry in teams.items():
+                index = _read_index(path / entry["file"])
+                self.team_indexes[team] = (index, np.asarray(entry["rows"], dtype="int64"))
+
+    @property
+    def has_event_vectors(self) -> bool:
+        return any(shard.index is not None for shard in self.event_shards)
+
+    def select_shards(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[EventShard]:
+        """Shards that may hold events in ``[since, until]``, skipping ones past retention."""
+        retention = retention_days_from_env()
+        ranged = since is not None or until is not None
+        return [
+            shard
+            for shard in self.event_shards
+            if overlaps(shard.bounds, since, until)
+            and not is_expired(shard.bounds, retention)
+            and not (ranged and shard.name == UNDATED_SHARD)
+        ]
+
+    def playbook_keywords(self) -> Tuple[List[Dict[str, str]], BM25Index]:
+        with self._keyword_lock:
+            if self._playbook_keywords is None:
+                docs = self.playbook_docs or load_playbooks()
+                self._playbook_keywords = _keywords(self.path, docs, PLAYBOOK_BM25_FILE)
+            return self._playbook_keywords
+
+
+_EMPTY_GENERATION = IndexGeneration("empty", INDEX_DIR / "generations" / "empty")
+
+
+def _resolve_generation_path() -> Optional[Path]:
+    path = INDEX_STORE.current()
+    if path is not None:
+        return path
+    # Indexes built before generations existed live directly in INDEX_DIR.
+    if (INDEX_DIR / EVENT_INDEX_FILE).exists() or (INDEX_DIR / PLAYBOOK_INDEX_FILE).exists():
+        return INDEX_DIR
+    return None
+
+
+def current_generation() -> IndexGeneration:
+    """Return the live index generation, switching to a newly published one if needed.
+
+    Callers keep the returned object for the whole request, so a swap never changes
+    the indexes under an in-flight search. Only one thread loads a new generation;
+    the others keep serving the previous one instead of waiting.
+    """
+    global _GENERATION, _GENERATION_STAMP
+    stamp = INDEX_STORE.manifest_stamp()
+    generation = _GENERATION
+    if generation is not None and stamp == _GENERATION_STAMP:
+        return generation
+    if not _GENERATION_LOCK.acquire(blocking=generation is None):
+        return generation
+    try:
+        if _GENERATION is not None and stamp == _GENERATION_STAMP:
+            return _GENERATION
+        path = _resolve_generation_path()
+        name = "legacy" if path == INDEX_DIR else (path.name if path is not None else "empty")
+        if _GENERATION is None or _GENERATION.name != name:
+            loaded = IndexGeneration(name, path) if path is not None else _EMPTY_GENERATION
+            _LIVE_GENERATIONS[name] = loaded
+            _GENERATION = loaded
+            INDEX_STORE.collect_garbage(in_use=list(_LIVE_GENERATIONS.keys()))
+        _GENERATION_STAMP = stamp
+        return _GENERATION
+    finally:
+        _GENERATION_LOCK.release()
+
+
+def _hits(docs: Sequence[Dict[str, str]], rows: List[int]) -> List[Dict[str, str]]:
+    return [docs[row] for row in rows if row >= 0 and row < len(docs)]
+
+
+class RetrievalContext:
+    """Embeds a set of queries once and shares the vectors across every index search.
+
+    Results are memoized per search so callers (and the per-row views returned by
+    ``row``) can ask for events and playbooks without paying for another encode or
+    another ``index.search``.
+    """
+
+    def __init__(
+        self,
+        queries: List[str],
+        embeddings: Optional[np.ndarray],
+        generation: IndexGeneration,
+        mode: str = "vector",
+    ):
+        self.queries = queries
+        self.embeddings = embeddings
+        self.generation = generation
+        self.mode = mode
+        self._results: Dict[Tuple, List[List[Dict[str, str]]]] = {}
+
+    @classmethod
+    def from_queries(cls, queries: List[str], mode: Optional[str] = None) -> "RetrievalContext":
+        mode = (mode or os.getenv("RETRIEVAL_MODE", "vector")).lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Expected one of {sorted(RETRIEVAL_MODES)}.")
+        generation = current_generation()
+        embeddings = None
+        has_vectors = generation.has_event_vectors or generation.playbook_index is not None or bool(_shard_endpoints())
+        if queries and has_vectors and mode != "keyword":
+            embeddings = _embed_texts(queries)
+        return cls(list(queries), embeddings, generation, mode)
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def row(self, position: int) -> "RetrievalContext":
+        embeddings = None
+        if self.embeddings is not None:
+            embeddings = self.embeddings[position : position + 1]
+        view = RetrievalContext([self.queries[position]], embeddings, self.generation, self.mode)
+        for key, results in self._results.items():
+            view._results[key] = [results[position]]
+        return view
+
+    def events(self, top_k: int = 5, since: TimeBound = None, until: TimeBound = None) -> List[List[Dict[str, str]]]:
+        """Top events per query, optionally limited to timestamps in ``[since, until]``."""
+        since, until = parse_timestamp(since), parse_timestamp(until)
+        key = ("events", top_k, since, until)
+        if key not in self._results:
+            with INDEX_SEARCH_SECONDS.time(index="events"):
+                self._results[key] = self._search_events(top_k, since, until)
+        return self._results[key]
+
+    def playbooks(self, team: Optional[str] = None, top_k: int = 4) -> List[List[Dict[str, str]]]:
+        key = ("playbooks", team, top_k)
+        if key not in self._results:
+            with INDEX_SEARCH_SECONDS.time(index="playbooks"):
+                self._results[key] = self._search_playbooks(team, top_k)
+        return self._results[key]
+
+    def _combine(
+        self,
+        vector_rows: Optional[List[List[int]]],
+        keyword_rows,
+        top_k: int,
+    ) -> List[List[int]]:
+        """Pick vector, BM25 or fused rankings per query according to the mode."""
+        if vector_rows is None:
+            return [keyword_rows(query, top_k) for query in self.queries]
+        if self.mode != "hybrid":
+            return vector_rows
+        depth = top_k * HYBRID_DEPTH
+        return [
+            reciprocal_rank_fusion([rows, keyword_rows(query, depth)], top_k)
+            for query, rows in zip(self.queries, vector_rows)
+        ]
+
+    def _search_events(self, top_k: int, since: Optional[datetime], until: Optional[datetime]) -> List[List[Dict[str, str]]]:
+        if not self.queries:
+            return []
+        depth = top_k * HYBRID_DEPTH if self.mode == "hybrid" else top_k
+
+        endpoints = _shard_endpoints()
+        if endpoints:
+            # Shard servers each own a partition of the shards; this process only merges.
+            payload = {
+                "queries": self.queries,
+                "embeddings": self.embeddings.tolist() if self.embeddings is not None else None,
+                "depth": depth,
+                "mode": self.mode,
+                "since": since.isoformat() if since else None,
+                "until": until.isoformat() if until else None,
+            }
+            parts = _fan_out([partial(_remote_search, endpoint, payload) for endpoint in endpoints])
+            hits = ShardHits.merge(parts, len(self.queries), depth)
+        else:
+            shards = self.generation.select_shards(since, until)
+            hits = search_shards(shards, self.embeddings, self.queries, depth, self.mode, since, until)
+        ranked = hits.ranked(self.mode, top_k) or [[] for _ in self.queries]
+        return [[hits.resolve(key) for key in keys] for keys in ranked]
+
+    def _search_playbooks(self, team: Optional[str], top_k: int) -> List[List[Dict[str, str]]]:
+        if not self.queries:
+            return []
+        generation = self.generation
+        depth = top_k * HYBRID_DEPTH if self.mode == "hybrid" else top_k
+
+        vector_rows = None
+        if generation.playbook_docs and self.embeddings is not None:
+            if team and generation.team_indexes:
+                # Search only the team's own vectors, so top_k is always honoured.
+                vector_rows = [[] for _ in self.queries]
+                if team in generation.team_indexes:
+                    index, rows = generation.team_indexes[team]
+                    scores, indices = index.search(self.embeddings, min(depth, index.ntotal))
+                    vector_rows = [[int(row) for row in rows[local[local >= 0]]] for local in indices]
+            elif generation.playbook_index is not None:
+                # Generations built before per-team indexes over-fetch and filter.
+                fetch = depth * 2 if team else depth
+                scores, indices = generation.playbook_index.search(self.embeddings, fetch)
+                vector_rows = [
+                    [
+                        int(row)
+                        for row in ranked
+                        if row >= 0 and (not team or generation.playbook_docs[row].get("team") == team)
+                    ][:depth]
+                    for ranked in indices
+                ]
+
+        docs = generation.playbook_docs
+        if vector_rows is None or self.mode == "hybrid":
+            docs, bm25 = generation.playbook_keywords()
+
+            def in_team(row: int) -> bool:
+                return docs[row].get("team") == team
+
+            def keyword_rows(query: str, k: int) -> List[int]:
+                return [row for row, score in bm25.search(query, k, predicate=in_team if team else None)]
+        else:
+            keyword_rows = None
+
+        ranked = self._combine(vector_rows, keyword_rows, top_k)
+        return [_hits(docs, rows[:top_k]) for rows in ranked]
+
+
+def retrieve_events(
+    query: str,
+    top_k: int = 5,
+    mode: Optional[str] = None,
+    since: TimeBound = None,
+    until: TimeBound = None,
+) -> List[Dict[str, str]]:
+    return RetrievalContext.from_queries([query], mode=mode).events(top_k, since, until)[0]
+
+
+def retrieve_playbooks(
+    query: str,
+    team: Optional[str] = None,
+    top_k: int = 4,
+    mode: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    return RetrievalContext.from_queries([query], mode=mode).playbooks(team, top_k)[0]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from ..metrics import PROMETHEUS_CONTENT_TYPE, render_metrics
+from .retrieve import RETRIEVAL_MODES, EventShard, current_generation, search_shards
+from .shards import parse_timestamp
+
+app = FastAPI(title="Customer Incident Radar shard server", version="0.1.0")
+
+
+class ShardSearchRequest(BaseModel):
+    queries: List[str]
+    embeddings: Optional[List[List[float]]] = None
+    depth: int = 5
+    mode: str = "vector"
+    since: Optional[str] = None
+    until: Optional[str] = None
+
+
+def _partition() -> Tuple[int, int]:
+    """``SHARD_PARTITION=i/n`` makes this server own every shard whose name hashes to ``i`` mod ``n``."""
+    position, _, count = os.getenv("SHARD_PARTITION", "0/1").partition("/")
+    return int(position), int(count or 1)
+
+
+def owned_shards(shards: List[EventShard]) -> List[EventShard]:
+    position, count = _partition()
+    return [shard for shard in shards if zlib.crc32(shard.name.encode("utf-8")) % count == position]
+
+
+@app.get("/health")
+async def health() -> dict:
+    """Health check endpoint"""
+    generation = current_generation()
+    return {"status": "ok", "generation": generation.name, "shards": [shard.name for shard in owned_shards(generation.event_shards)]}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Index search times of this server in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.post("/search")
+def search(request: ShardSearchRequest) -> dict:
+    """Search this server's event shards and return the merged top hits with their records"""
+    if request.mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode '{request.mode}'")
+    since, until = parse_timestamp(request.since), parse_timestamp(request.until)
+    embeddings = np.asarray(request.embeddings, dtype="float32") if request.embeddings is not None else None
+    shards = owned_shards(current_generation().select_shards(since, until))
+    hits = search_shards(shards, embeddings, request.queries, request.depth, request.mode, since, until)
+    return hits.to_payload()
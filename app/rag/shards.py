@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, Union
+
+SHARD_BY_CHOICES = ("none", "day", "month")
+SHARDS_DIR = "shards"
+# Events without a parseable timestamp; never expires and is skipped by time-range searches.
+UNDATED_SHARD = "undated"
+
+TimeBound = Union[str, datetime, None]
+
+
+def shard_by_from_env() -> str:
+    shard_by = os.getenv("INDEX_SHARD_BY", "none").lower()
+    if shard_by not in SHARD_BY_CHOICES:
+        raise ValueError(f"Unknown INDEX_SHARD_BY '{shard_by}'. Expected one of {list(SHARD_BY_CHOICES)}.")
+    return shard_by
+
+
+def retention_days_from_env() -> Optional[int]:
+    days = os.getenv("INDEX_RETENTION_DAYS")
+    return int(days) if days and int(days) > 0 else None
+
+
+def parse_timestamp(value: TimeBound) -> Optional[datetime]:
+    """Parse an ISO-8601 timestamp (``Z`` suffix allowed) into an aware UTC datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def bucket_for(timestamp: TimeBound, shard_by: str) -> str:
+    parsed = parse_timestamp(timestamp)
+    if parsed is None:
+        return UNDATED_SHARD
+    if shard_by == "day":
+        return parsed.strftime("%Y-%m-%d")
+    return parsed.strftime("%Y-%m")
+
+
+def bucket_bounds(bucket: str, shard_by: str) -> Optional[Tuple[datetime, datetime]]:
+    """``[start, end)`` covered by a shard, or None when it is not bounded in time."""
+    if bucket == UNDATED_SHARD or shard_by == "none":
+        return None
+    if shard_by == "day":
+        start = datetime.strptime(bucket, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        return start, start + timedelta(days=1)
+    start = datetime.strptime(bucket, "%Y-%m").replace(tzinfo=timezone.utc)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def is_expired(bounds: Optional[Tuple[datetime, datetime]], retention_days: Optional[int], now: Optional[datetime] = None) -> bool:
+    if bounds is None or retention_days is None:
+        return False
+    now = now or datetime.now(timezone.utc)
+    return bounds[1] <= now - timedelta(days=retention_days)
+
+
+def overlaps(bounds: Optional[Tuple[datetime, datetime]], since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """Whether a shard may hold events in ``[since, until]``; unbounded shards always may."""
+    if bounds is None or (since is None and until is None):
+        return True
+    return (since is None or bounds[1] > since) and (until is None or bounds[0] <= until)
+
+
+def within(bounds: Optional[Tuple[datetime, datetime]], since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """Whether every event in a shard falls inside ``[since, until]``, so hits need no filtering."""
+    if since is None and until is None:
+        return True
+    if bounds is None:
+        return False
+    return (since is None or bounds[0] >= since) and (until is None or bounds[1] <= until)
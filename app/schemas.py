@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 TEAM_LIST = [
     "HR",
@@ -90,6 +90,30 @@ class GuardrailResult(BaseModel):
     issues: List[str]
 
 
+class GuardrailVerdict(BaseModel):
+    """Raw verdict returned by the guardrails LLM"""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    passed: bool = Field(alias="pass")
+    issues: List[str] = []
+
+
+class StageTiming(BaseModel):
+    name: str
+    start_ms: float
+    end_ms: float
+    duration_ms: float
+
+
+class PipelineTrace(BaseModel):
+    """Per-stage timings of one pipeline run, offsets relative to its start"""
+
+    total_ms: float
+    stages: List[StageTiming]
+    critical_path: List[str]
+
+
 class DashboardCard(BaseModel):
     incident: EventRecord
     signals: SignalExtraction
@@ -98,6 +122,20 @@ class DashboardCard(BaseModel):
     reverse_prompt: ReversePromptOutput
     guardrails: GuardrailResult
     status: str
+    tier: str = "llm"
+    related_event_ids: List[str] = []
+    trace: Optional[PipelineTrace] = None
+
+
+class ThreadState(BaseModel):
+    """Latest card of a thread and the retrieved context it was built from"""
+
+    thread_id: str
+    card: DashboardCard
+    event_snippets: List[dict]
+    playbook_snippets: List[dict]
+    event_ids: List[str]
+    updated_at: float
 
 
 class CleanDemoCard(BaseModel):
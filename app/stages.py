@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import PIPELINE_SECONDS, STAGE_SECONDS
+from .schemas import PipelineTrace, StageTiming
+
+_STAGE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_STAGE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _STAGE_EXECUTOR
+    with _STAGE_EXECUTOR_LOCK:
+        if _STAGE_EXECUTOR is None:
+            _STAGE_EXECUTOR = ThreadPoolExecutor(
+                max_workers=int(os.getenv("STAGE_WORKERS", "8")),
+                thread_name_prefix="stage",
+            )
+        return _STAGE_EXECUTOR
+
+
+class StageGraph:
+    """A set of named stages, each a function of the results of the stages it depends on.
+
+    ``run`` starts every stage as soon as its dependencies have finished, so
+    independent stages overlap, and records when each one started and ended.
+    """
+
+    def __init__(self, name: str = "incident"):
+        self.name = name
+        self._stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[..., Any], deps: Sequence[str] = ()) -> "StageGraph":
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages {missing}")
+        self._stages[name] = (func, tuple(deps))
+        return self
+
+    def run(self) -> Tuple[Dict[str, Any], PipelineTrace]:
+        started = time.perf_counter()
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Tuple[float, float]] = {}
+        running: Dict[Future, str] = {}
+        pending = dict(self._stages)
+
+        def timed(name: str, func: Callable[..., Any], args: List[Any]) -> Any:
+            begin = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                end = time.perf_counter()
+                timings[name] = (begin - started, end - started)
+                STAGE_SECONDS.observe(end - begin, graph=self.name, stage=name)
+
+        try:
+            while pending or running:
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        del pending[name]
+                        future = _executor().submit(timed, name, func, [results[dep] for dep in deps])
+                        running[future] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+        total = time.perf_counter() - started
+        PIPELINE_SECONDS.observe(total, graph=self.name)
+        return results, self._trace(timings, total)
+
+    def _trace(self, timings: Dict[str, Tuple[float, float]], total: float) -> PipelineTrace:
+        stages = [
+            StageTiming(
+                name=name,
+                start_ms=round(begin * 1000, 2),
+                end_ms=round(end * 1000, 2),
+                duration_ms=round((end - begin) * 1000, 2),
+            )
+            for name, (begin, end) in sorted(timings.items(), key=lambda item: item[1][0])
+        ]
+        # Walk back from the last stage to finish through whichever dependency finished last.
+        path: List[str] = []
+        current = max(timings, key=lambda name: timings[name][1]) if timings else None
+        while current is not None:
+            path.append(current)
+            deps = self._stages[current][1]
+            current = max(deps, key=lambda dep: timings[dep][1]) if deps else None
+        return PipelineTrace(total_ms=round(total * 1000, 2), stages=stages, critical_path=list(reversed(path)))
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import List, Optional
+
+from .agents.reverse_prompt import evidence_line, key_considerations, situation_background
+from .coalesce import ESCALATING_INTENTS
+from .schemas import (
+    DashboardCard,
+    EventRecord,
+    ReversePromptOutput,
+    RiskScores,
+    RoutingDecision,
+    SignalExtraction,
+    SignalFlags,
+    ThreadState,
+)
+
+THREAD_TIER = "thread"
+
+URGENCY_LEVELS = ["low", "medium", "high"]
+
+_THREAD_STORE: Optional["ThreadStore"] = None
+_THREAD_STORE_LOCK = threading.Lock()
+
+
+def thread_state_enabled() -> bool:
+    return os.getenv("THREAD_STATE", "false").lower() in {"1", "true", "yes"}
+
+
+def _max_evidence() -> int:
+    return int(os.getenv("THREAD_MAX_EVIDENCE", "20"))
+
+
+class ThreadStore:
+    """Latest ``ThreadState`` per ``thread_id`` in a SQLite file shared by every worker on the host.
+
+    States untouched for ``ttl_seconds`` are treated as gone, so a thread that
+    resurfaces much later is processed from scratch.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._thread_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def lock(self, thread_id: str) -> threading.Lock:
+        """Serializes updates of one thread within this process."""
+        with self._lock:
+            lock = self._thread_locks.get(thread_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._thread_locks[thread_id] = lock
+            return lock
+
+    def get(self, thread_id: str) -> Optional[ThreadState]:
+        with self._lock:
+            row = self._db.execute("SELECT state, updated_at FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is None or (self.ttl_seconds > 0 and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return ThreadState.model_validate_json(row[0])
+
+    def put(self, state: ThreadState) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, state, updated_at) VALUES (?, ?, ?)",
+                (state.thread_id, state.model_dump_json(), state.updated_at),
+            )
+
+
+def _default_path() -> Path:
+    return Path(__file__).resolve().parents[1] / "data" / "threads" / "threads.sqlite"
+
+
+def thread_store() -> ThreadStore:
+    global _THREAD_STORE
+    with _THREAD_STORE_LOCK:
+        if _THREAD_STORE is None:
+            _THREAD_STORE = ThreadStore(
+                Path(os.getenv("THREAD_STORE_PATH", str(_default_path()))),
+                ttl_seconds=float(os.getenv("THREAD_STATE_TTL_SECONDS", str(7 * 24 * 3600))),
+            )
+        return _THREAD_STORE
+
+
+def new_state(card: DashboardCard, event_snippets: List[dict], playbook_snippets: List[dict]) -> ThreadState:
+    return ThreadState(
+        thread_id=card.incident.thread_id,
+        card=card,
+        event_snippets=event_snippets,
+        playbook_snippets=playbook_snippets,
+        event_ids=[card.incident.event_id],
+        updated_at=time.time(),
+    )
+
+
+def _urgency_rank(urgency: str) -> int:
+    return URGENCY_LEVELS.index(urgency) if urgency in URGENCY_LEVELS else -1
+
+
+def merge_signals(previous: SignalExtraction, latest: SignalExtraction) -> SignalExtraction:
+    """Thread-level signals after one more message.
+
+    Flags accumulate and urgency only rises; the latest message sets the
+    sentiment, and replaces topic, intent and summary only when it escalates.
+    """
+    escalated = latest.intent in ESCALATING_INTENTS and latest.intent != previous.intent
+    return SignalExtraction(
+        topic=latest.topic if escalated or previous.topic == "other" else previous.topic,
+        intent=latest.intent if escalated or previous.intent == "other" else previous.intent,
+        sentiment=latest.sentiment,
+        urgency=max(previous.urgency, latest.urgency, key=_urgency_rank),
+        signals=SignalFlags(
+            **{name: getattr(previous.signals, name) or getattr(latest.signals, name) for name in SignalFlags.model_fields}
+        ),
+        evidence=(previous.evidence + latest.evidence)[-_max_evidence():],
+        summary=latest.summary if escalated else previous.summary,
+    )
+
+
+def update_reverse_prompt(
+    card: DashboardCard,
+    latest: SignalExtraction,
+    signals: SignalExtraction,
+    scores: RiskScores,
+    routing: RoutingDecision,
+) -> ReversePromptOutput:
+    """Rewrite only the sections of the card's reverse prompt that the new message changes."""
+    prompt = card.reverse_prompt.employee_prompt
+    updates = {
+        "evidence_analysis": (prompt.evidence_analysis + [evidence_line(ev) for ev in latest.evidence])[-_max_evidence():]
+    }
+    if (
+        routing != card.routing
+        or scores != card.scores
+        or (signals.topic, signals.sentiment, signals.urgency)
+        != (card.signals.topic, card.signals.sentiment, card.signals.urgency)
+    ):
+        updates["situation_background"] = situation_background(routing, scores, signals)
+    if routing != card.routing or signals.topic != card.signals.topic:
+        updates["key_considerations"] = key_considerations(routing, signals)
+    if signals.summary != card.signals.summary:
+        updates["customer_context"] = signals.summary
+
+    citations = dict(card.reverse_prompt.citations)
+    sources = list(citations.get("evidence_sources", []))
+    citations["evidence_sources"] = sources + [ev.source for ev in latest.evidence if ev.source not in sources]
+    return ReversePromptOutput(employee_prompt=prompt.model_copy(update=updates), citations=citations)
+
+
+def advance(state: ThreadState, incident: EventRecord, card: DashboardCard) -> ThreadState:
+    return state.model_copy(
+        update={"card": card, "event_ids": state.event_ids + [incident.event_id], "updated_at": time.time()}
+    )
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import json
+import shutil
+import zlib
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pytest
+
+from app import pipeline
+from app.rag import index_build, retrieve
+from app.rag.bm25 import tokenize
+from app.rag.generations import GenerationStore
+from app.schemas import (
+    DashboardCard,
+    EventRecord,
+    EvidenceQuote,
+    GuardrailResult,
+    ReversePrompt,
+    ReversePromptOutput,
+    RiskScores,
+    RoutingDecision,
+    SignalExtraction,
+    SignalFlags,
+)
+
+COLLECTIVE_REPLY = {
+    "clusters": [{"pattern": "duplicate billing", "event_indices": [0, 1], "severity": "High", "teams": ["Finance"], "keywords": ["charge"]}],
+    "systemic_patterns": ["Billing retries charge twice"],
+    "policy_violations": [{"event_index": 1, "violation": "Refund SLA missed"}],
+    "immediate_actions": ["Refund duplicate charges"],
+    "team_alerts": {"Finance": "2 billing incidents"},
+}
+
+
+class FakeLLM:
+    """Answers every agent with a fixed, schema-valid reply and records the requests."""
+
+    enforces_schema = False
+
+    def __init__(self):
+        self.calls: List[Optional[str]] = []
+
+    def chat(self, messages: List[Dict[str, str]], response_schema=None) -> str:
+        name = response_schema.__name__ if response_schema is not None else None
+        self.calls.append(name)
+        if name == "SignalExtraction":
+            return json.dumps(
+                {
+                    "topic": "billing",
+                    "intent": "complaint",
+                    "sentiment": "negative",
+                    "urgency": "high",
+                    "signals": {"virality_threat": False, "repeat_contact": False, "high_reach": False, "compliance_sensitive": False},
+                    "evidence": [{"source": "email", "timestamp": "2026-01-31T08:05:00Z", "quote": "two charges"}],
+                    "summary": "Customer was charged twice",
+                }
+            )
+        if name == "ReversePromptOutput":
+            return json.dumps(
+                {
+                    "employee_prompt": {
+                        "situation_background": "Duplicate charge reported.",
+                        "customer_context": "Long-time customer.",
+                        "evidence_analysis": ["Invoice shows two charges."],
+                        "relevant_policy_excerpts": [],
+                        "similar_cases": [],
+                        "key_considerations": ["Confirm the duplicate before refunding."],
+                    },
+                    "citations": {"evidence_sources": ["email"]},
+                }
+            )
+        if name is None:
+            return json.dumps(COLLECTIVE_REPLY)
+        return json.dumps({"pass": True, "issues": []})
+
+    def submit(self, messages: List[Dict[str, str]], response_schema=None) -> Future:
+        future: Future = Future()
+        future.set_result(self.chat(messages, response_schema))
+        return future
+
+
+class FakeContext:
+    def events(self, top_k: int):
+        return [[{"event_id": "evt_past", "text": "Charged twice last month"}]]
+
+    def playbooks(self, team, top_k: int):
+        return [[{"source": "GlobalPolicy.md", "text": "Refund duplicate charges within 5 days."}]]
+
+
+@pytest.fixture
+def fake_llm(monkeypatch) -> FakeLLM:
+    """Replaces every agent client and retrieval with in-memory fakes."""
+    client = FakeLLM()
+    monkeypatch.setattr(pipeline, "_client_from_env", lambda *args: client)
+    monkeypatch.setattr(pipeline, "retrieval_contexts", lambda incidents: [FakeContext() for _ in incidents])
+    return client
+
+
+class FakeEmbedder:
+    """Hashed bag-of-words vectors, so texts sharing words land close together."""
+
+    dim = 64
+
+    def __init__(self):
+        self.encoded: List[List[str]] = []
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True) -> np.ndarray:
+        self.encoded.append(list(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                vectors[row, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+@pytest.fixture
+def rag(monkeypatch, tmp_path) -> FakeEmbedder:
+    """Index builds and retrieval over a copy of the sample data, with a fake embedder."""
+    data = Path(__file__).resolve().parents[1] / "data"
+    samples, playbooks = tmp_path / "samples", tmp_path / "playbooks"
+    shutil.copytree(data / "samples", samples)
+    shutil.copytree(data / "playbooks", playbooks)
+    store = GenerationStore(tmp_path / "indexes")
+    for module in (retrieve, index_build):
+        monkeypatch.setattr(module, "SAMPLES_DIR", samples)
+        monkeypatch.setattr(module, "PLAYBOOK_DIR", playbooks)
+        monkeypatch.setattr(module, "INDEX_STORE", store)
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(retrieve, "INDEX_DIR", tmp_path / "indexes")
+    monkeypatch.setattr(retrieve, "_EMBEDDER", embedder)
+    monkeypatch.setattr(retrieve, "_EMBED_CACHE", None)
+    monkeypatch.setattr(retrieve, "_GENERATION", None)
+    monkeypatch.setattr(retrieve, "_GENERATION_STAMP", None)
+    monkeypatch.setenv("EMBEDDING_CACHE_DIR", str(tmp_path / "embed_cache"))
+    monkeypatch.setenv("EMBED_WORKERS", "1")
+    return embedder
+
+
+def make_event(index: int, text: str = "My January invoice shows two charges.", thread_id: Optional[str] = None) -> EventRecord:
+    return EventRecord(
+        event_id=f"e{index}",
+        source="email",
+        timestamp="2026-01-31T08:05:00Z",
+        actor_type="customer",
+        actor_id=f"cust_{index}",
+        thread_id=thread_id or f"th_{index}",
+        text=text,
+    )
+
+
+def make_card(**prompt_fields) -> DashboardCard:
+    """A card that passes every rule-based guardrail unless ``prompt_fields`` override it."""
+    prompt = {
+        "situation_background": "Customer reports a duplicate charge on the January invoice.",
+        "customer_context": "Long-time customer.",
+        "evidence_analysis": ["Invoice shows two charges."],
+        "relevant_policy_excerpts": [],
+        "similar_cases": [],
+        "key_considerations": ["Confirm the duplicate before replying."],
+    }
+    prompt.update(prompt_fields)
+    incident = make_event(0)
+    return DashboardCard(
+        incident=incident,
+        signals=SignalExtraction(
+            topic="billing",
+            intent="complaint",
+            sentiment="negative",
+            urgency="medium",
+            signals=SignalFlags(virality_threat=False, repeat_contact=False, high_reach=False, compliance_sensitive=False),
+            evidence=[EvidenceQuote(source=incident.source, timestamp=incident.timestamp, quote=incident.text)],
+            summary="Duplicate charge",
+        ),
+        scores=RiskScores(virality=0, churn=0, compliance=0, financial=25, operational=0),
+        routing=RoutingDecision(primary_team="Finance", watchers=[], priority="P3"),
+        reverse_prompt=ReversePromptOutput(employee_prompt=ReversePrompt(**prompt), citations={"evidence_sources": ["email"]}),
+        guardrails=GuardrailResult(passed=True, issues=[]),
+        status="pending",
+    )
@@ -0,0 +1,31 @@
+from app import pipeline
+
+from .conftest import FakeContext, make_event
+
+TEXTS = [
+    "My January invoice shows two charges.",
+    "The export button crashes the app every time.",
+    "I will cancel unless someone answers about my refund.",
+]
+
+
+def _comparable(card):
+    return card.model_dump(exclude={"trace"})
+
+
+def test_batch_cards_match_single_incident_cards(fake_llm):
+    incidents = [make_event(index, text) for index, text in enumerate(TEXTS)]
+
+    batched = pipeline.process_incidents(incidents)
+    single = [pipeline.process_incident(incident, FakeContext()) for incident in incidents]
+
+    assert [_comparable(card) for card in batched] == [_comparable(card) for card in single]
+    assert [card.incident.event_id for card in batched] == ["e0", "e1", "e2"]
+
+
+def test_batch_shares_one_trace_with_batched_stages(fake_llm):
+    cards = pipeline.process_incidents([make_event(index, text) for index, text in enumerate(TEXTS)])
+
+    assert all(card.trace == cards[0].trace for card in cards)
+    assert {stage.name for stage in cards[0].trace.stages} >= {"embed", "signals", "reverse_prompt", "guardrails"}
+    assert pipeline.process_incidents([]) == []
@@ -0,0 +1,33 @@
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion
+
+DOCS = [
+    "Refund policy for duplicate invoice charges",
+    "Password reset emails are delayed",
+    "Invoice totals include tax",
+    "Shipping delays over the holidays",
+]
+
+
+def test_search_ranks_rows_sharing_rare_terms_first():
+    index = BM25Index.build(DOCS)
+    hits = index.search("duplicate invoice", top_k=2)
+    assert [row for row, _ in hits] == [0, 2]
+    assert index.search("nothing matches", top_k=3) == []
+
+
+def test_predicate_filters_candidates_before_top_k():
+    index = BM25Index.build(DOCS)
+    assert [row for row, _ in index.search("invoice", top_k=1, predicate=lambda row: row != 0)] == [2]
+
+
+def test_incremental_add_and_round_trip_match_a_full_build(tmp_path):
+    index = BM25Index.build(DOCS[:2])
+    index.add(DOCS[2:])
+    index.save(tmp_path / "bm25.json")
+    loaded = BM25Index.load(tmp_path / "bm25.json")
+    assert loaded.search("invoice delays", top_k=4) == BM25Index.build(DOCS).search("invoice delays", top_k=4)
+    assert len(loaded) == len(DOCS)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], top_k=2) == [1, 3]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from app.agents.signal_extractor import heuristic_confidence
+from app.cascade import triage
+
+from .conftest import make_event
+
+
+@pytest.mark.parametrize("text", ["My card was declined at checkout and I will sue you", "zzz qwerty"])
+def test_unrecognised_text_escalates(text):
+    incident = make_event(0, text)
+    fast = triage(incident)
+
+    assert heuristic_confidence(incident) == 0.0
+    assert not fast.fast_path
+
+
+def test_recognised_topic_without_intent_escalates():
+    fast = triage(make_event(0, "The invoice arrived"))
+
+    assert fast.signals.topic == "billing" and fast.signals.intent == "other"
+    assert not fast.fast_path
+
+
+def test_confident_low_risk_incident_takes_fast_path():
+    fast = triage(make_event(0, "Why is the price on my invoice higher?"))
+
+    assert (fast.signals.topic, fast.signals.intent, fast.routing.priority) == ("billing", "information_request", "P3")
+    assert fast.confidence == 1.0
+    assert fast.fast_path
+
+
+def test_competing_keyword_groups_lower_confidence(monkeypatch):
+    # "bill" and "down" match two topic groups.
+    incident = make_event(0, "Why is the billing page down?")
+
+    assert heuristic_confidence(incident) == 0.5
+    monkeypatch.setenv("CASCADE_MIN_CONFIDENCE", "0.75")
+    assert not triage(incident).fast_path
+
+
+def test_urgent_priority_always_escalates():
+    fast = triage(make_event(0, "How can you reset my password on the account page?"))
+
+    assert fast.routing.priority != "P3"
+    assert not fast.fast_path
@@ -0,0 +1,65 @@
+import pytest
+
+from app import pipeline, threads
+from app.coalesce import COALESCED_TIER, IncidentCoalescer
+from app.threads import THREAD_TIER
+
+from .conftest import make_event
+
+
+@pytest.fixture
+def coalescing(monkeypatch, tmp_path, fake_llm):
+    monkeypatch.setenv("PIPELINE_COALESCE", "true")
+    monkeypatch.setenv("THREAD_STORE_PATH", str(tmp_path / "threads.sqlite"))
+    monkeypatch.setattr(pipeline, "COALESCER", IncidentCoalescer())
+    monkeypatch.setattr(threads, "_THREAD_STORE", None)
+    return fake_llm
+
+
+def test_repeat_card_describes_the_repeat(coalescing):
+    leader, repeat = make_event(1), make_event(2)
+
+    cards = pipeline.process_incidents([leader, repeat])
+
+    assert cards[0].incident.event_id == "e1"
+    assert cards[1].tier == COALESCED_TIER
+    assert cards[1].incident == repeat
+    assert cards[1].related_event_ids == ["e1"]
+    assert len(cards[1].signals.evidence) == len(cards[0].signals.evidence) + 1
+
+
+def test_same_thread_follow_up_is_coalesced_without_thread_state(coalescing):
+    first = make_event(1, thread_id="th_a")
+    follow_up = make_event(2, "Just checking in on this, thanks.", thread_id="th_a")
+
+    cards = pipeline.process_incidents([first, follow_up])
+
+    assert cards[1].tier == COALESCED_TIER
+
+
+def test_known_thread_gets_the_thread_update_with_thread_state(coalescing, monkeypatch):
+    monkeypatch.setenv("THREAD_STATE", "true")
+    first = make_event(1, thread_id="th_a")
+    follow_up = make_event(2, "Just checking in on this, thanks.", thread_id="th_a")
+
+    cards = pipeline.process_incidents([first, follow_up])
+    assert cards[1].tier == THREAD_TIER
+    assert cards[1].incident == follow_up
+
+    later = pipeline.process_incident(make_event(3, "Still waiting on that invoice fix.", thread_id="th_a"))
+    assert later.tier == THREAD_TIER
+    assert threads.thread_store().get("th_a").event_ids[-1] == "e3"
+
+
+def test_raised_priority_is_reflected_in_the_narrative(coalescing, monkeypatch):
+    monkeypatch.setenv("COALESCE_VIRAL_COUNT", "2")
+    monkeypatch.setattr(pipeline, "COALESCER", IncidentCoalescer())
+
+    leader, repeat = pipeline.process_incidents([make_event(1), make_event(2)])
+    prompt = repeat.reverse_prompt.employee_prompt
+
+    assert repeat.routing.priority != leader.routing.priority
+    assert f"with {repeat.routing.priority} priority" in prompt.situation_background
+    assert f"Priority set to {repeat.routing.priority} due to risk factors" in prompt.key_considerations
+    assert len(prompt.evidence_analysis) == len(leader.reverse_prompt.employee_prompt.evidence_analysis) + 1
+    assert repeat.status == ("ready" if repeat.guardrails.passed else "blocked")
@@ -0,0 +1,28 @@
+from app.rag.docstore import DocStore, append_records, write_records
+
+RECORDS = [{"text": "first"}, {"text": "second é"}, {"text": "third"}]
+
+
+def test_rows_are_read_through_the_offset_table(tmp_path):
+    path, offsets = tmp_path / "events.jsonl", tmp_path / "events.offsets"
+    write_records(path, offsets, RECORDS[:2])
+    append_records(path, offsets, RECORDS[2:])
+
+    store = DocStore(path, offsets)
+    assert len(store) == 3
+    assert store[1] == RECORDS[1]
+    assert store.get_many([2, 0]) == [RECORDS[2], RECORDS[0]]
+
+
+def test_count_hides_rows_appended_after_a_generation(tmp_path):
+    path, offsets = tmp_path / "events.jsonl", tmp_path / "events.offsets"
+    write_records(path, offsets, RECORDS)
+    assert list(DocStore(path, offsets, count=2)) == RECORDS[:2]
+
+
+def test_store_without_offsets_is_scanned(tmp_path):
+    path = tmp_path / "legacy.jsonl"
+    path.write_text('{"text": "a"}\n\n{"text": "b"}', encoding="utf-8")
+    store = DocStore(path, tmp_path / "missing.offsets")
+    assert list(store) == [{"text": "a"}, {"text": "b"}]
+    assert not DocStore(tmp_path / "empty.jsonl", tmp_path / "empty.offsets")
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.rag.embed_cache import EmbeddingCache
+
+
+def _vector(index):
+    return np.full((1, 4), float(index), dtype="float32")
+
+
+def _cache(directory, **kwargs):
+    kwargs.setdefault("memory_entries", 0)
+    return EmbeddingCache(directory, "test-model", dtype="float32", **kwargs)
+
+
+def _put(cache, *indexes):
+    for index in indexes:
+        cache.put_many([f"t{index}"], _vector(index))
+
+
+def test_stale_reader_reloads_after_another_process_compacts(tmp_path):
+    reader = _cache(tmp_path)
+    _put(reader, 0, 1, 2, 3)
+    assert all(v is not None for v in reader.get_many([f"t{i}" for i in range(4)]))
+    # Row 4 is known to the reader but lies past the matrix it has mapped.
+    _put(reader, 4)
+
+    compactor = _cache(tmp_path, max_entries=4)
+    _put(compactor, 5)
+    assert compactor.stats()["evicted"] == 3
+    _put(_cache(tmp_path), 6, 7)
+
+    vector, evicted = reader.get_many(["t4", "t0"])
+    np.testing.assert_array_equal(vector, _vector(4)[0])
+    assert evicted is None
+    np.testing.assert_array_equal(reader.get_many(["t7"])[0], _vector(7)[0])
+
+
+def test_stale_pair_keeps_answering_from_its_own_generation(tmp_path):
+    reader = _cache(tmp_path)
+    _put(reader, 0, 1, 2, 3)
+    reader.get_many(["t0"])
+
+    _put(_cache(tmp_path, max_entries=2), 8)
+    for index in range(4):
+        vector = reader.get_many([f"t{index}"])[0]
+        assert vector is None or np.array_equal(vector, _vector(index)[0])
+
+
+def test_reset_files_runs_under_the_file_lock(tmp_path, monkeypatch):
+    _put(EmbeddingCache(tmp_path, "test-model", dtype="float16"), 1)
+
+    held = []
+    original_lock = EmbeddingCache._file_lock
+    original_reset = EmbeddingCache._reset_files
+
+    @contextmanager
+    def tracking_lock(self):
+        with original_lock(self):
+            held.append(True)
+            try:
+                yield
+            finally:
+                held.pop()
+
+    def checked_reset(self):
+        assert held, "files reset without the file lock"
+        original_reset(self)
+
+    monkeypatch.setattr(EmbeddingCache, "_file_lock", tracking_lock)
+    monkeypatch.setattr(EmbeddingCache, "_reset_files", checked_reset)
+    cache = EmbeddingCache(tmp_path, "test-model", dtype="float32")
+    assert cache.get_many(["t1"]) == [None]
+    assert not (cache.directory / "vectors.bin").exists()
@@ -0,0 +1,31 @@
+import threading
+import time
+
+import pytest
+
+from app.pipeline import PipelineExecutor, PipelineQueueTimeout, PipelineSaturated
+
+
+def test_submissions_beyond_workers_and_queue_are_refused():
+    executor = PipelineExecutor(workers=1, queue_depth=1)
+    release = threading.Event()
+    running = executor._submit(release.wait, (5,))
+    queued = executor._submit(lambda: "queued", ())
+
+    with pytest.raises(PipelineSaturated):
+        executor.call(lambda: None)
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    assert running.result(timeout=5) and queued.result(timeout=5) == "queued"
+    # Slots are returned once jobs finish.
+    assert executor.call(lambda: "again") == "again"
+
+
+def test_jobs_that_waited_too_long_are_dropped():
+    executor = PipelineExecutor(workers=1, queue_depth=1, queue_timeout=0.05)
+    blocker = executor._submit(time.sleep, (0.2,))
+    stale = executor._submit(lambda: "late", ())
+    blocker.result(timeout=5)
+    with pytest.raises(PipelineQueueTimeout):
+        stale.result(timeout=5)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from app.agents.guardrails_verifier import PHONE_PATTERN, verify_deterministic
+
+from .conftest import make_card
+
+PII_ISSUE = "Potential PII detected in output."
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Reported at 2026-01-31 10:19 via email.",
+        "Reported at 2026-01-31T10:19:00Z.",
+        "Second contact on 31/01/2026 at 10:19.",
+        "See ticket 1234567890.",
+        "Ticket T-3101 for order 20260131.",
+        "Charged 1,250.00 twice.",
+    ],
+)
+def test_dates_times_and_ticket_ids_are_not_phone_numbers(text):
+    assert PHONE_PATTERN.search(text) is None
+    assert PII_ISSUE not in verify_deterministic(make_card(situation_background=text)).issues
+
+
+@pytest.mark.parametrize("phone", ["+1 555 123 4567", "555-123-4567", "(020) 7946-0958", "+44 20 7946 0958", "020.7946.0958"])
+def test_phone_numbers_in_narrative_block_the_card(phone):
+    result = verify_deterministic(make_card(key_considerations=[f"Call the customer back on {phone}."]))
+
+    assert not result.passed
+    assert PII_ISSUE in result.issues
+
+
+def test_email_in_narrative_blocks_the_card():
+    result = verify_deterministic(make_card(situation_background="Customer jane.doe@example.com wrote in."))
+
+    assert PII_ISSUE in result.issues
+
+
+def test_customer_quotes_are_not_hard_failed():
+    card = make_card(
+        customer_context="Customer wrote: call me on 555-123-4567 or mail jane@example.com.",
+        evidence_analysis=["[email @ 2026-01-31 10:19] 'my number is +1 555 123 4567'"],
+    )
+
+    assert verify_deterministic(card).passed
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+from app.rag import index_build, retrieve
+from app.rag.docstore import append_records
+from app.rag.generations import GenerationStore
+from app.rag.index_factory import IndexConfig
+from app.rag.retrieve import EVENT_META_FILE, EVENT_OFFSETS_FILE, _LIVE_GENERATIONS
+
+
+class _Loaded:
+    pass
+
+
+def test_publish_keeps_generations_held_by_local_readers(tmp_path, monkeypatch):
+    store = GenerationStore(tmp_path, keep=1)
+    monkeypatch.setattr(index_build, "INDEX_STORE", store)
+    held, dropped, target = store.create(), store.create(), store.create()
+    reader = _Loaded()
+    monkeypatch.setitem(_LIVE_GENERATIONS, held.name, reader)
+
+    index_build._publish(target)
+
+    assert held.exists() and target.exists()
+    assert not dropped.exists()
+
+
+def test_update_copies_the_files_it_appends_to(tmp_path):
+    source, target = tmp_path / "old", tmp_path / "new"
+    source.mkdir()
+    append_records(source / EVENT_META_FILE, source / EVENT_OFFSETS_FILE, [{"text": "kept"}])
+    state = {"events": 1, "event_meta_bytes": (source / EVENT_META_FILE).stat().st_size}
+    # Debris from an aborted update past the recorded size.
+    append_records(source / EVENT_META_FILE, source / EVENT_OFFSETS_FILE, [{"text": "aborted"}])
+    before = {name: (source / name).read_bytes() for name in (EVENT_META_FILE, EVENT_OFFSETS_FILE)}
+
+    index_build._EventWriter(target, IndexConfig.from_env(), 2, source, state)
+    append_records(target / EVENT_META_FILE, target / EVENT_OFFSETS_FILE, [{"text": "new"}])
+
+    for name, data in before.items():
+        assert (source / name).read_bytes() == data
+        assert os.stat(source / name).st_ino != os.stat(target / name).st_ino
+    assert (target / EVENT_META_FILE).read_text().splitlines() == ['{"text": "kept"}', '{"text": "new"}']
+    assert (target / EVENT_OFFSETS_FILE).stat().st_size == 16
+
+
+def test_build_lock_excludes_other_stores_on_the_same_root(tmp_path):
+    acquired = []
+
+    def contend():
+        with GenerationStore(tmp_path).build_lock():
+            acquired.append(time.monotonic())
+
+    with GenerationStore(tmp_path).build_lock():
+        thread = threading.Thread(target=contend)
+        thread.start()
+        time.sleep(0.2)
+        assert acquired == []
+        released = time.monotonic()
+    thread.join(timeout=5)
+    assert acquired and acquired[0] >= released
+
+
+def _append_event(rag_samples, event_id, text, newline=True):
+    line = json.dumps({"event_id": event_id, "source": "email", "timestamp": "2026-02-01T08:00:00Z", "thread_id": f"th_{event_id}", "text": text})
+    with (rag_samples / "email.jsonl").open("a", encoding="utf-8") as handle:
+        handle.write(line + ("\n" if newline else ""))
+
+
+def test_update_embeds_only_new_events(rag, tmp_path):
+    events, _ = index_build.build_indexes()
+    rag.encoded.clear()
+    _append_event(tmp_path / "samples", "evt_new", "Warehouse robot flooded the loading dock")
+
+    stats = index_build.update_indexes()
+
+    assert (stats["events"], stats["events_added"], stats["playbook_chunks_embedded"]) == (events + 1, 1, 0)
+    assert rag.encoded == [["Warehouse robot flooded the loading dock email"]]
+    hits = retrieve.retrieve_events("warehouse robot flooded loading dock", top_k=1)
+    assert hits[0]["event_id"] == "evt_new"
+
+
+def test_update_leaves_a_partial_line_for_the_next_run(rag, tmp_path):
+    index_build.build_indexes()
+    _append_event(tmp_path / "samples", "evt_half", "Half written line", newline=False)
+    assert index_build.update_indexes()["events_added"] == 0
+
+    with (tmp_path / "samples" / "email.jsonl").open("a", encoding="utf-8") as handle:
+        handle.write("\n")
+    assert index_build.update_indexes()["events_added"] == 1
+
+
+def test_sharded_build_leaves_a_partial_line_for_the_next_run(rag, tmp_path, monkeypatch):
+    monkeypatch.setenv("INDEX_SHARD_BY", "month")
+    events, _ = index_build.build_indexes()
+    with (tmp_path / "samples" / "email.jsonl").open("a", encoding="utf-8") as handle:
+        handle.write('{"event_id": "evt_half", "timestamp": "2026-02')
+
+    assert index_build.build_indexes()[0] == events
+    assert index_build.update_indexes()["events_added"] == 0
+
+
+def test_streaming_build_in_small_batches_matches_one_batch(rag, monkeypatch):
+    query = "duplicate billing on my invoice"
+    monkeypatch.setenv("EMBED_BATCH_SIZE", "1000")
+    index_build.build_indexes()
+    expected = retrieve.retrieve_events(query, top_k=5)
+
+    rag.encoded.clear()
+    monkeypatch.setenv("EMBED_BATCH_SIZE", "4")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    monkeypatch.setattr(retrieve, "_EMBED_CACHE", None)
+    events, _ = index_build.build_indexes()
+
+    assert max(len(batch) for batch in rag.encoded) <= 4
+    assert sum(len(batch) for batch in rag.encoded) >= events
+    assert retrieve.retrieve_events(query, top_k=5) == expected
+
+
+def test_update_after_an_empty_build_is_incremental(rag, tmp_path, monkeypatch):
+    for file in (tmp_path / "samples").glob("*.jsonl"):
+        file.write_text("")
+    assert index_build.build_indexes()[0] == 0
+    assert retrieve.retrieve_events("warehouse robot", top_k=1) == []
+
+    rebuilds = []
+    monkeypatch.setattr(index_build, "build_indexes", lambda: rebuilds.append(True))
+    _append_event(tmp_path / "samples", "evt_first", "Warehouse robot flooded the loading dock")
+    stats = index_build.update_indexes()
+
+    assert not rebuilds
+    assert (stats["events"], stats["events_added"]) == (1, 1)
+    assert retrieve.retrieve_events("warehouse robot flooded loading dock", top_k=1)[0]["event_id"] == "evt_first"
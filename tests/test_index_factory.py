@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from app.rag import bench, index_build, retrieve
+from app.rag.index_factory import IndexConfig, configure_search, create_index, train_index
+
+
+def test_approximate_types_fall_back_to_flat_below_min_rows():
+    config = IndexConfig(kind="hnsw", min_rows=100)
+    assert config.describe(99) == {"type": "flat"}
+    assert config.describe(100) == {"type": "hnsw", "hnsw_m": 32, "ef_construction": 200}
+    assert IndexConfig(kind="ivf", min_rows=0).nlist_for(390) == 10
+    with pytest.raises(ValueError):
+        IndexConfig(kind="lsh")
+
+
+def test_ivfpq_compresses_and_searches():
+    config = IndexConfig(kind="ivfpq", nlist=4, pq_m=8, pq_bits=4, min_rows=0)
+    corpus = bench.synthetic_corpus(400, 16, clusters=8)
+    index = create_index(16, 400, config)
+    train_index(index, corpus, config)
+    index.add(corpus)
+    configure_search(index, config)
+    _, rows = index.search(corpus[:5], 5)
+    assert (rows >= 0).all()
+    with pytest.raises(ValueError):
+        create_index(12, 400, config)
+
+
+def test_benchmark_reports_recall_for_every_type(capsys):
+    results = bench.run([400], 16, ["flat", "ivf", "hnsw"], query_count=20, k=5, nprobes=[4], ef_searches=[32])
+    recall = {row["type"]: row["recall@5"] for row in results}
+    assert recall["flat"] == 1.0
+    assert set(recall) == {"flat", "ivf", "hnsw"}
+    assert all(0.0 <= value <= 1.0 for value in recall.values())
+    assert len(capsys.readouterr().out.splitlines()) == len(results)
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_configured_index_type_is_built_and_searched(rag, monkeypatch, tmp_path, kind):
+    monkeypatch.setenv("INDEX_TYPE", kind)
+    monkeypatch.setenv("INDEX_MIN_ROWS", "1")
+    index_build.build_indexes()
+
+    state = json.loads((retrieve.INDEX_STORE.current() / "state.json").read_text())
+    assert state["event_index"]["type"] == kind
+    hits = retrieve.retrieve_events("My January invoice shows two charges", top_k=3)
+    assert hits[0]["event_id"] == "evt_email_001"
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import io
+import json
+import threading
+
+from app import ingest
+from app.ingest import Checkpoint, IngestWorker, _tail
+
+from .conftest import make_card, make_event
+
+
+def _write_events(path, indexes, tail: str = "") -> None:
+    with path.open("a", encoding="utf-8") as handle:
+        for index in indexes:
+            handle.write(make_event(index).model_dump_json() + "\n")
+        handle.write(tail)
+
+
+def _run(tmp_path, source, monkeypatch, process) -> tuple:
+    monkeypatch.setattr(ingest, "process_incidents", process)
+    monkeypatch.setenv("INGEST_RETRY_BACKOFF_SECONDS", "0.01")
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    output = io.StringIO()
+    worker = IngestWorker(output, checkpoint, tmp_path / "dead.jsonl", workers=2, batch_size=2)
+    stats = worker.run(_tail([source], checkpoint, False, 0.01, worker.stop))
+    return stats, output.getvalue().splitlines(), Checkpoint(tmp_path / "checkpoint.json")
+
+
+def _cards(records):
+    return [make_card().model_copy(update={"incident": record}) for record in records]
+
+
+def test_restart_resumes_after_checkpoint(tmp_path, monkeypatch):
+    source = tmp_path / "events.jsonl"
+    pending = make_event(3).model_dump_json()
+    _write_events(source, range(3), tail=pending[:20])
+    seen = []
+
+    def process(records):
+        seen.extend(record.event_id for record in records)
+        return _cards(records)
+
+    stats, lines, checkpoint = _run(tmp_path, source, monkeypatch, process)
+    assert seen == ["e0", "e1", "e2"] and stats["processed"] == 3
+    assert len(lines) == 3
+    assert checkpoint.offset(str(source.resolve())) == source.stat().st_size - 20
+
+    # The half-written line is finished and one more event arrives.
+    with source.open("a", encoding="utf-8") as handle:
+        handle.write(pending[20:] + "\n")
+    _write_events(source, [4])
+    seen.clear()
+    _run(tmp_path, source, monkeypatch, process)
+
+    assert seen == ["e3", "e4"]
+    assert Checkpoint(tmp_path / "checkpoint.json").offset(str(source.resolve())) == source.stat().st_size
+
+
+def test_failing_batch_is_retried_before_commit(tmp_path, monkeypatch):
+    source = tmp_path / "events.jsonl"
+    _write_events(source, range(2))
+    attempts = []
+
+    def flaky(records):
+        attempts.append(len(records))
+        if len(attempts) < 3:
+            raise RuntimeError("model server unavailable")
+        return _cards(records)
+
+    stats, lines, checkpoint = _run(tmp_path, source, monkeypatch, flaky)
+
+    assert len(attempts) == 3
+    assert stats["processed"] == 2 and stats["failed"] == 0
+    assert checkpoint.offset(str(source.resolve())) == source.stat().st_size
+    assert not (tmp_path / "dead.jsonl").exists()
+
+
+def test_batch_that_keeps_failing_is_dead_lettered_then_committed(tmp_path, monkeypatch):
+    source = tmp_path / "events.jsonl"
+    _write_events(source, range(2))
+    monkeypatch.setenv("INGEST_RETRIES", "1")
+
+    def broken(records):
+        raise RuntimeError("bad batch")
+
+    stats, lines, checkpoint = _run(tmp_path, source, monkeypatch, broken)
+
+    dead = [json.loads(line) for line in (tmp_path / "dead.jsonl").read_text().splitlines()]
+    assert [entry["event"]["event_id"] for entry in dead] == ["e0", "e1"]
+    assert "bad batch" in dead[0]["error"]
+    assert stats["failed"] == 2 and lines == []
+    assert checkpoint.offset(str(source.resolve())) == source.stat().st_size
+
+
+def test_batch_failing_during_shutdown_is_not_committed(tmp_path, monkeypatch):
+    source = tmp_path / "events.jsonl"
+    _write_events(source, range(2))
+    monkeypatch.setattr(ingest, "process_incidents", lambda records: (_ for _ in ()).throw(RuntimeError("down")))
+    monkeypatch.setenv("INGEST_RETRY_BACKOFF_SECONDS", "30")
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    worker = IngestWorker(io.StringIO(), checkpoint, tmp_path / "dead.jsonl", workers=1, batch_size=2)
+    threading.Timer(0.2, worker.stop.set).start()
+
+    worker.run(_tail([source], checkpoint, False, 0.01, threading.Event()))
+
+    assert checkpoint.offset(str(source.resolve())) == 0
+    assert not (tmp_path / "checkpoint.json").exists()
+    assert not (tmp_path / "dead.jsonl").exists()
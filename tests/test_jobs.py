@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import jobs, main
+from app.jobs import ITEM_PENDING, JOB_DONE, JobStore
+
+from .conftest import COLLECTIVE_REPLY, make_event
+
+
+def _wait_for(store: JobStore, job_id: str, timeout: float = 10.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {store.get(job_id)}")
+
+
+@pytest.fixture
+def api_env(fake_llm, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "_client_from_env", lambda *args: fake_llm)
+    monkeypatch.setenv("JOBS_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setenv("JOBS_POLL_SECONDS", "0.05")
+    monkeypatch.setattr(jobs, "_JOB_STORE", None)
+
+
+@pytest.fixture
+def api(api_env):
+    with TestClient(main.app) as client:
+        yield client
+    jobs.job_store().stop()
+
+
+def test_collective_job_runs_end_to_end(api, fake_llm):
+    events = [make_event(index).model_dump() for index in range(3)]
+    response = api.post("/jobs", json={"events": events, "collective": True})
+    assert response.status_code == 202
+
+    job = _wait_for(jobs.job_store(), response.json()["job_id"])
+
+    assert job["status"] == JOB_DONE, job["error"]
+    assert job["completed"] == 3
+    result = job["result"]
+    assert result["total_processed"] == 3
+    assert result["incident_clusters"][0]["event_ids"] == ["e0", "e1"]
+    assert result["systemic_patterns"] == COLLECTIVE_REPLY["systemic_patterns"]
+    assert result["policy_violations"] == [{"event_id": "e1", "violation": "Refund SLA missed"}]
+    assert None in fake_llm.calls
+
+
+def test_stream_resumes_after_cursor(api):
+    events = [make_event(index).model_dump() for index in range(4)]
+    job_id = api.post("/jobs", json={"events": events}).json()["job_id"]
+    _wait_for(jobs.job_store(), job_id)
+
+    body = api.get(f"/jobs/{job_id}/stream", headers={"Last-Event-ID": "2"}).text
+
+    assert body.count("event: item") == 2
+    assert "id: 3" in body and "id: 4" in body
+    assert "event: done" in body
+
+
+def test_finished_items_are_not_recomputed_after_restart(fake_llm, tmp_path):
+    path = tmp_path / "jobs.sqlite"
+    first = JobStore(path, workers=0, batch_size=2, lease_seconds=0.05)
+    job_id = first.submit("batch", [make_event(index) for index in range(4)])
+    first._process(first._claim())
+    first._claim()  # leased, then the process "dies"
+    calls_before = len(fake_llm.calls)
+    time.sleep(0.1)
+
+    second = JobStore(path, workers=1, batch_size=2, poll_seconds=0.05)
+    second.start()
+    try:
+        job = _wait_for(second, job_id)
+    finally:
+        second.stop()
+
+    assert job["completed"] == 4
+    assert [item["seq"] for item in job["items"]] == [1, 2, 3, 4]
+    # Only the two abandoned items went through the agents again.
+    assert len(fake_llm.calls) == 2 * calls_before
+
+
+def test_workers_wait_for_pipeline_capacity(fake_llm, tmp_path, monkeypatch):
+    from app.pipeline import PipelineExecutor
+
+    executor = PipelineExecutor(workers=1, queue_depth=0)
+    monkeypatch.setattr(jobs, "PIPELINE_EXECUTOR", executor)
+    executor._admit()  # an API request holds the only slot
+    store = JobStore(tmp_path / "jobs.sqlite", workers=1, poll_seconds=0.05)
+    job_id = store.submit("batch", [make_event(0)])
+    store.start()
+    try:
+        time.sleep(0.3)
+        assert store.get(job_id)["completed"] == 0
+        assert executor.rejected > 0
+        executor._release()
+        job = _wait_for(store, job_id)
+    finally:
+        store.stop()
+    assert job["completed"] == 1
+
+
+def test_shutdown_stops_the_workers(api_env):
+    with TestClient(main.app):
+        store = jobs.job_store()
+        assert store._threads
+    assert store._stop.is_set() and not store._threads
+
+
+def test_stream_of_unknown_job_is_404(api):
+    assert api.get("/jobs/missing/stream").status_code == 404
+
+
+def test_stopping_hands_back_items_waiting_for_capacity(fake_llm, tmp_path, monkeypatch):
+    from app.pipeline import PipelineExecutor
+
+    executor = PipelineExecutor(workers=1, queue_depth=0)
+    monkeypatch.setattr(jobs, "PIPELINE_EXECUTOR", executor)
+    executor._admit()
+    store = JobStore(tmp_path / "jobs.sqlite", workers=1, poll_seconds=0.05)
+    store.submit("batch", [make_event(0)])
+    store.start()
+    time.sleep(0.2)
+    store.stop()
+
+    statuses = store._db.execute("SELECT status, lease_until FROM items").fetchall()
+    assert statuses == [(ITEM_PENDING, None)]
+
+
+def test_a_worker_survives_a_failed_batch(fake_llm, tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite", workers=1, poll_seconds=0.05, lease_seconds=0.2)
+    original = store._finish
+    failures = []
+
+    def flaky_finish(*args):
+        if not failures:
+            failures.append(args)
+            raise jobs.sqlite3.OperationalError("database is locked")
+        return original(*args)
+
+    monkeypatch.setattr(store, "_finish", flaky_finish)
+    job_id = store.submit("batch", [make_event(0)])
+    store.start()
+    try:
+        job = _wait_for(store, job_id)
+    finally:
+        store.stop()
+    assert failures and job["completed"] == 1
@@ -0,0 +1,37 @@
+from app.agents.llm_client import _JsonObjectEnd, extract_json, try_llm_json
+from app.schemas import GuardrailVerdict
+
+
+class _Replies:
+    def __init__(self, *replies, enforces_schema=False):
+        self.replies = list(replies)
+        self.enforces_schema = enforces_schema
+        self.calls = 0
+
+    def chat(self, messages, response_schema=None):
+        self.calls += 1
+        return self.replies.pop(0)
+
+
+def test_object_end_ignores_braces_inside_strings_and_spans_pieces():
+    scanner = _JsonObjectEnd()
+    pieces = ['Sure: {"issues": ["a } b", "esc \\" }"', "], ", '"pass": {"x": 1}', "}", " trailing"]
+    closed = [scanner.feed(piece) for piece in pieces]
+    assert closed == [False, False, False, True, False]
+
+
+def test_extract_json_finds_the_object_in_chatter():
+    assert extract_json('Here you go: {"pass": true} thanks') == {"pass": True}
+    assert extract_json("no json here") is None
+
+
+def test_unparseable_reply_is_retried_without_schema_enforcement():
+    client = _Replies("oops", '{"pass": true}')
+    assert try_llm_json(client, [], retries=1, schema=GuardrailVerdict) == {"pass": True}
+    assert client.calls == 2
+
+
+def test_schema_enforcing_client_is_not_retried():
+    client = _Replies("oops", '{"pass": true}', enforces_schema=True)
+    assert try_llm_json(client, [], retries=1, schema=GuardrailVerdict) is None
+    assert client.calls == 1
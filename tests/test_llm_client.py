@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.agents.llm_client import LLMClient
+from app.schemas import SignalExtraction
+
+
+def _client(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return LLMClient("http://llm.test", "test-model")
+
+
+@pytest.mark.parametrize("server, enforced", [("vllm", True), ("llama.cpp", True), ("tgi", False), ("", False)])
+def test_schema_is_only_requested_from_known_servers(monkeypatch, server, enforced):
+    client = _client(monkeypatch, LLM_SERVER=server)
+    payload = client._request([{"role": "user", "content": "hi"}], SignalExtraction)
+    assert client.enforces_schema is enforced
+    assert ("response_format" in payload) is enforced
+
+
+def test_constrained_decoding_off_disables_schema(monkeypatch):
+    client = _client(monkeypatch, LLM_SERVER="vllm", LLM_CONSTRAINED_DECODING="false")
+    assert not client.enforces_schema
+
+
+def test_retry_after_is_capped(monkeypatch):
+    client = _client(monkeypatch, LLM_HTTP_RETRIES="2", LLM_HTTP_MAX_RETRY_AFTER_SECONDS="5")
+    assert client._delay(0, httpx.Response(429, headers={"retry-after": "600"})) == 5
+    assert client._delay(0, httpx.Response(503, headers={"retry-after": "1.5"})) == 1.5
+    assert client._delay(0, httpx.Response(400)) is None
+    assert client._delay(2, httpx.Response(429, headers={"retry-after": "1"})) is None
+
+
+@pytest.fixture
+def stub_server():
+    """A local chat-completions server that records the client port of each request."""
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            ports.append(self.client_address[1])
+            body = json.dumps({"choices": [{"message": {"content": "ok"}}], "usage": {}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_achat_works_from_successive_event_loops(stub_server):
+    api_base, ports = stub_server
+    client = LLMClient(api_base, "test-model")
+    messages = [{"role": "user", "content": "hi"}]
+
+    assert asyncio.run(client.achat(messages)) == "ok"
+    assert asyncio.run(client.achat(messages)) == "ok"
+    assert len(ports) == 2
+
+
+def test_chat_reuses_the_pooled_connection(stub_server):
+    api_base, ports = stub_server
+    messages = [{"role": "user", "content": "hi"}]
+
+    assert LLMClient(api_base, "test-model").chat(messages) == "ok"
+    assert LLMClient(api_base, "test-model").chat(messages) == "ok"
+    assert len(ports) == 2 and len(set(ports)) == 1
@@ -0,0 +1,177 @@
+import threading
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.agents import llm_client
+from app.agents.llm_client import _BatchScheduler, _GenerationRequest, _PrefixCache
+from app.schemas import GuardrailVerdict
+
+
+class _FakeModel:
+    """Records the batches it is asked to run and answers each request with its prompt."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.release = threading.Event()
+
+    def generate_batch(self, requests):
+        self.release.wait(5)
+        self.batches.append([request.prompt for request in requests])
+        if self.fail:
+            raise RuntimeError("out of memory")
+        for request in requests:
+            request.future.set_result(request.prompt.upper())
+
+
+def _scheduler(monkeypatch, model, size="3", wait_ms="50"):
+    monkeypatch.setenv("LLM_MAX_BATCH_SIZE", size)
+    monkeypatch.setenv("LLM_BATCH_WAIT_MS", wait_ms)
+    return _BatchScheduler(model)
+
+
+def test_concurrent_requests_share_batches_of_equal_sampling(monkeypatch):
+    model = _FakeModel()
+    scheduler = _scheduler(monkeypatch, model)
+    requests = [_GenerationRequest(f"p{index}", 0.0, 10) for index in range(4)]
+    requests.append(_GenerationRequest("sampled", 0.7, 10))
+    requests.append(_GenerationRequest("json", 0.0, 10, response_schema=GuardrailVerdict))
+    futures = [scheduler.submit(request) for request in requests]
+    model.release.set()
+
+    assert [future.result(timeout=5) for future in futures] == ["P0", "P1", "P2", "P3", "SAMPLED", "JSON"]
+    assert model.batches[0] == ["p0", "p1", "p2"]
+    assert sorted(map(sorted, model.batches[1:])) == [["json"], ["p3"], ["sampled"]]
+
+
+def test_batches_are_split_by_system_prompt(monkeypatch):
+    model = _FakeModel()
+    scheduler = _scheduler(monkeypatch, model, size="4")
+    requests = [_GenerationRequest(f"{agent}{index}", 0.0, 10, prefix=agent) for index in range(2) for agent in ("a", "b")]
+    futures = [scheduler.submit(request) for request in requests]
+    model.release.set()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(map(sorted, model.batches)) == [["a0", "a1"], ["b0", "b1"]]
+
+
+def test_a_failed_batch_fails_each_of_its_requests(monkeypatch):
+    model = _FakeModel(fail=True)
+    model.release.set()
+    scheduler = _scheduler(monkeypatch, model, wait_ms="0")
+    future = scheduler.submit(_GenerationRequest("p", 0.0, 10))
+    with pytest.raises(RuntimeError, match="out of memory"):
+        future.result(timeout=5)
+
+
+class _Tensor:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+
+class _PrefillModel:
+    """Tokenizes one token per word; the KV cache of a prefix costs 100 bytes per token."""
+
+    def __init__(self):
+        self.prefilled = []
+
+    def tokenize(self, text):
+        return np.zeros((1, len(text.split())))
+
+    def prefill(self, prefix_ids):
+        self.prefilled.append(prefix_ids.shape[1])
+        return [[_Tensor(100 * prefix_ids.shape[1])]]
+
+
+@pytest.fixture
+def prefix_cache(monkeypatch):
+    monkeypatch.setattr(llm_client, "torch", SimpleNamespace(inference_mode=nullcontext))
+    monkeypatch.setenv("LLM_PREFIX_CACHE_MB", str(1000 / (1024 * 1024)))
+    monkeypatch.setenv("LLM_PREFIX_CACHE_MIN_TOKENS", "3")
+    model = _PrefillModel()
+    return model, _PrefixCache(model)
+
+
+def test_prefix_kv_is_prefilled_once_and_reused(prefix_cache):
+    model, cache = prefix_cache
+    first = cache.get("you are a careful analyst")
+    again = cache.get("you are a careful analyst")
+    assert again[1] is first[1]
+    cache.get("you are a careful analyst")
+    assert model.prefilled == [5]
+    assert cache.get("too short") is None
+    assert cache.stats() == {"entries": 1, "bytes": 500, "hits": 2, "misses": 1, "rows": 0}
+
+
+def test_prefix_cache_evicts_oldest_beyond_budget(prefix_cache):
+    model, cache = prefix_cache
+    cache.get("one two three four")
+    cache.get("five six seven eight")
+    cache.get("nine ten eleven twelve")
+    assert cache.stats()["bytes"] <= 1000
+    assert cache.stats()["entries"] == 2
+    cache.get("one two three four")
+    assert model.prefilled == [4, 4, 4, 4]
+
+    oversized = cache.get(" ".join(["word"] * 20))
+    assert oversized is not None and cache.stats()["entries"] == 2
+
+
+class _PrefixedModel(llm_client._LocalModel):
+    """A local model whose tokens are word lengths, to check how a batch is laid out."""
+
+    device = None
+
+    def __init__(self):
+        self._tokenizer = SimpleNamespace(pad_token_id=0)
+        self._prefix_cache = _PrefixCache(self)
+        self.prefilled = []
+
+    def tokenize(self, text):
+        return np.array([[len(word) for word in text.split()]])
+
+    def prefill(self, prefix_ids):
+        self.prefilled.append(prefix_ids.shape[1])
+        return [[_Tensor(100 * prefix_ids.shape[1])]]
+
+
+def test_batch_rows_share_the_cached_prefix(prefix_cache, monkeypatch):
+    fake_torch = SimpleNamespace(
+        inference_mode=nullcontext,
+        equal=np.array_equal,
+        full=lambda shape, fill, dtype=None, device=None: np.full(shape, fill, dtype=dtype),
+        zeros_like=np.zeros_like,
+    )
+    monkeypatch.setattr(llm_client, "torch", fake_torch)
+    monkeypatch.setattr(llm_client, "_shared_cache", lambda layers, rows: (layers, rows))
+    model = _PrefixedModel()
+    prefix = "a bb ccc"
+    requests = [_GenerationRequest(f"{prefix} {suffix}", 0.0, 10, prefix=prefix) for suffix in ("dddd", "ee fff")]
+
+    inputs, (layers, rows) = model._prefixed_inputs(requests)
+    again, (reused, _) = model._prefixed_inputs(requests)
+
+    assert inputs["input_ids"].tolist() == [[1, 2, 3, 0, 4], [1, 2, 3, 2, 3]]
+    assert inputs["attention_mask"].tolist() == [[1, 1, 1, 0, 1], [1, 1, 1, 1, 1]]
+    assert rows == 2 and reused is layers
+    assert model.prefilled == [3]
+    assert model.prefix_cache_stats()["rows"] == 4
+
+
+def test_batch_without_the_prefix_tokens_is_not_prefixed(prefix_cache, monkeypatch):
+    monkeypatch.setattr(llm_client, "torch", SimpleNamespace(inference_mode=nullcontext, equal=np.array_equal))
+    model = _PrefixedModel()
+    requests = [_GenerationRequest("a bb ccc dddd", 0.0, 10, prefix="a bb cccc")]
+
+    assert model._prefixed_inputs(requests) is None
+    assert model.prefix_cache_stats()["rows"] == 0
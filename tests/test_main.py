@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import jobs, main
+
+
+def test_collective_batch_runs_analysis_off_the_event_loop(fake_llm, monkeypatch, tmp_path):
+    seen = {}
+    analyse = main._collective_analysis
+
+    def recording(selected_events, dashboard_cards):
+        seen["thread"] = threading.current_thread().name
+        return analyse(selected_events, dashboard_cards)
+
+    monkeypatch.setattr(main, "_client_from_env", lambda *args: fake_llm)
+    monkeypatch.setattr(main, "_collective_analysis", recording)
+    monkeypatch.setenv("JOBS_WORKERS", "0")
+    monkeypatch.setenv("JOBS_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(jobs, "_JOB_STORE", None)
+    with TestClient(main.app) as client:
+        response = client.post("/process/batch/collective", json={"limit": 3})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["total_processed"] == 3
+    assert body["systemic_patterns"] == ["Billing retries charge twice"]
+    assert seen["thread"].startswith("pipeline")
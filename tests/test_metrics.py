@@ -0,0 +1,36 @@
+from app import metrics, pipeline
+from app.metrics import Counter, Histogram, render_metrics
+
+from .conftest import FakeContext, make_event
+
+
+def test_exposition_format(monkeypatch):
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    calls = Counter("test_calls_total", "Calls.", ["agent"])
+    latency = Histogram("test_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0))
+    calls.inc(agent='say "hi"')
+    calls.inc(2, agent='say "hi"')
+    latency.observe(0.05, stage="embed")
+    latency.observe(5, stage="embed")
+
+    assert render_metrics().splitlines() == [
+        "# HELP test_calls_total Calls.",
+        "# TYPE test_calls_total counter",
+        'test_calls_total{agent="say \\"hi\\""} 3',
+        "# HELP test_seconds Latency.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="embed",le="0.1"} 1',
+        'test_seconds_bucket{stage="embed",le="1"} 1',
+        'test_seconds_bucket{stage="embed",le="+Inf"} 2',
+        'test_seconds_sum{stage="embed"} 5.05',
+        'test_seconds_count{stage="embed"} 2',
+    ]
+
+
+def test_pipeline_run_records_stage_and_incident_metrics(fake_llm):
+    pipeline.process_incident(make_event(1), FakeContext())
+
+    text = render_metrics()
+    assert 'rpm_stage_duration_seconds_count{graph="incident",stage="signals"}' in text
+    assert 'rpm_incidents_total{tier="llm",' in text
+    assert 'rpm_llm_json_attempts_total{schema="SignalExtraction",outcome="ok"}' in text
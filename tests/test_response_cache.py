@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from app.agents.response_cache import CachedChatClient, ResponseCache, cache_enabled, with_response_cache
+from app.schemas import GuardrailVerdict
+
+from .conftest import FakeLLM
+
+IDENTITY = {"backend": "fake", "model": "test-model", "temperature": 0.1}
+MESSAGES = [{"role": "user", "content": "Check this card."}]
+
+
+def _cache(tmp_path, **kwargs):
+    return ResponseCache(tmp_path / "responses.sqlite", **kwargs)
+
+
+def test_identical_requests_are_served_from_the_cache(tmp_path):
+    llm = FakeLLM()
+    client = CachedChatClient(llm, _cache(tmp_path), "GUARDRAILS", IDENTITY)
+
+    first = client.chat(MESSAGES, GuardrailVerdict)
+    assert client.submit(MESSAGES, GuardrailVerdict).result() == first
+    assert len(llm.calls) == 1
+
+    client.chat(MESSAGES + [{"role": "user", "content": "Again."}], GuardrailVerdict)
+    assert len(llm.calls) == 2
+
+
+def test_key_depends_on_identity_and_schema():
+    key = ResponseCache.key(IDENTITY, MESSAGES, GuardrailVerdict)
+    assert key != ResponseCache.key({**IDENTITY, "temperature": 0.7}, MESSAGES, GuardrailVerdict)
+    assert key != ResponseCache.key(IDENTITY, MESSAGES, None)
+
+
+def test_unusable_replies_are_not_cached(tmp_path):
+    class Broken(FakeLLM):
+        def chat(self, messages, response_schema=None):
+            super().chat(messages, response_schema)
+            return "not json"
+
+    llm = Broken()
+    client = CachedChatClient(llm, _cache(tmp_path), "GUARDRAILS", IDENTITY)
+    client.chat(MESSAGES, GuardrailVerdict)
+    client.chat(MESSAGES, GuardrailVerdict)
+    assert len(llm.calls) == 2
+
+
+def test_replies_persist_across_processes_and_expire(tmp_path):
+    _cache(tmp_path).put("k", json.dumps({"pass": True}))
+    assert _cache(tmp_path).get("k") == '{"pass": true}'
+    assert _cache(tmp_path, ttl_seconds=1e-9).get("k") is None
+
+
+def test_eviction_keeps_the_most_recently_used(tmp_path):
+    cache = _cache(tmp_path, max_bytes=100, memory_entries=0)
+    for name in "abc":
+        cache.put(name, "x" * 40)
+    assert cache.get("a") is None
+    assert cache.get("c") == "x" * 40
+    assert cache.stats()["bytes"] <= 75
+
+
+@pytest.mark.parametrize(
+    "env, enabled",
+    [({}, False), ({"AGENT1_CACHE": "true"}, True), ({"LLM_CACHE": "true"}, True), ({"LLM_CACHE": "true", "AGENT1_CACHE": "false"}, False)],
+)
+def test_cache_is_opt_in_per_agent(monkeypatch, env, enabled):
+    for name in ("LLM_CACHE", "AGENT1_CACHE"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    llm = FakeLLM()
+    assert cache_enabled("AGENT1") is enabled
+    if not enabled:
+        assert with_response_cache(llm, "AGENT1") is llm
@@ -0,0 +1,29 @@
+from app.rag import retrieve
+from app.rag.index_build import build_indexes
+from app.rag.retrieve import RetrievalContext
+
+
+def test_one_encode_serves_event_and_playbook_searches(rag):
+    build_indexes()
+    rag.encoded.clear()
+
+    context = RetrievalContext.from_queries(["duplicate billing on my invoice", "app is down"])
+    events = context.events(top_k=3)
+    playbooks = context.playbooks(top_k=2)
+    view = context.row(1)
+
+    assert rag.encoded == [["duplicate billing on my invoice", "app is down"]]
+    assert view.events(top_k=3) == [events[1]]
+    assert view.playbooks(top_k=2) == [playbooks[1]]
+    assert "billing" in events[0][0]["text"].lower()
+
+
+def test_team_search_honours_top_k(rag):
+    build_indexes()
+    generation = retrieve.current_generation()
+    team, (index, rows) = next((team, entry) for team, entry in generation.team_indexes.items() if entry[0].ntotal >= 2)
+
+    hits = retrieve.retrieve_playbooks("refund policy escalation", team=team, top_k=2)
+
+    assert len(hits) == 2
+    assert all(hit["team"] == team for hit in hits)
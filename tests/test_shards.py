@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.rag.shards import (
+    UNDATED_SHARD,
+    bucket_bounds,
+    bucket_for,
+    is_expired,
+    overlaps,
+    parse_timestamp,
+    shard_by_from_env,
+    within,
+)
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_buckets_are_utc_days_or_months():
+    assert bucket_for("2026-01-31T23:30:00-02:00", "day") == "2026-02-01"
+    assert bucket_for("2026-01-31T08:05:00Z", "month") == "2026-01"
+    assert bucket_for("not a date", "day") == UNDATED_SHARD
+    assert parse_timestamp("2026-01-31T08:05:00") == _utc(2026, 1, 31, 8, 5)
+
+
+def test_month_bounds_roll_over_the_year():
+    assert bucket_bounds("2025-12", "month") == (_utc(2025, 12, 1), _utc(2026, 1, 1))
+    assert bucket_bounds(UNDATED_SHARD, "day") is None
+
+
+def test_retention_expires_only_fully_elapsed_shards():
+    now = _utc(2026, 3, 10)
+    assert is_expired(bucket_bounds("2026-03-02", "day"), 7, now)
+    assert not is_expired(bucket_bounds("2026-03-03", "day"), 7, now)
+    assert not is_expired(None, 7, now)
+    assert not is_expired(bucket_bounds("2020-01-01", "day"), None, now)
+
+
+def test_time_range_pruning():
+    bounds = bucket_bounds("2026-02", "month")
+    assert overlaps(bounds, _utc(2026, 2, 28), None)
+    assert not overlaps(bounds, _utc(2026, 3, 1), None)
+    assert within(bounds, _utc(2026, 1, 1), _utc(2026, 3, 1))
+    assert not within(bounds, _utc(2026, 2, 2), None)
+    assert not within(None, _utc(2026, 2, 2), None)
+
+
+def test_unknown_shard_by_is_rejected(monkeypatch):
+    monkeypatch.setenv("INDEX_SHARD_BY", "week")
+    with pytest.raises(ValueError):
+        shard_by_from_env()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from app.stages import StageGraph
+
+
+def test_independent_stages_overlap_and_results_flow_to_dependents():
+    both_started = threading.Barrier(2, timeout=5)
+
+    def branch(value):
+        both_started.wait()
+        return value
+
+    graph = StageGraph("test")
+    graph.add("root", lambda: 2)
+    graph.add("left", lambda root: branch(root * 10), ["root"])
+    graph.add("right", lambda root: branch(root + 1), ["root"])
+    graph.add("sum", lambda left, right: left + right, ["left", "right"])
+
+    results, trace = graph.run()
+
+    assert results["sum"] == 23
+    assert [stage.name for stage in trace.stages][0] == "root"
+    assert trace.critical_path[0] == "root" and trace.critical_path[-1] == "sum"
+
+
+def test_critical_path_follows_the_slowest_dependency():
+    graph = StageGraph("test")
+    graph.add("fast", lambda: None)
+    graph.add("slow", lambda: time.sleep(0.05))
+    graph.add("join", lambda fast, slow: None, ["fast", "slow"])
+
+    _, trace = graph.run()
+
+    assert trace.critical_path == ["slow", "join"]
+
+
+def test_unknown_dependency_and_stage_errors_are_raised():
+    with pytest.raises(ValueError):
+        StageGraph().add("card", lambda signals: signals, ["signals"])
+
+    graph = StageGraph("test")
+    graph.add("boom", lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
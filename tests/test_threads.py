@@ -0,0 +1,55 @@
+import time
+
+from app import pipeline, threads
+from app.agents.guardrails_verifier import merge_guardrails
+from app.schemas import GuardrailResult
+from app.threads import THREAD_TIER, ThreadStore, merge_signals, new_state
+
+from .conftest import FakeContext, make_card, make_event
+
+
+def _signals(**update):
+    return make_card().signals.model_copy(update=update)
+
+
+def test_merged_signals_only_escalate():
+    previous = _signals(urgency="high", summary="Duplicate charge")
+    calmer = _signals(intent="question", urgency="low", sentiment="neutral", summary="Any news?")
+    merged = merge_signals(previous, calmer)
+    assert (merged.intent, merged.urgency, merged.sentiment, merged.summary) == ("complaint", "high", "neutral", "Duplicate charge")
+    assert len(merged.evidence) == 2
+
+    threat = merge_signals(previous, _signals(intent="legal_threat", summary="Lawyer involved"))
+    assert (threat.intent, threat.summary) == ("legal_threat", "Lawyer involved")
+
+
+def test_earlier_guardrail_issues_still_block():
+    blocked = GuardrailResult(passed=False, issues=["unsupported claim"])
+    merged = merge_guardrails(blocked, GuardrailResult(passed=True, issues=[]))
+    assert not merged.passed and merged.issues == ["unsupported claim"]
+
+
+def test_store_expires_idle_threads(tmp_path):
+    store = ThreadStore(tmp_path / "threads.sqlite", ttl_seconds=60)
+    state = new_state(make_card(), [], [])
+    store.put(state)
+    assert ThreadStore(tmp_path / "threads.sqlite").get(state.thread_id) == state
+    store.put(state.model_copy(update={"updated_at": time.time() - 120}))
+    assert store.get(state.thread_id) is None
+
+
+def test_follow_up_updates_the_thread_without_new_retrieval(fake_llm, monkeypatch, tmp_path):
+    monkeypatch.setenv("THREAD_STATE", "true")
+    monkeypatch.setenv("THREAD_STORE_PATH", str(tmp_path / "threads.sqlite"))
+    monkeypatch.setattr(threads, "_THREAD_STORE", None)
+
+    first = pipeline.process_incident(make_event(1, thread_id="th_a"), FakeContext())
+    calls = len(fake_llm.calls)
+    follow_up = pipeline.process_incident(make_event(2, "Still waiting on this.", thread_id="th_a"))
+
+    assert follow_up.tier == THREAD_TIER
+    assert follow_up.incident.event_id == "e2"
+    assert follow_up.related_event_ids == ["e1"]
+    assert fake_llm.calls[calls:] == ["SignalExtraction"]
+    assert len(follow_up.signals.evidence) == len(first.signals.evidence) + 1
+    assert threads.thread_store().get("th_a").event_ids == ["e1", "e2"]